@@ -2,18 +2,19 @@ from datetime import datetime
 
 from src import create_app
 
-""" Timer Start """
-before = datetime.now()
-""" Timer Start """
+# The app is only created when the script is started. The partition readers of a parallel sync
+# run in spawned processes, which import this module again and must not boot a second app.
+if __name__ == '__main__':
+    """ Timer Start """
+    before = datetime.now()
+    """ Timer Start """
 
-app, db = create_app()
+    app, db = create_app()
 
-""" Timer End """
-after = datetime.now()
-time = after - before
-print(f"The script took {time}")
-""" Timer End """
+    """ Timer End """
+    after = datetime.now()
+    time = after - before
+    print(f"The script took {time}")
+    """ Timer End """
 
-if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002, debug=True, use_reloader=True)
-
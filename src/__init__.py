@@ -87,6 +87,9 @@ def create_app():
     from .modules.Bridge.entities.BridgeOrderEntity import BridgeOrderEntity
     from .modules.Bridge.entities.BridgeOrderDetailsEntity import BridgeOrderDetailsEntity
     from .modules.Bridge.entities.BridgeRuleEntity import BridgeRuleEntity
+    from .modules.Bridge.entities.BridgeSyncStateEntity import BridgeSyncStateEntity
+    from .modules.Bridge.entities.BridgeMediaMetaEntity import BridgeMediaMetaEntity
+    from .modules.Bridge.entities.BridgeAddressIndexEntity import BridgeAddressIndexEntity
 
     # Controller
     from .modules.Bridge.controller.BridgeProductController import BridgeProductController
@@ -165,6 +168,10 @@ def create_app():
     # Tests
     # from .modules.Test.AbstractController import speak
 
+    # The ERP worker owns the COM connection, views and syncs send their ERP requests to it
+    from .modules.ERP.controller.ERPWorkerController import ERPWorkerController
+    ERPWorkerController().start(app)
+
     # DB create_all to ensure all db tables are there
     with app.app_context():
         # db.drop_all()
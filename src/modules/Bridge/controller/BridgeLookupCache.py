@@ -0,0 +1,154 @@
+"""
+Sync-scoped lookup maps for the keyed bridge tables. Instead of one query per row
+(is_in_db, tax, categories, media, marketplaces) the key column and the id of a table
+are loaded once per sync run, inserted rows are added as they are created.
+
+Added keys are journaled. If a savepoint or a batch is rolled back, rollback_to removes only the
+keys added since its checkpoint, the rest of the maps stays loaded. The existing entities of a batch
+are loaded with one query by prefetch and held until the batch is committed (release).
+
+Examples:
+    lookup_cache = BridgeLookupCache(db=db)
+    tax = lookup_cache.get_entity(BridgeTaxEntity, 'erp_nr', 1)
+    marketplaces = lookup_cache.get_all(BridgeMarketplaceEntity)
+
+    new_media = BridgeMediaEntity(file_name="204116.jpg")
+    lookup_cache.add(new_media, 'file_name')
+
+    lookup_cache.prefetch(BridgeProductEntity, 'erp_nr', ["204116", "204117"])
+    marker = lookup_cache.checkpoint()
+    ...
+    lookup_cache.rollback_to(marker)  # or lookup_cache.release() after the commit
+"""
+import logging
+
+
+class BridgeLookupCache:
+    def __init__(self, db):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.db = db
+        # (entity class, key field) -> {key: id or entity}
+        self._maps = {}
+        # entity class -> list of all entities
+        self._lists = {}
+        # (map key, key, previous value) of every add since the last release
+        self._journal = []
+        # (entity class, id) -> entity, loaded by prefetch, held until the batch is committed
+        self._entities = {}
+        self._stats = {"loads": 0, "hits": 0, "misses": 0, "prefetched": 0, "rolled_back": 0}
+
+    def _get_map(self, entity_class, key_field):
+        map_key = (entity_class, key_field)
+        lookup_map = self._maps.get(map_key)
+        if lookup_map is None:
+            rows = self.db.session.query(getattr(entity_class, key_field), entity_class.id).all()
+            lookup_map = {key: id_ for key, id_ in rows}
+            self._maps[map_key] = lookup_map
+            self._stats["loads"] += 1
+            self.logger.info(f"Loaded {len(lookup_map)} {entity_class.__name__} by {key_field}.")
+        return lookup_map
+
+    def get_entity(self, entity_class, key_field, key):
+        """
+        Look up an entity by a unique key column.
+
+        :param entity_class: The bridge entity class, e.g. BridgeProductEntity.
+        :param key_field: The unique column, e.g. 'erp_nr'.
+        :param key: The value to look for.
+        :return: The entity or None. Loaded rows come from the identity map of the session or by primary key.
+        """
+        value = self._get_map(entity_class, key_field).get(key)
+        if value is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["hits"] += 1
+        # Entities added in this run are stored as object, they may not be flushed yet
+        if isinstance(value, entity_class):
+            return value
+        entity = self._entities.get((entity_class, value))
+        if entity is not None:
+            return entity
+        return entity_class.query.get(value)
+
+    def prefetch(self, entity_class, key_field, keys):
+        """
+        Load the existing entities of the keys with one query, e.g. for the rows of a batch,
+        instead of one query.get per row.
+
+        :param entity_class: The bridge entity class, e.g. BridgeProductEntity.
+        :param key_field: The unique column, e.g. 'erp_nr'.
+        :param keys: The values of the batch.
+        """
+        lookup_map = self._get_map(entity_class, key_field)
+        ids = {lookup_map.get(key) for key in keys}
+        ids = [id_ for id_ in ids if id_ is not None and not isinstance(id_, entity_class)
+               and (entity_class, id_) not in self._entities]
+        if not ids:
+            return
+        for entity in entity_class.query.filter(entity_class.id.in_(ids)).all():
+            self._entities[(entity_class, entity.id)] = entity
+        self._stats["prefetched"] += len(ids)
+
+    def add(self, entity, key_field):
+        """
+        Add an inserted entity, so the following rows of the run find it without a query,
+        even before it is flushed.
+        """
+        map_key = (type(entity), key_field)
+        lookup_map = self._get_map(*map_key)
+        key = getattr(entity, key_field)
+        self._journal.append((map_key, key, lookup_map.get(key)))
+        lookup_map[key] = entity
+
+    """ Transactions """
+    def checkpoint(self):
+        """
+        :return: Marker for rollback_to, take it before a savepoint or a batch is started.
+        """
+        return len(self._journal)
+
+    def rollback_to(self, marker):
+        """
+        Remove the keys added since the marker, their inserts were rolled back.
+        """
+        while len(self._journal) > marker:
+            map_key, key, previous = self._journal.pop()
+            lookup_map = self._maps.get(map_key)
+            if lookup_map is None:
+                continue
+            if previous is None:
+                lookup_map.pop(key, None)
+            else:
+                lookup_map[key] = previous
+            self._stats["rolled_back"] += 1
+
+    def release(self):
+        """
+        The batch is committed, its added keys are final and the prefetched entities are not needed anymore.
+        """
+        self._journal = []
+        self._entities = {}
+
+    def get_all(self, entity_class):
+        """
+        :return: List of all entities of the class, loaded once per run.
+        """
+        entities = self._lists.get(entity_class)
+        if entities is None:
+            entities = entity_class.query.all()
+            self._lists[entity_class] = entities
+            self._stats["loads"] += 1
+        return entities
+
+    def invalidate(self):
+        """
+        Drop all maps. After a rollback use rollback_to, it keeps the maps loaded.
+        """
+        self._maps = {}
+        self._lists = {}
+        self._journal = []
+        self._entities = {}
+
+    def get_stats(self):
+        return dict(self._stats)
@@ -0,0 +1,218 @@
+"""
+Size and etag of the image files, so mapping the media of an article doesn't send a blocking
+HEAD request per image and sync.
+
+- If GCBridgeConfig.ASSETS_LOCAL_PATH is set, the images are on this machine and the size is read by os.stat.
+- Otherwise the metadata is kept in bridge_media_meta_entity. Entries older than
+  GCBridgeConfig.MEDIA_META_MAX_AGE_HOURS are checked again with If-None-Match.
+- Misses are fetched with concurrent HEAD requests (GCBridgeConfig.MEDIA_HEAD_WORKERS)
+  over one pooled requests session.
+
+New or changed rows are added to the session of the sync, they are committed with its batch.
+Call release after the commit and rollback after a rollback, so the metadata of rolled back
+rows is stored again instead of being kept only in memory.
+
+Examples:
+    media_meta_cache = BridgeMediaMetaCache()
+    media_meta_cache.prefetch(["204116.jpg", "204116_2.jpg"])
+    file_size = media_meta_cache.get_file_size("204116.jpg")
+"""
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import GCBridgeConfig
+from src import db
+from ..entities.BridgeMediaMetaEntity import BridgeMediaMetaEntity
+
+
+class BridgeMediaMetaCache:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(BridgeMediaMetaCache, cls).__new__(cls)
+            cls._instance.logger = logging.getLogger(cls.__name__)
+            cls._instance._local_path = getattr(GCBridgeConfig, "ASSETS_LOCAL_PATH", None)
+            cls._instance._max_age = datetime.timedelta(hours=getattr(GCBridgeConfig, "MEDIA_META_MAX_AGE_HOURS", 24))
+            cls._instance._workers = getattr(GCBridgeConfig, "MEDIA_HEAD_WORKERS", 8)
+            cls._instance._http_session = None
+            cls._instance._lock = threading.Lock()
+            # file -> {'file_size', 'etag', 'checked_at'}, loaded from the bridge once
+            cls._instance._meta = None
+            # file -> BridgeMediaMetaEntity added or changed since the last commit
+            cls._instance._unsaved = {}
+            cls._instance._stats_lock = threading.Lock()
+            cls._instance._stats = {"hits": 0, "stats": 0, "heads": 0, "not_modified": 0, "errors": 0}
+        return cls._instance
+
+    def get_file_size(self, file):
+        """
+        :param file: File name with extension, e.g. 204116.jpg
+        :return: Size in bytes or None if it can't be determined.
+        """
+        if self._local_path:
+            return self._stat_file_size(file)
+
+        meta = self._get_meta().get(file)
+        if meta is None or self._is_stale(meta):
+            self.prefetch([file])
+            meta = self._get_meta().get(file)
+        else:
+            self._count("hits")
+
+        return meta['file_size'] if meta else None
+
+    def prefetch(self, files):
+        """
+        Fetch the metadata of all missing or stale files concurrently and store it.
+
+        :param files: List of file names with extension.
+        """
+        if self._local_path or not files:
+            return
+
+        meta = self._get_meta()
+        pending = [file for file in dict.fromkeys(files) if meta.get(file) is None or self._is_stale(meta[file])]
+        if not pending:
+            return
+
+        if len(pending) == 1:
+            results = [self._head(pending[0], meta.get(pending[0]))]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self._workers, len(pending))) as executor:
+                results = list(executor.map(lambda file: self._head(file, meta.get(file)), pending))
+
+        self._store({file: result for file, result in zip(pending, results) if result is not None})
+
+    def invalidate(self):
+        """
+        Drop the loaded metadata, it is loaded from the bridge again on the next lookup.
+        """
+        self._meta = None
+        self._unsaved = {}
+
+    """ Transactions """
+    def release(self):
+        """
+        The session is committed, the stored rows are in the bridge.
+        """
+        self._unsaved = {}
+
+    def rollback(self):
+        """
+        The session or a savepoint of it is rolled back. Rows inserted in it are gone, their metadata is
+        dropped and fetched again on the next lookup. Rows still in the session get their values again,
+        their changes may have been rolled back.
+        """
+        for file, media_meta in list(self._unsaved.items()):
+            meta = self._meta.get(file) if self._meta is not None else None
+            if meta is None or media_meta not in db.session:
+                self._unsaved.pop(file)
+                if self._meta is not None:
+                    self._meta.pop(file, None)
+                continue
+            media_meta.file_size = meta['file_size']
+            media_meta.etag = meta['etag']
+            media_meta.checked_at = meta['checked_at']
+
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, name):
+        # _head runs in the threads of prefetch
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _get_meta(self):
+        if self._meta is None:
+            rows = db.session.query(BridgeMediaMetaEntity.file,
+                                    BridgeMediaMetaEntity.file_size,
+                                    BridgeMediaMetaEntity.etag,
+                                    BridgeMediaMetaEntity.checked_at).all()
+            self._meta = {file: {'file_size': file_size, 'etag': etag, 'checked_at': checked_at}
+                          for file, file_size, etag, checked_at in rows}
+            self.logger.info(f"Loaded metadata of {len(self._meta)} media files.")
+        return self._meta
+
+    def _is_stale(self, meta):
+        return meta['checked_at'] is None or datetime.datetime.now() - meta['checked_at'] > self._max_age
+
+    def _get_http_session(self):
+        with self._lock:
+            if self._http_session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._workers)
+                self._http_session = requests.Session()
+                self._http_session.mount("http://", adapter)
+                self._http_session.mount("https://", adapter)
+            return self._http_session
+
+    def _head(self, file, meta=None):
+        """
+        Runs in the threads of prefetch, so it doesn't touch the database.
+
+        :return: dict with 'file_size' and 'etag' or None on errors.
+        """
+        path = GCBridgeConfig.ASSETS_PATH + GCBridgeConfig.IMG_PATH
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+
+        try:
+            response = self._get_http_session().head(f"{path}/{file}", headers=headers, timeout=10)
+            if response.status_code == 304 and meta:
+                self._count("not_modified")
+                return {'file_size': meta['file_size'], 'etag': meta['etag']}
+            response.raise_for_status()
+            self._count("heads")
+            return {'file_size': int(response.headers.get('Content-Length', 0)), 'etag': response.headers.get('ETag')}
+        except requests.RequestException as e:
+            self._count("errors")
+            self.logger.error(f"An error occurred while calculating the file size of {file} from the web: {str(e)}")
+            return None
+
+    def _store(self, results):
+        """
+        Store the metadata of the fetched files, the existing rows are loaded with one query.
+
+        :param results: dict file -> {'file_size', 'etag'}
+        """
+        if not results:
+            return
+        checked_at = datetime.datetime.now()
+        # Rows of another session, e.g. of a request whose app context is gone, are dropped.
+        # Updates of them would never reach the bridge, the rows are loaded again below.
+        self._unsaved = {file: media_meta for file, media_meta in self._unsaved.items() if media_meta in db.session}
+        # Rows added since the last commit are not flushed yet, the query would not find them
+        media_metas = {file: self._unsaved[file] for file in results if file in self._unsaved}
+        missing = [file for file in results if file not in media_metas]
+        if missing:
+            media_metas.update({media_meta.file: media_meta for media_meta in
+                                BridgeMediaMetaEntity.query.filter(BridgeMediaMetaEntity.file.in_(missing)).all()})
+
+        for file, result in results.items():
+            self._meta[file] = {'file_size': result['file_size'], 'etag': result['etag'], 'checked_at': checked_at}
+            media_meta = media_metas.get(file)
+            if media_meta is None:
+                media_meta = BridgeMediaMetaEntity(file=file)
+                db.session.add(media_meta)
+            media_meta.file_size = result['file_size']
+            media_meta.etag = result['etag']
+            media_meta.checked_at = checked_at
+            self._unsaved[file] = media_meta
+
+    def _stat_file_size(self, file):
+        try:
+            file_size = os.stat(os.path.join(self._local_path, file)).st_size
+            self._count("stats")
+            return file_size
+        except OSError as e:
+            self._count("errors")
+            self.logger.error(f"An error occurred while reading the file size of {file}: {str(e)}")
+            return None
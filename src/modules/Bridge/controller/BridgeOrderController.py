@@ -1,6 +1,8 @@
 from datetime import datetime
 from pprint import pprint
 
+from sqlalchemy import or_
+
 from .BridgeAbstractController import BridgeAbstractController
 from ..entities.BridgeOrderEntity import BridgeOrderEntity
 
@@ -46,6 +48,20 @@ class BridgeOrderController(BridgeAbstractController):
 
         return query.all(), start_date, end_date, all_orders
 
+    def get_orders_without_erp_order(self, order_ids=None):
+        """
+        Open orders which have no Vorgang in the ERP yet.
+
+        :param order_ids: Optional list of bridge order IDs to restrict the orders to.
+        :return: List of BridgeOrderEntity, oldest first.
+        """
+        query = BridgeOrderEntity.query.filter(BridgeOrderEntity.order_state == "open",
+                                               or_(BridgeOrderEntity.erp_order_id.is_(None),
+                                                   BridgeOrderEntity.erp_order_id == ""))
+        if order_ids:
+            query = query.filter(BridgeOrderEntity.id.in_(order_ids))
+        return query.order_by(BridgeOrderEntity.purchase_date).all()
+
     def delete_all_orders(self):
         self.get_entity().query.delete()
         self._commit_and_close()
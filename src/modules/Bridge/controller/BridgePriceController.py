@@ -1,11 +1,25 @@
 import uuid
 
+from sqlalchemy import update, case
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from .BridgeAbstractController import BridgeAbstractController
 from ..entities.BridgePriceEntity import BridgePriceEntity
 from ..entities.BridgeMarketplaceEntity import (BridgeMarketplaceEntity,
                                                 BridgeProductMarketplacePriceAssoc)
+from ..entities.BridgeProductEntity import BridgeProductEntity
+from ..entities.BridgeCategoryEntity import BridgeCategoryEntity, BridgeProductsCategoriesAssoc
 import math
 
+# Prices which are multiplied with the factor of the marketplace
+PRICE_FIELDS_BY_FACTOR = ("price", "rebate_price", "special_price")
+# Values which are the same on all marketplaces
+PRICE_FIELDS_UNCHANGED = ("rebate_quantity", "special_start_date", "special_end_date")
+
 
 class BridgePriceController(BridgeAbstractController):
     def __init__(self):
@@ -13,29 +27,177 @@ class BridgePriceController(BridgeAbstractController):
         super().__init__(bridge_entity=self._bridge_entity)
 
     def set_price_with_percentage(self, price_id, percentage, special_start_date, special_end_date):
-        bridge_price_entity = BridgePriceEntity.query.get(price_id)
-        if bridge_price_entity:
-            bridge_price_entity.set_special_price(percentage=percentage)
-            bridge_price_entity.set_special_start_date(special_start_date)
-            bridge_price_entity.set_special_end_date(special_end_date)
-            self.db.session.add(bridge_price_entity)
-            self.db.session.commit()
-        return bridge_price_entity
+        self.set_special_prices_with_percentage([price_id], percentage, special_start_date, special_end_date)
+        return BridgePriceEntity.query.get(price_id)
 
     def apply_marketplace_price_change(self, product_id, percentage, special_start_date, special_end_date):
         assocs_product_marketplace_price = BridgeProductMarketplacePriceAssoc.query.filter_by(
             product_id=product_id).all()
-        for assoc in assocs_product_marketplace_price:
-            bridge_price_entity = BridgePriceEntity.query.get(assoc.price_id)
-            if bridge_price_entity:
-                bridge_price_entity.set_special_price(percentage=percentage)
-                bridge_price_entity.set_special_start_date(special_start_date)
-                bridge_price_entity.set_special_end_date(special_end_date)
-                self.db.session.add(bridge_price_entity)
-                self.db.session.commit()
+        self.set_special_prices_with_percentage([assoc.price_id for assoc in assocs_product_marketplace_price],
+                                                percentage, special_start_date, special_end_date)
         return assocs_product_marketplace_price
 
-    def upsert_price_for_all_marketplaces(self, bridge_price_entity, bridge_product_entity):
+    def set_special_prices_with_percentage(self, price_ids, percentage, special_start_date, special_end_date):
+        """
+        Set the special price of many prices as a percentage off their price, e.g. all marketplaces of a product.
+        The special prices are calculated in one pass with calculate_prices_by_factor and written
+        with one bulk update.
+
+        Args:
+            price_ids (list): IDs of the BridgePriceEntity rows.
+            percentage (float): The discount in percent, the special price is price - price * percentage / 100.
+            special_start_date (datetime): Start of the special price.
+            special_end_date (datetime): End of the special price.
+
+        Returns:
+            int: Number of updated prices.
+        """
+        rows = self.db.session.query(BridgePriceEntity.id, BridgePriceEntity.price).filter(
+            BridgePriceEntity.id.in_(price_ids)).all()
+        if not rows:
+            return 0
+
+        special_prices = self.calculate_prices_by_factor([price for _, price in rows], 1 - percentage / 100.0)
+        updates = [{'id': price_id,
+                    'special_price': special_price,
+                    'special_start_date': special_start_date,
+                    'special_end_date': special_end_date}
+                   for (price_id, _), special_price in zip(rows, special_prices)]
+        try:
+            self.db.session.bulk_update_mappings(BridgePriceEntity, updates)
+            self.db.session.commit()
+        except Exception as e:
+            self.logger.error(f"Error setting the special price of {len(updates)} prices: {str(e)}")
+            self.db.session.rollback()
+            raise
+        return len(updates)
+
+    """ Special price campaigns """
+    def select_campaign_product_ids(self, product_ids=None, erp_nrs=None, erp_nr_range=None, category_id=None,
+                                    include_subcategories=True):
+        """
+        Select the products of a campaign. All given selections must match.
+
+        Args:
+            product_ids (list, optional): Bridge product IDs.
+            erp_nrs (list, optional): ERP article numbers.
+            erp_nr_range (tuple, optional): First and last ERP article number, e.g. ("090000", "099999").
+            category_id (int, optional): Bridge category ID.
+            include_subcategories (bool): Include the products of all subcategories of category_id.
+
+        Returns:
+            list: The bridge product IDs.
+
+        Raises:
+            ValueError: If no selection is given.
+        """
+        if product_ids is None and erp_nrs is None and erp_nr_range is None and category_id is None:
+            raise ValueError("Select the products by product_ids, erp_nrs, erp_nr_range or category_id.")
+
+        query = self.db.session.query(BridgeProductEntity.id)
+        if product_ids is not None:
+            query = query.filter(BridgeProductEntity.id.in_(product_ids))
+        if erp_nrs is not None:
+            query = query.filter(BridgeProductEntity.erp_nr.in_([str(erp_nr) for erp_nr in erp_nrs]))
+        if erp_nr_range is not None:
+            query = query.filter(BridgeProductEntity.erp_nr.between(str(erp_nr_range[0]), str(erp_nr_range[1])))
+        if category_id is not None:
+            category_ids = self._get_category_ids(category_id) if include_subcategories else [category_id]
+            query = query.join(BridgeProductsCategoriesAssoc,
+                               BridgeProductsCategoriesAssoc.product_id == BridgeProductEntity.id
+                               ).filter(BridgeProductsCategoriesAssoc.category_id.in_(category_ids)).distinct()
+        return [product_id for product_id, in query.all()]
+
+    def _get_category_ids(self, category_id):
+        """
+        The category and all its subcategories, from one query over the category tree.
+        """
+        children = {}
+        for child_id, parent_id in self.db.session.query(BridgeCategoryEntity.id,
+                                                         BridgeCategoryEntity.parent_category_id).all():
+            children.setdefault(parent_id, []).append(child_id)
+
+        category_ids = []
+        pending = [category_id]
+        while pending:
+            current_id = pending.pop()
+            if current_id in category_ids:
+                continue
+            category_ids.append(current_id)
+            pending.extend(children.get(current_id, []))
+        return category_ids
+
+    def apply_special_price_campaign(self, product_ids, percentage, special_start_date, special_end_date,
+                                     marketplaces=None, chunk_size=1000):
+        """
+        Set a special price as a percentage off the price and its date window for many products at once.
+        The special prices are calculated with the pricing engine (calculate_prices_by_factor) and written with
+        one UPDATE per marketplace (and chunk_size prices), the whole campaign is committed once.
+
+        Args:
+            product_ids (list): Bridge product IDs, e.g. from select_campaign_product_ids.
+            percentage (float): The discount in percent, see set_special_prices_with_percentage.
+            special_start_date (datetime): Start of the special price.
+            special_end_date (datetime): End of the special price.
+            marketplaces (list, optional): Only these marketplaces. Defaults to all.
+            chunk_size (int): Prices per UPDATE statement.
+
+        Returns:
+            dict: Report with 'products' (IDs of the products with updated prices), 'prices' (number of
+                  updated prices) and 'marketplaces' (marketplace ID -> number of updated prices).
+        """
+        report = {'products': [], 'prices': 0, 'marketplaces': {}}
+        if not product_ids:
+            return report
+
+        query = self.db.session.query(
+            BridgeProductMarketplacePriceAssoc.marketplace_id,
+            BridgeProductMarketplacePriceAssoc.product_id,
+            BridgePriceEntity.id,
+            BridgePriceEntity.price
+        ).join(BridgePriceEntity, BridgePriceEntity.id == BridgeProductMarketplacePriceAssoc.price_id
+               ).filter(BridgeProductMarketplacePriceAssoc.product_id.in_(product_ids))
+        if marketplaces is not None:
+            query = query.filter(BridgeProductMarketplacePriceAssoc.marketplace_id.in_(
+                [marketplace.id for marketplace in marketplaces]))
+
+        # marketplace_id -> [(product_id, price_id, price)]
+        prices_by_marketplace = {}
+        for marketplace_id, product_id, price_id, price in query.all():
+            prices_by_marketplace.setdefault(marketplace_id, []).append((product_id, price_id, price))
+
+        factor = 1 - percentage / 100.0
+        updated_products = set()
+        try:
+            for marketplace_id, rows in prices_by_marketplace.items():
+                special_prices = self.calculate_prices_by_factor([price for _, _, price in rows], factor)
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    self.db.session.execute(
+                        update(BridgePriceEntity)
+                        .where(BridgePriceEntity.id.in_([price_id for _, price_id, _ in chunk]))
+                        .values(special_price=case({price_id: special_price for (_, price_id, _), special_price
+                                                    in zip(chunk, special_prices[start:start + chunk_size])},
+                                                   value=BridgePriceEntity.id),
+                                special_start_date=special_start_date,
+                                special_end_date=special_end_date)
+                        .execution_options(synchronize_session=False)
+                    )
+                report['marketplaces'][marketplace_id] = len(rows)
+                report['prices'] += len(rows)
+                updated_products.update(product_id for product_id, _, _ in rows)
+            self.db.session.commit()
+        except Exception as e:
+            self.logger.error(f"Error applying the special price campaign to {len(product_ids)} products: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+        report['products'] = sorted(updated_products)
+        self.logger.info(f"Special price campaign of {percentage} %: {report['prices']} prices "
+                         f"of {len(report['products'])} products updated.")
+        return report
+
+    def upsert_price_for_all_marketplaces(self, bridge_price_entity, bridge_product_entity, marketplaces=None):
         """
         Upserts prices for all marketplaces linked to the given product. The method updates the existing price entity
         or inserts a new one, based on the marketplace factor.
@@ -43,12 +205,18 @@ class BridgePriceController(BridgeAbstractController):
         Args:
             bridge_price_entity (BridgePriceEntity): The price entity to be upserted.
             bridge_product_entity (BridgeProductEntity): The product entity for which prices are being set.
+            marketplaces (list, optional): The marketplaces, e.g. preloaded once per sync. Defaults to all from the db.
         """
+        if marketplaces is None:
+            marketplaces = BridgeMarketplaceEntity.query.all()
+        # The prices of all marketplaces in one pass, field -> [[price per marketplace]]
+        calculated = self.calculate_marketplace_prices(
+            prices={field_name: [getattr(bridge_price_entity, field_name)] for field_name in PRICE_FIELDS_BY_FACTOR},
+            factors=[self.get_marketplace_factor(marketplace) for marketplace in marketplaces])
         try:
-            for marketplace in BridgeMarketplaceEntity.query.all():
+            for position, marketplace in enumerate(marketplaces):
                 # Logic for each marketplace will be implemented here
                 bridge_price_entity_new = BridgePriceEntity().update(bridge_price_entity)
-                factor = marketplace.factor if marketplace.factor is not None else 1.0
                 # Check if there is an existing association between the product and the marketplace
                 try:
                     existing_association = BridgeProductMarketplacePriceAssoc.query.filter_by(
@@ -62,9 +230,9 @@ class BridgePriceController(BridgeAbstractController):
 
                         if not existing_association.use_fixed_price:
                             # Calculate the price based on the marketplace factor
-                            existing_association.price.price = self.calculate_price_by_factor(bridge_price_entity.price,factor)
-                            existing_association.price.rebate_price = self.calculate_price_by_factor(bridge_price_entity.rebate_price, factor)
-                            existing_association.price.special_price = self.calculate_price_by_factor(bridge_price_entity.special_price, factor)
+                            existing_association.price.price = calculated['price'][0][position]
+                            existing_association.price.rebate_price = calculated['rebate_price'][0][position]
+                            existing_association.price.special_price = calculated['special_price'][0][position]
 
 
                             self.db.session.flush()
@@ -78,9 +246,9 @@ class BridgePriceController(BridgeAbstractController):
                             self.logger.info(f"Creating new association for product {bridge_product_entity.id} and marketplace {marketplace.id}")
 
                             # Determine the price based on the marketplace factor
-                            bridge_price_entity_new.price = self.calculate_price_by_factor(bridge_price_entity.price,factor)
-                            bridge_price_entity_new.rebate_price = self.calculate_price_by_factor(bridge_price_entity.rebate_price, factor)
-                            bridge_price_entity_new.special_price = self.calculate_price_by_factor(bridge_price_entity.special_price, factor)
+                            bridge_price_entity_new.price = calculated['price'][0][position]
+                            bridge_price_entity_new.rebate_price = calculated['rebate_price'][0][position]
+                            bridge_price_entity_new.special_price = calculated['special_price'][0][position]
 
                             # Create a new price entity
                             self.db.session.add(bridge_price_entity_new)
@@ -108,6 +276,194 @@ class BridgePriceController(BridgeAbstractController):
             self.logger.error(f"An error occurred: {e}")
             self.db.session.rollback()
 
+    """ Price delta sync """
+    def load_marketplace_prices(self):
+        """
+        Load the prices of all product/marketplace associations in one query.
+
+        Returns:
+            dict: erp_nr -> {marketplace_id: row}, row is a dict with product_id, sw6_id, price_id,
+                  use_fixed_price and the price values.
+        """
+        rows = self.db.session.query(
+            BridgeProductEntity.erp_nr,
+            BridgeProductEntity.sw6_id,
+            BridgeProductMarketplacePriceAssoc.product_id,
+            BridgeProductMarketplacePriceAssoc.marketplace_id,
+            BridgeProductMarketplacePriceAssoc.use_fixed_price,
+            BridgePriceEntity.id,
+            BridgePriceEntity.price,
+            BridgePriceEntity.rebate_quantity,
+            BridgePriceEntity.rebate_price,
+            BridgePriceEntity.special_price,
+            BridgePriceEntity.special_start_date,
+            BridgePriceEntity.special_end_date
+        ).join(BridgeProductMarketplacePriceAssoc,
+               BridgeProductMarketplacePriceAssoc.product_id == BridgeProductEntity.id
+        ).join(BridgePriceEntity,
+               BridgePriceEntity.id == BridgeProductMarketplacePriceAssoc.price_id).all()
+
+        marketplace_prices = {}
+        for (erp_nr, sw6_id, product_id, marketplace_id, use_fixed_price, price_id, price, rebate_quantity,
+             rebate_price, special_price, special_start_date, special_end_date) in rows:
+            marketplace_prices.setdefault(erp_nr, {})[marketplace_id] = {
+                'product_id': product_id,
+                'sw6_id': sw6_id,
+                'price_id': price_id,
+                'use_fixed_price': use_fixed_price,
+                'price': price,
+                'rebate_quantity': rebate_quantity,
+                'rebate_price': rebate_price,
+                'special_price': special_price,
+                'special_start_date': special_start_date,
+                'special_end_date': special_end_date
+            }
+        return marketplace_prices
+
+    def sync_price_delta(self, erp_prices, marketplaces=None):
+        """
+        Write only the changed prices of the given products, with the factor of each marketplace applied.
+        The prices of all products and marketplaces are calculated in one pass (calculate_marketplace_prices),
+        compared in memory against the bridge and written with one bulk update.
+
+        Products without a price association for a marketplace are left to the full article sync.
+
+        Args:
+            erp_prices (dict): erp_nr -> price values, see ERPArtikelEntity.map_erp_price_values.
+            marketplaces (list, optional): The marketplaces. Defaults to all from the db.
+
+        Returns:
+            dict: Report with 'checked', 'changed_prices', 'missing' (erp_nrs without association),
+                  'fixed' (skipped fixed prices) and 'changed_products' (dicts with 'product_id', 'erp_nr'
+                  and 'sw6_id' of the products which need a SW6 price update).
+        """
+        if marketplaces is None:
+            marketplaces = BridgeMarketplaceEntity.query.all()
+        marketplace_prices = self.load_marketplace_prices()
+
+        erp_nrs = list(erp_prices)
+        updates = []
+        changed_products = {}
+        missing = set()
+        fixed = 0
+        calculated = self.calculate_marketplace_prices(
+            prices={field_name: [erp_prices[erp_nr][field_name] for erp_nr in erp_nrs]
+                    for field_name in PRICE_FIELDS_BY_FACTOR},
+            factors=[self.get_marketplace_factor(marketplace) for marketplace in marketplaces])
+
+        for marketplace_position, marketplace in enumerate(marketplaces):
+            for position, erp_nr in enumerate(erp_nrs):
+                row = marketplace_prices.get(erp_nr, {}).get(marketplace.id)
+                if row is None:
+                    missing.add(erp_nr)
+                    continue
+                if row['use_fixed_price']:
+                    fixed += 1
+                    continue
+
+                target = {field_name: calculated[field_name][position][marketplace_position]
+                          for field_name in PRICE_FIELDS_BY_FACTOR}
+                for field_name in PRICE_FIELDS_UNCHANGED:
+                    target[field_name] = erp_prices[erp_nr][field_name]
+                if target['price'] is None:
+                    # The bridge needs a price, the full sync logs these products
+                    continue
+
+                if self._is_price_changed(row, target):
+                    updates.append(dict(target, id=row['price_id']))
+                    changed_products[row['product_id']] = {'product_id': row['product_id'],
+                                                           'erp_nr': erp_nr,
+                                                           'sw6_id': row['sw6_id']}
+
+        if updates:
+            try:
+                self.db.session.bulk_update_mappings(BridgePriceEntity, updates)
+                self.db.session.commit()
+            except Exception as e:
+                self.logger.error(f"Error writing {len(updates)} changed prices: {str(e)}")
+                self.db.session.rollback()
+                raise
+
+        report = {
+            'checked': len(erp_nrs),
+            'changed_prices': len(updates),
+            'missing': sorted(missing),
+            'fixed': fixed,
+            'changed_products': list(changed_products.values())
+        }
+        self.logger.info(f"Price delta: {len(updates)} prices of {len(changed_products)} products changed, "
+                         f"{len(missing)} products without price association.")
+        return report
+
+    @staticmethod
+    def _is_price_changed(row, target):
+        for field_name, value in target.items():
+            value_in_db = row[field_name]
+            if value is None or value_in_db is None:
+                if value is not value_in_db and value != value_in_db:
+                    return True
+            elif isinstance(value, float) or isinstance(value_in_db, float):
+                if abs(float(value) - float(value_in_db)) > 0.001:
+                    return True
+            elif value != value_in_db:
+                return True
+        return False
+
+    """ Price calculation """
+    @staticmethod
+    def get_marketplace_factor(marketplace):
+        return marketplace.factor if marketplace.factor is not None else 1.0
+
+    def calculate_marketplace_prices(self, prices, factors):
+        """
+        The pricing engine: calculates the prices of many products for many marketplaces at once.
+        Every price is multiplied with the factor of the marketplace and rounded up to the nearest 5 cents.
+        Empty prices (None or 0) stay None.
+
+        Uses one NumPy pass over all fields, products and marketplaces if numpy is installed,
+        otherwise the same calculation in plain Python.
+
+        Args:
+            prices (dict): field name -> list of prices per product, e.g. {'price': [...], 'special_price': [...]}.
+            factors (list): The factor of each marketplace.
+
+        Returns:
+            dict: field name -> list per product of the calculated prices per marketplace.
+
+        Example:
+            calculate_marketplace_prices({'price': [10.0, None]}, [1.0, 1.19])
+            -> {'price': [[10.0, 11.9], [None, None]]}
+        """
+        if numpy is None:
+            return {field_name: [[self._round_up_price(price * factor) if price else None for factor in factors]
+                                 for price in field_prices]
+                    for field_name, field_prices in prices.items()}
+
+        field_names = list(prices)
+        # fields x products, empty prices are NaN
+        base = numpy.array([[price if price else numpy.nan for price in prices[field_name]]
+                            for field_name in field_names], dtype="float64").reshape(len(field_names), -1)
+        # fields x products x marketplaces, rounded up like _round_up_price
+        calculated = numpy.ceil(base[:, :, None] * numpy.asarray(factors, dtype="float64")[None, None, :] * 20) / 20
+
+        values = calculated.astype(object)
+        values[numpy.isnan(calculated)] = None
+        return {field_name: values[position].tolist() for position, field_name in enumerate(field_names)}
+
+    def calculate_prices_by_factor(self, prices, factor):
+        """
+        Calculate the prices of many products for one factor, see calculate_marketplace_prices.
+
+        Args:
+            prices (list): The original prices, empty prices stay None.
+            factor (float): The factor of the marketplace.
+
+        Returns:
+            list: The calculated prices in the same order.
+        """
+        calculated = self.calculate_marketplace_prices(prices={'price': list(prices)}, factors=[factor])
+        return [marketplace_prices[0] for marketplace_prices in calculated['price']]
+
     def calculate_price_by_factor(self, price, factor):
         """
         Calculates the price by multiplying it with a given factor and then rounds it up to the nearest 5 cents.
@@ -119,16 +475,12 @@ class BridgePriceController(BridgeAbstractController):
         Returns:
             float: The calculated price, rounded up to the nearest 5 cents.
         """
-        if not price:
-            return None
-
-        # Multiply the price with the factor
-        calculated_price = price * factor
+        return self.calculate_prices_by_factor([price], factor)[0]
 
+    @staticmethod
+    def _round_up_price(price):
         # Round up to the nearest 5 cents
-        rounded_price = math.ceil(calculated_price * 20) / 20
-
-        return rounded_price
+        return math.ceil(price * 20) / 20
 
     """
     Special getter and setter
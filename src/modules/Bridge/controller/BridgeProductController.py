@@ -1,3 +1,5 @@
+from sqlalchemy import update, case
+
 from .BridgeAbstractController import BridgeAbstractController
 from ..entities.BridgeProductEntity import BridgeProductEntity
 
@@ -7,4 +9,58 @@ class BridgeProductController(BridgeAbstractController):
         self._bridge_entity = BridgeProductEntity()
         super().__init__(bridge_entity=self._bridge_entity)
 
+    def get_changed_stock(self, stock):
+        """
+        Compare the read stock with the bridge.
+
+        :param stock: dict erp_nr -> {'stock': int, 'storage_location': str or None}
+        :return: List of dicts with 'id', 'erp_nr', 'sw6_id', 'stock' and 'storage_location' of the changed products.
+        """
+        products = self.db.session.query(BridgeProductEntity.id,
+                                         BridgeProductEntity.erp_nr,
+                                         BridgeProductEntity.sw6_id,
+                                         BridgeProductEntity.stock,
+                                         BridgeProductEntity.storage_location).all()
+        changed = []
+        for id_, erp_nr, sw6_id, stock_in_db, storage_location_in_db in products:
+            entry = stock.get(erp_nr)
+            if entry is None:
+                continue
+            # The bridge doesn't allow negative stock, see BridgeProductEntity.set_stock
+            new_stock = max(int(entry['stock']), 0)
+            new_storage_location = entry['storage_location'] or storage_location_in_db
+            if new_stock != stock_in_db or new_storage_location != storage_location_in_db:
+                changed.append({'id': id_, 'erp_nr': erp_nr, 'sw6_id': sw6_id,
+                                'stock': new_stock, 'storage_location': new_storage_location})
+        self.logger.info(f"Stock of {len(changed)} of {len(products)} products changed.")
+        return changed
+
+    def bulk_update_stock(self, changed, chunk_size=1000):
+        """
+        Update stock and storage location of the changed products in one UPDATE per chunk.
+
+        :param changed: List of dicts with 'id', 'stock' and 'storage_location', see get_changed_stock.
+        :param chunk_size: Products per UPDATE statement.
+        :return: The changed products.
+        """
+        try:
+            for start in range(0, len(changed), chunk_size):
+                chunk = changed[start:start + chunk_size]
+                ids = [product['id'] for product in chunk]
+                self.db.session.execute(
+                    update(BridgeProductEntity)
+                    .where(BridgeProductEntity.id.in_(ids))
+                    .values(stock=case({product['id']: product['stock'] for product in chunk},
+                                       value=BridgeProductEntity.id),
+                            storage_location=case({product['id']: product['storage_location'] for product in chunk},
+                                                  value=BridgeProductEntity.id))
+                    .execution_options(synchronize_session=False)
+                )
+            self.db.session.commit()
+        except Exception as e:
+            self.logger.error(f"Error updating the stock of {len(changed)} products: {str(e)}")
+            self.db.session.rollback()
+            raise
 
+        self.logger.info(f"Stock of {len(changed)} products updated.")
+        return changed
@@ -0,0 +1,48 @@
+from src import db
+import datetime
+
+
+class BridgeAddressIndexEntity(db.Model):
+    """
+    Local index of the ERP Anschriften and Ansprechpartner with normalized match keys, so the customer
+    of an order can be matched without searching the ERP. See ERPAddressIndexController.
+    Anschriften have no asp_nr, Ansprechpartner have no street_key and postal_code.
+    """
+    __tablename__ = 'bridge_address_index_entity'
+    __table_args__ = (db.UniqueConstraint('dataset_name', 'erp_id', name='uq_address_index_dataset_erp_id'),)
+
+    id = db.Column(db.Integer(), primary_key=True, nullable=False, autoincrement=True)
+    dataset_name = db.Column(db.String(50), nullable=False)
+    erp_id = db.Column(db.Integer(), nullable=False)
+    adr_nr = db.Column(db.String(50), nullable=False, index=True)
+    ans_nr = db.Column(db.Integer(), nullable=True)
+    asp_nr = db.Column(db.Integer(), nullable=True)
+    name_key = db.Column(db.String(255), nullable=True)
+    street_key = db.Column(db.String(255), nullable=True)
+    postal_code = db.Column(db.String(20), nullable=True)
+    email = db.Column(db.String(255), nullable=True, index=True)
+    erp_changed_at = db.Column(db.DateTime(), nullable=True)
+    created_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now)
+    edited_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    def get_dataset_name(self):
+        return self.dataset_name
+
+    def get_erp_id(self):
+        return self.erp_id
+
+    def get_adr_nr(self):
+        return self.adr_nr
+
+    def get_ans_nr(self):
+        return self.ans_nr
+
+    def get_asp_nr(self):
+        return self.asp_nr
+
+    def get_email(self):
+        return self.email
+
+    def __repr__(self):
+        return (f'Bridge Address Index Entity: {self.dataset_name} {self.adr_nr}-{self.ans_nr}-{self.asp_nr} '
+                f'{self.name_key} {self.postal_code}')
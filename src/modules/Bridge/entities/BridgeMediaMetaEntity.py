@@ -0,0 +1,33 @@
+from src import db
+import datetime
+
+
+class BridgeMediaMetaEntity(db.Model):
+    """
+    Metadata of the image files on the assets server, so the sync doesn't ask the server
+    for the size of every image again. See BridgeMediaMetaCache.
+    """
+    __tablename__ = 'bridge_media_meta_entity'
+
+    id = db.Column(db.Integer(), primary_key=True, nullable=False, autoincrement=True)
+    file = db.Column(db.String(255), nullable=False, unique=True)
+    file_size = db.Column(db.Integer(), nullable=True)
+    etag = db.Column(db.String(255), nullable=True)
+    checked_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now)
+    created_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now)
+    edited_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    def get_file(self):
+        return self.file
+
+    def get_file_size(self):
+        return self.file_size
+
+    def get_etag(self):
+        return self.etag
+
+    def get_checked_at(self):
+        return self.checked_at
+
+    def __repr__(self):
+        return f'Bridge Media Meta Entity: {self.file} Size: {self.file_size} Checked: {self.checked_at}'
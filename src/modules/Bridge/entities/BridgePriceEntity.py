@@ -149,6 +149,18 @@ class BridgePriceEntity(db.Model):
 
         return active
 
+    def is_special_price_set(self):
+        """
+        Checks if a special price is set, which is active now or starts in the future, e.g. a planned campaign.
+
+        Returns:
+        bool: True if the special price is set and its end date isn't reached yet, False if it is empty or expired.
+        """
+        if not self.get_special_price() or not self.get_special_end_date():
+            return False
+
+        return datetime.datetime.now() <= self.get_special_end_date()
+
     def get_current_best_price(self, order_amount=None):
         """
         Returns the current best price for a given order amount.
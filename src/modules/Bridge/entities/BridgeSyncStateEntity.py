@@ -0,0 +1,65 @@
+from src import db
+import datetime
+
+
+class BridgeSyncStateEntity(db.Model):
+    """
+    High-water mark of the incremental syncs. One row per synced dataset (or dataset range),
+    holding the newest change date (LtzAend) which was synced completely.
+    """
+    __tablename__ = 'bridge_sync_state_entity'
+
+    id = db.Column(db.Integer(), primary_key=True, nullable=False, autoincrement=True)
+    sync_key = db.Column(db.String(255), nullable=False, unique=True)
+    high_water_mark = db.Column(db.DateTime(), nullable=True)
+    last_full_sync_at = db.Column(db.DateTime(), nullable=True)
+    last_run_at = db.Column(db.DateTime(), nullable=True)
+    last_mode = db.Column(db.String(50), nullable=True)
+    last_processed = db.Column(db.Integer(), nullable=True, default=0)
+    last_skipped = db.Column(db.Integer(), nullable=True, default=0)
+    last_errors = db.Column(db.Integer(), nullable=True, default=0)
+    created_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now)
+    edited_at = db.Column(db.DateTime(), nullable=True, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+    @classmethod
+    def get_or_create(cls, sync_key):
+        sync_state = cls.query.filter_by(sync_key=sync_key).one_or_none()
+        if sync_state is None:
+            sync_state = cls(sync_key=sync_key)
+            db.session.add(sync_state)
+        return sync_state
+
+    def get_high_water_mark(self):
+        return self.high_water_mark
+
+    def set_high_water_mark(self, high_water_mark):
+        self.high_water_mark = high_water_mark
+
+    def is_full_rescan_due(self, max_days):
+        """
+        :param max_days: Days after which a full rescan is done, even if a high-water mark exists. 0 or None disables it.
+        :return: True if there was no full sync yet or the last one is older than max_days.
+        """
+        if self.last_full_sync_at is None:
+            return True
+        if not max_days:
+            return False
+        return datetime.datetime.now() - self.last_full_sync_at > datetime.timedelta(days=max_days)
+
+    def set_report(self, report):
+        """
+        Store the report of a sync run.
+
+        :param report: dict with 'mode', 'processed', 'skipped' and 'errors'.
+        """
+        now = datetime.datetime.now()
+        self.last_run_at = now
+        self.last_mode = report.get('mode')
+        self.last_processed = report.get('processed', 0)
+        self.last_skipped = report.get('skipped', 0)
+        self.last_errors = report.get('errors', 0)
+        if report.get('mode') == 'full':
+            self.last_full_sync_at = now
+
+    def __repr__(self):
+        return f'Bridge Sync State Entity: {self.sync_key} High-water mark: {self.high_water_mark}'
@@ -5,6 +5,8 @@ from src import db
 from flask import Blueprint, jsonify, render_template, request, flash, redirect, url_for
 from sqlalchemy import or_
 
+from src.modules.ERP.controller.ERPWorkerController import ERPWorkerController
+
 
 BridgeDashboardViews = Blueprint('bridge_dashboard_views', __name__)
 
@@ -18,3 +20,12 @@ def bridge_show_dashboard():
 API
 """
 
+
+# State of a queued ERP request, e.g. of a view which answered with status queued
+@BridgeDashboardViews.route('/api/erp/requests/<request_id>', methods=['GET'])
+def api_erp_request_state(request_id):
+    request_state = ERPWorkerController().get_request_state(request_id)
+    if request_state is None:
+        return jsonify({'status': 'error', 'message': f'ERP Anfrage {request_id} ist nicht bekannt.'}), 404
+    return jsonify({'status': 'success', 'request': request_state,
+                    'queue_size': ERPWorkerController().get_queue_size()})
@@ -9,6 +9,7 @@ from src.modules.Bridge.controller.BridgeOrderController import BridgeOrderContr
 from src.modules.SW6.controller.SW6OrderController import SW6OrderController
 from src.modules.ERP.controller.ERPVorgangController import ERPVorgangController
 from src.modules.ERP.controller.ERPAdressenController import ERPAdressenController
+from src.modules.ERP.controller.ERPWorkerController import ERPWorkerController, ERPWorkerRequest, ERPWorkerBusy
 BridgeOrderViews = Blueprint('bridge_order_views', __name__)
 
 
@@ -52,12 +53,39 @@ def api_orders_erp_create_order(bridge_order_id):
     bridge_order = BridgeOrderController().get_entity().query.get(bridge_order_id)
     if bridge_order:
         # adresse_in_erp = ERPAdressenController().sync_order_addresses_from_bridge(bridge_entity=bridge_order.customer)
-        order_in_erp = ERPVorgangController().downsert(bridge_entity=bridge_order)
+        # The ERP worker owns the COM connection, the order is loaded again in the worker by its id
+        try:
+            report = ERPWorkerController().call(ERPWorkerRequest.CREATE_VORGANG, bridge_order_id=bridge_order.id)
+        except ERPWorkerBusy as busy:
+            # The ERP is busy, e.g. with a sync. The request stays queued and runs afterwards.
+            return jsonify({'status': 'queued', 'request_id': busy.request_id,
+                            'message': f'Das ERP ist beschäftigt, Bestellung {bridge_order_id} wird im Hintergrund '
+                                       f'angelegt.'}), 202
+        if report['errors']:
+            return jsonify({'status': 'error', 'message': f'Bestellung {bridge_order_id} konnte nicht in ERP angelegt '
+                                                          f'werden: {report["errors"][bridge_order.id]}'})
         return jsonify({'status': 'success', 'message': f'Bestellung {bridge_order_id} wurde in ERP angelegt.'})
     else:
         return jsonify({'status': 'error', 'message': f'No order found in bridge by ID:{bridge_order_id}'})
 
 
+# ERP create all open orders
+@BridgeOrderViews.route('/api/orders/erp/create_open_orders', methods=["POST"])
+def api_orders_erp_create_open_orders():
+    order_ids = (request.get_json(silent=True) or {}).get('order_ids')
+    try:
+        report = ERPWorkerController().call(ERPWorkerRequest.CREATE_OPEN_VORGAENGE, order_ids=order_ids)
+    except ERPWorkerBusy as busy:
+        return jsonify({'status': 'queued', 'request_id': busy.request_id,
+                        'message': 'Das ERP ist beschäftigt, die Bestellungen werden im Hintergrund angelegt.'}), 202
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'Die Bestellungen konnten nicht in ERP angelegt werden: {e}'}), 500
+    return jsonify({'status': 'error' if report['errors'] else 'success',
+                    'message': f'{len(report["created"])} Bestellungen in ERP angelegt, '
+                               f'{len(report["existing"])} bereits vorhanden, {len(report["errors"])} Fehler.',
+                    'report': report})
+
+
 # SW6 Get open orders
 @BridgeOrderViews.route('/api/orders/sw6/get_open_order_ids', endpoint='api_orders_sw6_get_open_order_ids')
 def api_orders_sw6_get_open_order_ids():
@@ -10,6 +10,7 @@ from src.modules.Bridge.entities.BridgeMarketplaceEntity import BridgeProductMar
 from src.modules.Bridge.controller.BridgePriceController import BridgePriceController
 from src.modules.SW6.controller.SW6ProductController import SW6ProductController
 from src.modules.ERP.controller.ERPArtikelController import ERPArtikelController
+from src.modules.ERP.controller.ERPWorkerController import ERPWorkerController, ERPWorkerRequest, ERPWorkerBusy
 from config import GCBridgeConfig, SW6Config
 from src import db
 
@@ -94,12 +95,15 @@ def special_price_submit():
     # Create the controller
     price_controller = BridgePriceController()
 
-    # Call the controller to update the price
-    price_controller.set_price_with_percentage(price_id, special_price, special_start_date, special_end_date)
-
     # If marketplace id is 1, perform the same operation on all marketplaces
     if marketplace_id == 1:
-        price_controller.apply_marketplace_price_change(product_id, special_price, special_start_date, special_end_date)
+        price_ids = [assoc.price_id for assoc in
+                     BridgeProductMarketplacePriceAssoc.query.filter_by(product_id=product_id).all()]
+    else:
+        price_ids = [price_id]
+
+    # Call the controller to update the prices in one pass
+    price_controller.set_special_prices_with_percentage(price_ids, special_price, special_start_date, special_end_date)
 
     return redirect(url_for('bridge_product_views.product', id=product_id))
 
@@ -109,6 +113,62 @@ API
 """
 
 
+@BridgeProductViews.route('/api/product/special_price_campaign', methods=['POST'])
+def api_product_special_price_campaign():
+    """
+    Apply a special price campaign to many products at once, e.g. for a seasonal sale.
+
+    JSON body:
+        percentage (float): The discount in percent.
+        special_start_date, special_end_date (str): The date window, YYYY-MM-DD.
+        product_ids (list), erp_nrs (list), erp_nr_from and erp_nr_to (str), category_id (int): The products,
+            at least one selection is needed, all given selections must match.
+        push_to_sw6 (bool): Queue the push of the prices to SW6. Defaults to True.
+        write_to_erp (bool): Queue the write-back of the prices to the ERP. Defaults to True. Without it the
+            next price sync from the ERP resets the special prices of the campaign.
+
+    :return: A JSON response with message, status and the report of the campaign
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        percentage = float(data['percentage'])
+        special_start_date = datetime.datetime.strptime(data['special_start_date'], "%Y-%m-%d")
+        special_end_date = datetime.datetime.strptime(data['special_end_date'], "%Y-%m-%d")
+    except (KeyError, TypeError, ValueError) as ex:
+        return jsonify({'message': f'Ungültige Angaben für die Aktion: {str(ex)}', 'status': 'error'}), 400
+
+    erp_nr_range = (data['erp_nr_from'], data['erp_nr_to']) if data.get('erp_nr_from') and data.get('erp_nr_to') else None
+    price_controller = BridgePriceController()
+    try:
+        product_ids = price_controller.select_campaign_product_ids(product_ids=data.get('product_ids'),
+                                                                   erp_nrs=data.get('erp_nrs'),
+                                                                   erp_nr_range=erp_nr_range,
+                                                                   category_id=data.get('category_id'))
+        report = price_controller.apply_special_price_campaign(product_ids, percentage,
+                                                               special_start_date, special_end_date)
+    except ValueError as ex:
+        return jsonify({'message': str(ex), 'status': 'error'}), 400
+    except Exception as ex:
+        return jsonify({'message': f'Die Aktion konnte nicht gespeichert werden: {str(ex)}', 'status': 'error'})
+
+    if data.get('write_to_erp', True) and report['products']:
+        # The ERP is slow, the write-back runs in the worker. Its state is available by the request id.
+        # It goes ahead of queued syncs, a price sync before it would reset the special prices.
+        erp_request = ERPWorkerController().submit(ERPWorkerRequest.WRITE_PRICES,
+                                                   priority=ERPWorkerRequest.PRIORITY_INTERACTIVE,
+                                                   bridge_product_ids=report['products'])
+        report['erp_request_id'] = erp_request.id
+
+    if data.get('push_to_sw6', True) and report['products']:
+        sw6_request = ERPWorkerController().submit(ERPWorkerRequest.PUSH_PRICES_TO_SW6,
+                                                   bridge_product_ids=report['products'])
+        report['sw6_request_id'] = sw6_request.id
+
+    return jsonify({'message': f'Die Aktion wurde auf {len(report["products"])} Produkte angewendet',
+                    'status': 'success',
+                    'report': report})
+
+
 @BridgeProductViews.route('/api/product/sync_to_sw6/<bridge_product_id>')
 def api_product_sync_to_sw6(bridge_product_id):
     """
@@ -162,9 +222,14 @@ def api_product_sync_to_erp(bridge_product_id):
     if product:
         try:
             # Call the sync_one_from_bridge method of the SW6ProductController to sync the product to SW6.
-            erp_product_controller = ERPArtikelController(product.get_erp_nr())
-            result = erp_product_controller.sync_one_from_bridge(bridge_entity=product)
-
+            result = ERPWorkerController().call(ERPWorkerRequest.WRITE_PRICE, bridge_product_id=product.id)
+
+        except ERPWorkerBusy as busy:
+            # The ERP is busy, e.g. with a sync. The request stays queued and runs afterwards.
+            return jsonify({'message': f'Das ERP ist beschäftigt, das Produkt <b>{product.get_translation().get_name()}<b/> '
+                                       f'wird im Hintergrund synchronisiert',
+                            'status': 'queued',
+                            'request_id': busy.request_id}), 202
         except Exception as ex:
             return jsonify({
                                'message': f'Das Produkt <b>{product.get_translation().get_name()}<b/> konnte nicht in ERP synchronisiert werden',
@@ -298,11 +363,16 @@ def api_update_product_in_bridge(bridge_product_id):
             {'message': f'Das Produkt {bridge_product_id} wurde nicht in der Db gefunden', 'status': 'error'})
 
     try:
-        erp_product_controller = ERPArtikelController(search_value=product.get_erp_nr())
-        bridge_product_entity_id = erp_product_controller.sync_one_to_bridge()
+        bridge_product_entity_id = ERPWorkerController().call(ERPWorkerRequest.READ_ARTICLE,
+                                                              erp_nr=product.get_erp_nr())
         if bridge_product_entity_id:
             return jsonify(
                 {'message': f'Das Produkt {bridge_product_id} wurde erfolgreich aktualisiert', 'status': 'success'})
+    except ERPWorkerBusy as busy:
+        return jsonify({'message': f'Das ERP ist beschäftigt, das Produkt {bridge_product_id} wird im Hintergrund '
+                                   f'aktualisiert',
+                        'status': 'queued',
+                        'request_id': busy.request_id}), 202
     except Exception as ex:
         return jsonify(
             {'message': f'Das Produkt {bridge_product_id} konnte nicht aktualisiert werden Error{str(ex)}',
@@ -1,12 +1,21 @@
+import datetime
+import multiprocessing
+import queue
 from abc import abstractmethod
 from pprint import pprint
 
+from config import GCBridgeConfig
 from src import db
 
 from ..ERPCoreController import ERPCoreController
 from ..entities.ERPAbstractEntity import ERPAbstractEntity
 from src.modules.Bridge.entities.BridgeMediaEntity import BridgeMediaEntity
+from src.modules.Bridge.entities.BridgeSyncStateEntity import BridgeSyncStateEntity
+from src.modules.Bridge.controller.BridgeLookupCache import BridgeLookupCache
+from src.modules.Bridge.controller.BridgeMediaMetaCache import BridgeMediaMetaCache
 from ..controller.ERPConnectionController import ERPConnectionController
+from ..controller.ERPPartitionReader import ERPPartitionReader
+from ..entities.ERPRowReplay import ERPRowReplayConnection
 
 
 class ERPAbstractController(ERPCoreController):
@@ -19,7 +28,15 @@ class ERPAbstractController(ERPCoreController):
 
     Attributes:
         dataset_entity: An instance of ERPAbstractEntity used for accessing datasets.
+        lookup_key_field: Unique column of the bridge entity, inserted entities are added to the lookup cache by it.
+        lookup_entity_class: The bridge entity class of lookup_key_field, its entities are prefetched per batch.
+        lookup_row_field: The ERP field which holds the value of lookup_key_field, e.g. "ArtNr".
+        dataset_entity_class: The ERP entity class, needed to read partitions in other processes.
     """
+    lookup_key_field = None
+    lookup_entity_class = None
+    lookup_row_field = None
+    dataset_entity_class = None
 
     def __init__(self, bridge_controller=None, search_value=None):
         super().__init__()
@@ -31,6 +48,10 @@ class ERPAbstractController(ERPCoreController):
         self.db = db
         self.db.session.autoflush = False
         self._bridge_controller = bridge_controller
+        # Only set while a sync over many entities runs, see start_lookup_cache
+        self._lookup_cache = None
+        # Only set while a partitioned sync replays the rows of its readers, see write_partition_rows
+        self._replay_erp = None
         self.search_value = None
         if search_value:
             self.search_value = search_value
@@ -96,45 +117,350 @@ class ERPAbstractController(ERPCoreController):
             self.logger.warning(message)
             raise ValueError(message)
 
-    def sync_all_to_bridge(self, set_relations=True):
+    def sync_all_to_bridge(self, set_relations=True, batch_size=None):
         """
         Syncs all dataset entities to the bridge. If an entity successfully syncs, its ID is appended to a list.
 
+        The upserts are committed once per batch. Every upsert runs in a savepoint, so a failing entity
+        is rolled back alone. If the commit of a batch fails, the batch is rolled back and its entities
+        are synced again one by one with their own commit.
+
         :param set_relations: Boolean to indicate whether to enable relations while syncing. Defaults to True.
+        :param batch_size: Entities per commit. Defaults to GCBridgeConfig.SYNC_BATCH_SIZE or 50, 1 commits every entity.
         :return: List of IDs of synced entities if any are synced, else True.
         """
+        if batch_size is None:
+            batch_size = getattr(GCBridgeConfig, "SYNC_BATCH_SIZE", 50)
+
         erp = self._erp.connect()
         self.create_dataset_entity(erp=erp)
+        self.start_lookup_cache()
 
         total_items = self._dataset_entity.get_range_count()
         print(f'We have a total of {total_items} items to loop through.')
 
         id_list = []
-        current_item = 1  # Initialize counter for current_item
+        # (key, row) of the entities read since the last commit
+        pending = []
 
-        while True:
+        # iter_rows reads the fields needed by map_erp_to_bridge once per row,
+        # the upsert gets them from memory instead of asking the ERP field by field
+        bulk_read_fields = self._dataset_entity.get_bulk_read_fields() or []
+        for current_item, row in enumerate(self._dataset_entity.iter_rows(fields=bulk_read_fields), start=1):
             try:
-                if not self._dataset_entity.range_eof():  # Verify range end of file
-                    print(f"On item: {current_item} out of {total_items}")
-                    self.logger.info(f"Next Element in range: {self._dataset_entity}")
+                print(f"On item: {current_item} out of {total_items}")
+                self.logger.info(f"Next Element in range: {self._dataset_entity}")
+                if batch_size > 1:
+                    # The rows of a batch are collected first, so their bridge entities are loaded in one query
+                    pending.append((self._dataset_entity.get_current_key(), row))
+                    if len(pending) >= batch_size:
+                        id_list.extend(self.write_batch(pending, set_relations=set_relations))
+                        pending = []
+                else:
                     id_ = self.upsert(set_relations=set_relations)  # Upsert and get ID
                     if id_:
                         id_list.append(id_)  # Append ID to list if present
-                    self._dataset_entity.range_next()  # Move to next in range
-                    current_item += 1  # increment the counter
-                else:
-                    break  # Break loop if EOF reached
             except Exception as error:
                 self.logger.error(f"Error occurred while syncing data to the bridge. Error: {error}")
-                continue  # Continue with next loop iteration if error occurs
+                continue  # Continue with next item if error occurs
+
+        if pending:
+            id_list.extend(self.write_batch(pending, set_relations=set_relations))
+
+        self.stop_lookup_cache()
+        self.destroy_dataset_entity()
+        # Keeps the session open for the next sync, if the connection is in keep alive mode
+        self._erp.release()
+
+        # return the list of IDs if not empty; else return True
+        if id_list:
+            return id_list
+        return True
+
+    def sync_all_to_bridge_parallel(self, partitions=4, set_relations=True, batch_size=None):
+        """
+        Syncs the range of the controller like sync_all_to_bridge, but the range is split into partitions
+        which are read in parallel, each in its own process with its own ERP session (ERPPartitionReader).
+        The rows are upserted by this process only, one bridge writer, committed once per chunk.
+
+        :param partitions: Number of reading processes.
+        :param set_relations: Boolean to indicate whether to enable relations while syncing. Defaults to True.
+        :param batch_size: Rows per chunk and commit. Defaults to GCBridgeConfig.SYNC_BATCH_SIZE or 50.
+        :return: List of IDs of synced entities if any are synced, else True.
+        """
+        if batch_size is None:
+            batch_size = getattr(GCBridgeConfig, "SYNC_BATCH_SIZE", 50)
+
+        search_value = getattr(self, '_search_value', None)
+        range_end = getattr(self, '_range_end', None)
+        sub_ranges = ERPPartitionReader.split_range(search_value, range_end, partitions)
+        if not self.dataset_entity_class or not range_end or len(sub_ranges) < 2:
+            self.logger.warning("Range can't be partitioned, syncing it serially.")
+            return self.sync_all_to_bridge(set_relations=set_relations, batch_size=batch_size)
+
+        # spawn, the reading processes must not inherit the COM state of this process
+        context = multiprocessing.get_context("spawn")
+        result_queue = context.Queue(maxsize=len(sub_ranges) * 4)
+        processes = {}
+        progress = {}
+        for partition, (sub_search_value, sub_range_end) in enumerate(sub_ranges):
+            reader = ERPPartitionReader(entity_class=self.dataset_entity_class,
+                                        partition=partition,
+                                        search_value=sub_search_value,
+                                        range_end=sub_range_end,
+                                        chunk_size=batch_size)
+            processes[partition] = context.Process(target=reader.run, args=(result_queue,), daemon=True)
+            progress[partition] = {'range': (sub_search_value, sub_range_end), 'state': 'running',
+                                   'total': None, 'read': 0, 'written': 0}
+            processes[partition].start()
+
+        self.start_lookup_cache()
+        self._replay_erp = None
+        id_list = []
+        running = len(processes)
+        while running:
+            try:
+                message = result_queue.get(timeout=10)
+            except queue.Empty:
+                # A reading process which died without a message would block the writer forever
+                for partition, process in processes.items():
+                    if progress[partition]['state'] == 'running' and not process.is_alive():
+                        self.logger.error(f"Partition {partition} exited with code {process.exitcode}.")
+                        progress[partition]['state'] = 'error'
+                        running -= 1
+                continue
+
+            partition_progress = progress[message['partition']]
+            if message['kind'] == 'total':
+                partition_progress['total'] = message['total']
+            elif message['kind'] == 'rows':
+                partition_progress['read'] += len(message['rows'])
+                ids = self.write_partition_rows(message, set_relations=set_relations)
+                partition_progress['written'] += len(ids)
+                id_list.extend(ids)
+            elif message['kind'] in ['done', 'error']:
+                partition_progress['state'] = message['kind']
+                if message['kind'] == 'error':
+                    self.logger.error(f"Partition {message['partition']} failed: {message['error']}")
+                running -= 1
+            self.print_partition_progress(progress)
+
+        for process in processes.values():
+            process.join()
+        self.stop_lookup_cache()
+        self._dataset_entity = None
+        self._replay_erp = None
 
         # return the list of IDs if not empty; else return True
         if id_list:
             return id_list
-        self.destroy_dataset_entity()
-        self._erp.close()
         return True
 
+    def write_partition_rows(self, message, set_relations=True):
+        """
+        Upsert a chunk of rows read by an ERPPartitionReader. The rows are replayed through the
+        entity class (see ERPRowReplayConnection), so map_erp_to_bridge and set_relations work unchanged
+        and get their values and extras from the rows.
+
+        :param message: The 'rows' message of the reader.
+        :return: List of IDs of the committed entities.
+        """
+        # One replay connection and entity for the whole run, every chunk is loaded into it
+        if self._replay_erp is None:
+            self._replay_erp = ERPRowReplayConnection(layout=message)
+            self._dataset_entity = self.dataset_entity_class(erp=self._replay_erp)
+        self._replay_erp.load_rows(message['rows'])
+
+        # The image sizes of the whole chunk concurrently, instead of per article
+        BridgeMediaMetaCache().prefetch([image for row in message['rows']
+                                         for image in (row.get('@images_file_list') or [])])
+
+        rows = []
+        for row in message['rows']:
+            key = [row[field_name] for field_name in message['index_fields']]
+            rows.append((key[0] if len(key) == 1 else key, row))
+        return self.write_batch(rows, set_relations=set_relations)
+
+    def write_batch(self, rows, set_relations=True):
+        """
+        Upsert a batch of rows, each in its own savepoint, and commit them together. The existing
+        bridge entities of the rows are loaded with one query before.
+
+        :param rows: List of (key, row) tuples, key as returned by ERPAbstractEntity.get_current_key,
+                     row the prefetched values of the entity.
+        :return: List of IDs of the committed entities.
+        """
+        self.prefetch_lookup_cache([row for _, row in rows])
+
+        batch = []
+        for key, row in rows:
+            try:
+                with self._dataset_entity.visit_key(key, row=row) as found:
+                    if not found:
+                        self.logger.error(f"Row {key} not found again.")
+                        continue
+                    id_ = self.upsert_in_batch(set_relations=set_relations)
+                batch.append((key, id_, row))
+            except Exception as error:
+                self.logger.error(f"Error occurred while writing row {key} to the bridge. Error: {error}")
+
+        return self.commit_batch(batch, set_relations=set_relations)
+
+    def print_partition_progress(self, progress):
+        total = sum(partition['total'] or 0 for partition in progress.values())
+        read = sum(partition['read'] for partition in progress.values())
+        written = sum(partition['written'] for partition in progress.values())
+        running = sum(1 for partition in progress.values() if partition['state'] == 'running')
+        print(f"Partitions running: {running}/{len(progress)} | read: {read}/{total} | written: {written}")
+
+    def upsert_in_batch(self, set_relations=True):
+        """
+        Upsert the current entity without commit, inside a savepoint. If the upsert fails,
+        only the savepoint is rolled back and the other entities of the batch are kept.
+
+        :return: ID of the upserted entity or None.
+        """
+        marker = self.lookup_cache_checkpoint()
+        savepoint = self.db.session.begin_nested()
+        try:
+            id_ = self.upsert(set_relations=set_relations, commit=False)
+        except Exception as e:
+            self.logger.error(f"Failed to upsert entity in batch: {e}")
+            id_ = None
+
+        if savepoint.is_active:
+            if id_:
+                savepoint.commit()
+            else:
+                savepoint.rollback()
+                # Only the keys added by this entity, the other entities of the batch are still there
+                self.rollback_caches(marker)
+        return id_
+
+    def commit_batch(self, batch, set_relations=True):
+        """
+        Commit a batch of upserts. If the commit fails, the batch is rolled back and every entity
+        of the batch is found again by its key and upserted on its own.
+
+        :param batch: List of (key, id, row) tuples, key as returned by ERPAbstractEntity.get_current_key,
+                      row the prefetched values of the entity.
+        :param set_relations: Boolean to indicate whether to enable relations while syncing.
+        :return: List of IDs of the committed entities.
+        """
+        try:
+            self.db.session.commit()
+            self.logger.info(f"Committed batch of {len(batch)} entities.")
+            self.release_caches()
+            return [id_ for _, id_, _ in batch if id_]
+        except Exception as e:
+            self.logger.error(f"Failed to commit batch of {len(batch)} entities, retrying them one by one: {e}")
+            self.db.session.rollback()
+            # Every key added since the last commit belongs to this batch
+            self.rollback_caches(0)
+
+        id_list = []
+        for key, _, row in batch:
+            marker = self.lookup_cache_checkpoint()
+            try:
+                with self._dataset_entity.visit_key(key, row=row) as found:
+                    if not found:
+                        self.logger.error(f"Entity {key} of the failed batch not found again.")
+                        continue
+                    id_ = self.upsert(set_relations=set_relations)
+                if id_:
+                    id_list.append(id_)
+                    self.release_caches()
+                else:
+                    self.db.session.rollback()
+                    self.rollback_caches(marker)
+            except Exception as e:
+                self.logger.error(f"Failed to retry entity {key} of the failed batch: {e}")
+                self.db.session.rollback()
+                self.rollback_caches(marker)
+        self.release_caches()
+        return id_list
+
+    """ Lookup Cache """
+    def start_lookup_cache(self):
+        """
+        Load the keyed bridge tables once for a sync run instead of querying them per row.
+        """
+        self._lookup_cache = BridgeLookupCache(db=self.db)
+
+    def stop_lookup_cache(self):
+        if self._lookup_cache:
+            self.logger.info(f"Lookup cache stats: {self._lookup_cache.get_stats()}")
+        self._lookup_cache = None
+
+    def get_lookup_cache(self):
+        return self._lookup_cache
+
+    def invalidate_lookup_cache(self):
+        if self._lookup_cache:
+            self._lookup_cache.invalidate()
+
+    def lookup_cache_checkpoint(self):
+        return self._lookup_cache.checkpoint() if self._lookup_cache else 0
+
+    def rollback_lookup_cache(self, marker):
+        """
+        Remove the keys added to the lookup cache since the marker, e.g. after a savepoint is rolled back.
+        """
+        if self._lookup_cache:
+            self._lookup_cache.rollback_to(marker)
+
+    def release_lookup_cache(self):
+        if self._lookup_cache:
+            self._lookup_cache.release()
+
+    def rollback_caches(self, marker):
+        """
+        After a rollback: remove the rolled back keys from the lookup cache and the rolled back
+        rows from the media metadata cache.
+        """
+        self.rollback_lookup_cache(marker)
+        BridgeMediaMetaCache().rollback()
+
+    def release_caches(self):
+        """
+        After a commit: the added keys and the stored media metadata are final.
+        """
+        self.release_lookup_cache()
+        BridgeMediaMetaCache().release()
+
+    def prefetch_lookup_cache(self, rows):
+        """
+        Load the existing bridge entities of a batch of rows with one query, see lookup_entity_class.
+
+        :param rows: The prefetched values of the rows.
+        """
+        if not (self._lookup_cache and self.lookup_entity_class and self.lookup_row_field):
+            return
+        keys = [row.get(self.lookup_row_field) for row in rows if row]
+        try:
+            self._lookup_cache.prefetch(self.lookup_entity_class, self.lookup_key_field, keys)
+        except Exception as e:
+            # Without the prefetch the entities are loaded one by one
+            self.logger.warning(f"Failed to prefetch {self.lookup_entity_class.__name__} of the batch: {e}")
+
+    def find_in_db(self, entity_class, key_field, key):
+        """
+        Find a bridge entity by a unique column. Uses the lookup cache while a sync runs,
+        otherwise a single query.
+
+        :param entity_class: The bridge entity class, e.g. BridgeTaxEntity.
+        :param key_field: The unique column, e.g. 'erp_nr'.
+        :param key: The value to look for.
+        :return: The entity or None.
+        """
+        if self._lookup_cache:
+            return self._lookup_cache.get_entity(entity_class, key_field, key)
+        return entity_class.query.filter_by(**{key_field: key}).one_or_none()
+
+    def add_to_lookup_cache(self, entity, key_field):
+        if self._lookup_cache:
+            self._lookup_cache.add(entity, key_field)
+
     def sync_all_from_bridge(self, bridge_entities):
         for bridge_entity in bridge_entities:
             self.downsert(bridge_entity=bridge_entity)
@@ -152,15 +478,17 @@ class ERPAbstractController(ERPCoreController):
         Returns:
         int: Identifier (id) of the upserted dataset if upsertion is successful. None otherwise.
         """
-        try:
-            erp = self._erp.connect()
+        def _sync(erp):
             self.create_dataset_entity(erp=erp)
+            try:
+                # Perform upsert operation
+                return self.upsert(set_relations=set_relations)
+            finally:
+                self.destroy_dataset_entity()
 
-            # Perform upsert operation
-            id = self.upsert(set_relations=set_relations)
-
-            self.destroy_dataset_entity()
-            erp = None
+        try:
+            # execute reuses a living session and reconnects on COM errors
+            id = self._erp.execute(_sync)
 
             # If the operation is successful, id will be assigned a value and hence True
             if id:
@@ -172,29 +500,123 @@ class ERPAbstractController(ERPCoreController):
             raise e
 
         finally:
-            self._erp.close()
+            self._erp.release()
 
     def sync_one_from_bridge(self, bridge_entity):
         result = self.downsert(bridge_entity=bridge_entity)
         return result
 
-    def sync_changed_to_bridge(self):
-        pass
+    def sync_changed_to_bridge(self, set_relations=True, full_rescan=False):
+        """
+        Syncs only the entities changed (LtzAend) since the last run to the bridge.
+
+        The newest synced LtzAend is stored as high-water mark in BridgeSyncStateEntity. The dataset is
+        restricted by a range on a LtzAend index or a filter (see ERPAbstractEntity.set_changed_since),
+        rows older than the high-water mark are skipped anyway. A full rescan is done if there is no
+        high-water mark yet, if full_rescan is set, if the last full sync is older than
+        GCBridgeConfig.FULL_RESCAN_AFTER_DAYS or if the dataset can't be restricted.
+
+        :param set_relations: Boolean to indicate whether to enable relations while syncing. Defaults to True.
+        :param full_rescan: Visit and upsert all rows, regardless of the high-water mark.
+        :return: dict report with mode, processed, skipped, errors and the new high-water mark.
+        """
+        erp = self._erp.connect()
+        self.create_dataset_entity(erp=erp)
+        self.start_lookup_cache()
+        try:
+            sync_state = BridgeSyncStateEntity.get_or_create(sync_key=self.get_sync_state_key())
+            high_water_mark = sync_state.get_high_water_mark()
+            full_rescan_after_days = getattr(GCBridgeConfig, "FULL_RESCAN_AFTER_DAYS", 7)
+
+            if full_rescan or high_water_mark is None or sync_state.is_full_rescan_due(full_rescan_after_days):
+                mode = 'full'
+                high_water_mark = None
+            else:
+                restricted_by = self._dataset_entity.set_changed_since(since=high_water_mark)
+                # Without a range or filter every row is visited, but only changed ones are upserted
+                mode = f'incremental_{restricted_by}' if restricted_by else 'incremental_scan'
+
+            report = {'mode': mode, 'processed': 0, 'skipped': 0, 'errors': 0, 'high_water_mark': high_water_mark}
+            newest_changed_at = high_water_mark
+            oldest_failed_at = None
+
+            bulk_read_fields = self._dataset_entity.get_bulk_read_fields() or []
+            for _ in self._dataset_entity.iter_rows(fields=bulk_read_fields):
+                changed_at = self._to_naive_datetime(self._dataset_entity.get_aenddat())
+
+                # Rows with exactly the high-water mark are synced again, they may have changed in the same second
+                if high_water_mark and changed_at and changed_at < high_water_mark:
+                    report['skipped'] += 1
+                    continue
+
+                try:
+                    id_ = self.upsert(set_relations=set_relations)
+                except Exception as error:
+                    self.logger.error(f"Error occurred while syncing changed data to the bridge. Error: {error}")
+                    id_ = None
+
+                if id_:
+                    report['processed'] += 1
+                    if changed_at and (newest_changed_at is None or changed_at > newest_changed_at):
+                        newest_changed_at = changed_at
+                else:
+                    report['errors'] += 1
+                    if changed_at and (oldest_failed_at is None or changed_at < oldest_failed_at):
+                        oldest_failed_at = changed_at
+        finally:
+            # The dataset and the session are released, even if the ERP fails while the rows are read
+            self.stop_lookup_cache()
+            self.destroy_dataset_entity()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+
+        # Don't move the high-water mark past a failed row, so it is picked up again next time
+        if oldest_failed_at and newest_changed_at and newest_changed_at >= oldest_failed_at:
+            newest_changed_at = oldest_failed_at - datetime.timedelta(seconds=1)
+
+        report['high_water_mark'] = newest_changed_at
+        sync_state.set_high_water_mark(newest_changed_at)
+        sync_state.set_report(report)
+        self.db.session.commit()
+
+        self.logger.info(f"Sync changed to bridge {sync_state.sync_key}: {report}")
+        return report
+
+    def get_sync_state_key(self):
+        """
+        Key of the high-water mark in BridgeSyncStateEntity. Controllers syncing only a part of
+        the dataset get their own key, so they don't move the mark of the whole dataset.
+        """
+        sync_state_key = self._dataset_entity.get_dataset_name()
+        search_value = getattr(self, '_search_value', None)
+        range_end = getattr(self, '_range_end', None)
+        if search_value or range_end:
+            sync_state_key += f":{search_value}-{range_end}"
+        return sync_state_key
+
+    @staticmethod
+    def _to_naive_datetime(value):
+        # pywintypes datetimes carry a tzinfo, the bridge stores naive datetimes
+        if isinstance(value, datetime.datetime):
+            return value.replace(tzinfo=None)
+        return None
 
     def sync_changed_from_bridge(self, bridge_entities):
         pass
 
-    def upsert(self, set_relations=True):
+    def upsert(self, set_relations=True, commit=True):
         """
         Inserts or updates the BridgeEntity in the database based on whether it already exists or not.
         This method maps the ERPDataset to the BridgeObject, then checks if this entity is already
         present in the database. If the entity exists, it updates the entity, otherwise, it inserts a new one.
         :param set_relations: Whether the relations should be set
+        :param commit: If False the changes are only flushed, the caller commits them (see sync_all_to_bridge).
         :param args: Positional arguments passed to map_erp_to_bridge method.
         :param kwargs: Keyword arguments passed to map_erp_to_bridge method.
         """
 
         self.logger.info("Starting the upsert process.")
+        marker = self.lookup_cache_checkpoint()
         try:
             # Map the data to a new bridge entity
 
@@ -216,6 +638,8 @@ class ERPAbstractController(ERPCoreController):
             self.logger.info("No existing entity found in DB, preparing to insert new entity.")
             bridge_entity_for_db = bridge_entity_new
             self.db.session.add(bridge_entity_for_db)
+            if self.lookup_key_field:
+                self.add_to_lookup_cache(bridge_entity_for_db, self.lookup_key_field)
         try:
             # Flush it first, for we have the relations to set
             self.db.session.flush()
@@ -243,11 +667,18 @@ class ERPAbstractController(ERPCoreController):
             bridge_entity_for_db_with_relations = bridge_entity_for_db
         try:
             entity_id = bridge_entity_for_db_with_relations.get_id()
-            self.db.session.commit()
-            self.logger.info(f"Entity successfully upserted with ID: {entity_id}")
+            if commit:
+                self.db.session.commit()
+                self.release_caches()
+                self.logger.info(f"Entity successfully upserted with ID: {entity_id}")
+            else:
+                self.db.session.flush()
             return entity_id
         except Exception as e:
             self.logger.error(f"Failed to commit changes to DB: {e}")
+            if commit:
+                self.db.session.rollback()
+                self.rollback_caches(marker)
 
     # Direction to ERP
     def downsert(self, bridge_entity):
@@ -0,0 +1,324 @@
+"""
+Index of the ERP addresses (Anschriften and Ansprechpartner) in the bridge, so the customer of an order
+can be matched with lookups in memory instead of searching the ERP for every order.
+
+- refresh reads only the rows changed (LtzAend) since the last run, the high-water mark is kept in
+  BridgeSyncStateEntity. A full rescan (GCBridgeConfig.FULL_RESCAN_AFTER_DAYS) removes deleted addresses.
+- Names, streets, postal codes and e-mails are normalized, e.g. "Hauptstraße 1" and "hauptstr. 1" match.
+- Addresses written to the ERP by the bridge are added with remember, no rescan is needed.
+
+Examples:
+    address_index = ERPAddressIndexController()
+    address_index.refresh()
+    adr_nr = address_index.find_adr_nr(email="info@gastro-held.de")
+    anschrift = address_index.find_anschrift(adr_nr, name="Gastro-Held", street="Hauptstr. 1", postal_code="84130")
+"""
+import datetime
+import logging
+import re
+import unicodedata
+
+from config import GCBridgeConfig
+from src import db
+from .ERPConnectionController import ERPConnectionController
+from ..entities.ERPAnschriftenEntity import ERPAnschriftenEntity
+from ..entities.ERPAnsprechpartnerEntity import ERPAnsprechpartnerEntity
+from src.modules.Bridge.entities.BridgeAddressIndexEntity import BridgeAddressIndexEntity
+from src.modules.Bridge.entities.BridgeSyncStateEntity import BridgeSyncStateEntity
+
+# Dataset name -> entity class and the fields read for the index
+INDEXED_DATASETS = {
+    'Anschriften': {
+        'entity_class': ERPAnschriftenEntity,
+        'fields': ["ID", "AdrNr", "AnsNr", "Na1", "Na2", "Na3", "Str", "PLZ", "EMail1", "LtzAend"]
+    },
+    'Ansprechpartner': {
+        'entity_class': ERPAnsprechpartnerEntity,
+        'fields': ["ID", "AdrNr", "AnsNr", "AspNr", "VNa", "NNa", "EMail1", "LtzAend"]
+    },
+}
+
+UMLAUTS = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def normalize_address_value(value):
+    """
+    Lower case ASCII letters and digits only, e.g. "Müller GmbH & Co." -> "muellergmbhco"
+    """
+    if value is None:
+        return ""
+    value = str(value).casefold().translate(UMLAUTS)
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]", "", value)
+
+
+def normalize_street(value):
+    return normalize_address_value(value).replace("strasse", "str")
+
+
+def normalize_name(*names):
+    return normalize_address_value(" ".join(str(name) for name in names if name))
+
+
+def normalize_email(value):
+    return str(value).strip().casefold() if value else ""
+
+
+class ERPAddressIndexController:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ERPAddressIndexController, cls).__new__(cls)
+            cls._instance.logger = logging.getLogger(cls.__name__)
+            cls._instance._erp = ERPConnectionController()
+            cls._instance._loaded = False
+            cls._instance._by_email = {}
+            cls._instance._by_address = {}
+            cls._instance._by_contact = {}
+            # (dataset_name, erp_id) -> (map, key, entry), to replace a remembered row in place
+            cls._instance._by_erp_id = {}
+        return cls._instance
+
+    """ Refresh """
+    def refresh(self, full_rescan=False):
+        """
+        Read the changed Anschriften and Ansprechpartner from the ERP into the index.
+
+        :param full_rescan: Read all rows and remove the deleted ones, regardless of the high-water mark.
+        :return: dict dataset name -> report with 'mode', 'processed', 'skipped', 'errors'.
+        """
+        return {dataset_name: self._refresh_dataset(dataset_name, full_rescan=full_rescan)
+                for dataset_name in INDEXED_DATASETS}
+
+    def _refresh_dataset(self, dataset_name, full_rescan=False):
+        sync_state = BridgeSyncStateEntity.get_or_create(sync_key=f"address_index:{dataset_name}")
+        high_water_mark = sync_state.get_high_water_mark()
+        if full_rescan or high_water_mark is None or sync_state.is_full_rescan_due(
+                getattr(GCBridgeConfig, "FULL_RESCAN_AFTER_DAYS", 7)):
+            high_water_mark = None
+
+        dataset = INDEXED_DATASETS[dataset_name]
+        erp = self._erp.connect()
+        erp_entity = dataset['entity_class'](erp=erp)
+        try:
+            mode = 'full'
+            if high_water_mark is not None:
+                restricted_by = erp_entity.set_changed_since(since=high_water_mark)
+                mode = f'incremental_{restricted_by}' if restricted_by else 'incremental_scan'
+            entries = []
+            skipped = 0
+            for row in erp_entity.iter_rows(fields=dataset['fields']):
+                if high_water_mark is not None and row.get("LtzAend") and \
+                        self._to_naive_datetime(row["LtzAend"]) < high_water_mark:
+                    skipped += 1
+                    continue
+                entries.append(self._to_entry(dataset_name, row))
+        finally:
+            erp_entity.release_created_dataset()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+
+        report = {'mode': mode, 'processed': len(entries), 'skipped': skipped, 'errors': 0}
+        try:
+            self._store(dataset_name, entries, remove_missing=mode == 'full')
+            changed_at = [entry['erp_changed_at'] for entry in entries if entry['erp_changed_at']]
+            if changed_at and (high_water_mark is None or max(changed_at) > high_water_mark):
+                sync_state.set_high_water_mark(max(changed_at))
+        except Exception as e:
+            self.logger.error(f"Error storing the address index of {dataset_name}: {str(e)}")
+            db.session.rollback()
+            report['errors'] += 1
+            # The rollback discards a new sync state
+            sync_state = BridgeSyncStateEntity.get_or_create(sync_key=f"address_index:{dataset_name}")
+
+        sync_state.set_report(report)
+        db.session.commit()
+        self.invalidate()
+        self.logger.info(f"Address index of {dataset_name}: {report}")
+        return report
+
+    def refresh_if_due(self, max_age_minutes=None):
+        """
+        Refresh the index if the last refresh is older than max_age_minutes, e.g. before matching the orders.
+
+        :param max_age_minutes: Defaults to GCBridgeConfig.ADDRESS_INDEX_MAX_AGE_MINUTES or 15.
+        """
+        if max_age_minutes is None:
+            max_age_minutes = getattr(GCBridgeConfig, "ADDRESS_INDEX_MAX_AGE_MINUTES", 15)
+        last_runs = [BridgeSyncStateEntity.get_or_create(sync_key=f"address_index:{dataset_name}").last_run_at
+                     for dataset_name in INDEXED_DATASETS]
+        if any(last_run is None or datetime.datetime.now() - last_run > datetime.timedelta(minutes=max_age_minutes)
+               for last_run in last_runs):
+            return self.refresh()
+        return None
+
+    def _store(self, dataset_name, entries, remove_missing=False):
+        """
+        Insert and update the entries in bulk. The caller commits.
+        """
+        existing = dict(db.session.query(BridgeAddressIndexEntity.erp_id, BridgeAddressIndexEntity.id).filter(
+            BridgeAddressIndexEntity.dataset_name == dataset_name).all())
+
+        inserts = [entry for entry in entries if entry['erp_id'] not in existing]
+        updates = [dict(entry, id=existing[entry['erp_id']]) for entry in entries if entry['erp_id'] in existing]
+        if inserts:
+            db.session.bulk_insert_mappings(BridgeAddressIndexEntity, inserts)
+        if updates:
+            db.session.bulk_update_mappings(BridgeAddressIndexEntity, updates)
+        if remove_missing:
+            seen = {entry['erp_id'] for entry in entries}
+            removed = [index_id for erp_id, index_id in existing.items() if erp_id not in seen]
+            if removed:
+                BridgeAddressIndexEntity.query.filter(BridgeAddressIndexEntity.id.in_(removed)).delete(
+                    synchronize_session=False)
+
+    @staticmethod
+    def _to_naive_datetime(value):
+        if isinstance(value, datetime.datetime):
+            # pywintypes datetimes are converted to plain datetimes
+            return datetime.datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+        return None
+
+    def _to_entry(self, dataset_name, row):
+        entry = {
+            'dataset_name': dataset_name,
+            'erp_id': int(row["ID"]),
+            'adr_nr': str(row["AdrNr"]),
+            'ans_nr': int(row["AnsNr"]) if row.get("AnsNr") is not None else None,
+            'asp_nr': None,
+            'street_key': None,
+            'postal_code': None,
+            'email': normalize_email(row.get("EMail1")) or None,
+            'erp_changed_at': self._to_naive_datetime(row.get("LtzAend"))
+        }
+        if dataset_name == 'Anschriften':
+            entry['name_key'] = normalize_name(row.get("Na1"), row.get("Na2"), row.get("Na3"))
+            entry['street_key'] = normalize_street(row.get("Str"))
+            entry['postal_code'] = normalize_address_value(row.get("PLZ"))
+        else:
+            entry['asp_nr'] = int(row["AspNr"]) if row.get("AspNr") is not None else None
+            entry['name_key'] = normalize_name(row.get("VNa"), row.get("NNa"))
+        return entry
+
+    def remember(self, erp_entity):
+        """
+        Add or update an Anschrift or Ansprechpartner which was just written to the ERP.
+        The row is written in a savepoint and committed with the session of the caller, e.g. the order sync.
+
+        :param erp_entity: ERPAnschriftenEntity or ERPAnsprechpartnerEntity with the cursor on the written row.
+        """
+        dataset_name = erp_entity.get_dataset_name()
+        if dataset_name not in INDEXED_DATASETS:
+            return
+        try:
+            row = {field_name: erp_entity.get_(field_name) for field_name in INDEXED_DATASETS[dataset_name]['fields']}
+            entry = self._to_entry(dataset_name, row)
+            with db.session.begin_nested():
+                index_entry = BridgeAddressIndexEntity.query.filter_by(dataset_name=dataset_name,
+                                                                       erp_id=entry['erp_id']).first()
+                if index_entry is None:
+                    db.session.add(BridgeAddressIndexEntity(**entry))
+                else:
+                    for column, value in entry.items():
+                        setattr(index_entry, column, value)
+        except Exception as e:
+            # Only the savepoint is rolled back, the pending changes of the caller are kept
+            self.logger.error(f"Error adding {dataset_name} to the address index: {str(e)}")
+            return
+
+        if self._loaded:
+            self._add_to_maps(entry)
+
+    def invalidate(self):
+        """
+        Drop the loaded index, it is loaded from the bridge again on the next lookup.
+        """
+        self._loaded = False
+
+    """ Lookups """
+    def _load(self):
+        if self._loaded:
+            return
+        self._by_email = {}
+        self._by_address = {}
+        self._by_contact = {}
+        self._by_erp_id = {}
+        for index_entry in BridgeAddressIndexEntity.query.all():
+            self._add_to_maps({column: getattr(index_entry, column) for column in
+                               ['dataset_name', 'erp_id', 'adr_nr', 'ans_nr', 'asp_nr', 'name_key',
+                                'street_key', 'postal_code', 'email']})
+        self._loaded = True
+        self.logger.info(f"Loaded address index with {len(self._by_address)} addresses.")
+
+    def _add_to_maps(self, index_entry):
+        """
+        Add an entry to the lookup maps. An older entry of the same ERP row is replaced.
+
+        :param index_entry: dict with the columns of BridgeAddressIndexEntity.
+        """
+        erp_key = (index_entry['dataset_name'], index_entry['erp_id'])
+        for lookup_map, key, entry in self._by_erp_id.pop(erp_key, []):
+            entries = lookup_map.get(key, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                lookup_map.pop(key, None)
+
+        entry = {column: index_entry[column] for column in
+                 ['dataset_name', 'erp_id', 'adr_nr', 'ans_nr', 'asp_nr', 'name_key']}
+        keys = []
+        if index_entry['email']:
+            keys.append((self._by_email, index_entry['email']))
+        if index_entry['dataset_name'] == 'Anschriften':
+            keys.append((self._by_address,
+                         (index_entry['name_key'], index_entry['street_key'], index_entry['postal_code'])))
+        else:
+            keys.append((self._by_contact, (index_entry['adr_nr'], index_entry['ans_nr'], index_entry['name_key'])))
+        for lookup_map, key in keys:
+            lookup_map.setdefault(key, []).append(entry)
+        self._by_erp_id[erp_key] = [(lookup_map, key, entry) for lookup_map, key in keys]
+
+    def find_adr_nr(self, email=None, name=None, street=None, postal_code=None):
+        """
+        The AdrNr of an existing customer, by e-mail first and by name, street and postal code second.
+
+        :return: The AdrNr or None if there is no or no unique match.
+        """
+        self._load()
+        candidates = []
+        if email:
+            candidates = self._by_email.get(normalize_email(email), [])
+        if not candidates and name and street and postal_code:
+            candidates = self._by_address.get(self._get_address_key(name, street, postal_code), [])
+
+        adr_nrs = {entry['adr_nr'] for entry in candidates}
+        if len(adr_nrs) > 1:
+            self.logger.warning(f"Address matches several customers {sorted(adr_nrs)}, no match used.")
+            return None
+        return adr_nrs.pop() if adr_nrs else None
+
+    def find_anschrift(self, adr_nr, name, street, postal_code):
+        """
+        :return: dict with 'erp_id', 'adr_nr' and 'ans_nr' of the matching Anschrift of the customer, or None.
+        """
+        self._load()
+        matches = [entry for entry in self._by_address.get(self._get_address_key(name, street, postal_code), [])
+                   if entry['adr_nr'] == str(adr_nr)]
+        return min(matches, key=lambda entry: entry['ans_nr'] or 0) if matches else None
+
+    def find_ansprechpartner(self, adr_nr, ans_nr, first_name, last_name):
+        """
+        :return: dict with 'erp_id', 'adr_nr', 'ans_nr' and 'asp_nr' of the matching Ansprechpartner, or None.
+        """
+        self._load()
+        matches = self._by_contact.get((str(adr_nr), int(ans_nr), normalize_name(first_name, last_name)), [])
+        return min(matches, key=lambda entry: entry['asp_nr'] or 0) if matches else None
+
+    @staticmethod
+    def _get_address_key(name, street, postal_code):
+        if isinstance(name, (list, tuple)):
+            name_key = normalize_name(*name)
+        else:
+            name_key = normalize_name(name)
+        return name_key, normalize_street(street), normalize_address_value(postal_code)
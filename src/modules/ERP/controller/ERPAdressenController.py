@@ -6,9 +6,10 @@ from ..entities.ERPAdressenEntity import ERPAdressenEntity
 from ..entities.ERPAnschriftenEntity import ERPAnschriftenEntity
 from ..entities.ERPAnsprechpartnerEntity import ERPAnsprechpartnerEntity
 from ..controller.ERPKontenplanController import ERPKontenplanController
+from ..controller.ERPAddressIndexController import ERPAddressIndexController
 
 from src.modules.Bridge.controller.BridgeCustomerController import BridgeCustomerController
-from src.modules.Bridge.entities.BridgeCustomerEntity import BridgeCustomerAddressEntity
+from src.modules.Bridge.entities.BridgeCustomerEntity import BridgeCustomerEntity, BridgeCustomerAddressEntity
 from datetime import datetime
 
 from ...SW6.controller.SW6CustomerController import SW6CustomerController
@@ -85,6 +86,8 @@ class ERPAdressenController(ERPAbstractController):
 
     def destroy_dataset_entity(self):
         print("Adressen destroy dataset")
+        if self._dataset_entity:
+            self._dataset_entity.release_created_dataset()
         self._dataset_entity = None
 
     def get_entity(self):
@@ -255,7 +258,20 @@ class ERPAdressenController(ERPAbstractController):
         # Step 1: Evaluate ERP number to determine applicable method for downserting of a customer
         try:
             if int(bridge_entity.erp_nr) > 69999:
-                erp_adresse_entity = self._create_customer(bridge_entity)
+                # New in the shop, but maybe already a customer in the ERP
+                adr_nr = self._find_existing_customer(bridge_entity)
+                holder = self._get_bridge_customer_by_erp_nr(adr_nr, exclude_id=bridge_entity.get_id()) if adr_nr else None
+                if holder:
+                    # erp_nr is unique in the bridge, e.g. a second shop account or a guest order of the customer
+                    self.logger.warning(f"AdrNr {adr_nr} of customer {bridge_entity.erp_nr} belongs to bridge customer "
+                                        f"{holder.get_id()} already, the customer is created without merge.")
+                    adr_nr = None
+                if adr_nr:
+                    self.logger.info(f"Customer {bridge_entity.erp_nr} matched to existing AdrNr {adr_nr}")
+                    bridge_entity.set_erp_nr(adr_nr)
+                    erp_adresse_entity = self._update_customer(bridge_entity)
+                else:
+                    erp_adresse_entity = self._create_customer(bridge_entity)
             elif 10000 < int(bridge_entity.erp_nr) < 69999:
                 erp_adresse_entity = self._update_customer(bridge_entity)
             else:
@@ -277,6 +293,36 @@ class ERPAdressenController(ERPAbstractController):
             self.logger.error('Failed to create/update customer: {}. Error: {}'.format(bridge_entity.erp_nr, e))
             return False
 
+    def _find_existing_customer(self, bridge_entity):
+        """
+        Match a new customer against the address index by e-mail. The matched ERP customer is updated
+        with the shop data, so a name and address match isn't enough, it may be another person.
+
+        The index is not refreshed here, the refresh commits the session. It is refreshed once
+        at the start of the order import, see ERPVorgangController.create_orders.
+
+        :return: The AdrNr of the existing customer or None, if there is no or no unique match.
+        """
+        try:
+            billing_address = bridge_entity.standard_billing_address
+            email = bridge_entity.get_email() or (billing_address.get_email() if billing_address else None)
+            if not email:
+                return None
+            return ERPAddressIndexController().find_adr_nr(email=email)
+        except Exception as e:
+            self.logger.error(f"Error matching customer {bridge_entity.erp_nr} in the address index: {e}")
+            return None
+
+    @staticmethod
+    def _get_bridge_customer_by_erp_nr(erp_nr, exclude_id=None):
+        """
+        :return: The bridge customer holding the erp_nr, other than exclude_id, or None.
+        """
+        query = BridgeCustomerEntity.query.filter(BridgeCustomerEntity.erp_nr == str(erp_nr))
+        if exclude_id is not None:
+            query = query.filter(BridgeCustomerEntity.id != exclude_id)
+        return query.first()
+
     def _process_billing_and_shipping(self, bridge_entity, erp_adresse_entity):
         """
         Function to process the billing and shipping details for a given bridge
@@ -387,7 +433,7 @@ class ERPAdressenController(ERPAbstractController):
         :returns: ERPAdressenEntity object.
         """
         # Create ERPAdressenEntity instance and map bridge_entity to it
-        erp_adresse_entity_new = ERPAdressenEntity().map_bridge_to_erp(bridge_entity)
+        erp_adresse_entity_new = ERPAdressenEntity(erp=self._erp.connect()).map_bridge_to_erp(bridge_entity)
 
         # Instantiate ERPKontenplanController
         erp_kontenplan_controller = ERPKontenplanController()
@@ -431,7 +477,7 @@ class ERPAdressenController(ERPAbstractController):
         ERPAdressenEntity: An object with updated customer data if successful, else False.
         """
         # Instantiate ERPAdressenEntity class
-        erp_adresse_entity_updated = ERPAdressenEntity()
+        erp_adresse_entity_updated = ERPAdressenEntity(erp=self._erp.connect())
 
         try:
             # Attempt to find customer in the ERP system
@@ -473,7 +519,7 @@ class ERPAdressenController(ERPAbstractController):
             if bridge_entity.get_id_for_erp_anschrift_from_combined_id():
                 self.logger.info("erp_combined_id found. Preparing for update or creation of Anschrift entity...")
 
-                erp_anschrift_entity = ERPAnschriftenEntity()
+                erp_anschrift_entity = ERPAnschriftenEntity(erp=self._erp.connect())
                 try:
                     # Try to fetch Anschrift entity based on the erp_combined_id
                     found = erp_anschrift_entity.find_one(
@@ -492,6 +538,7 @@ class ERPAdressenController(ERPAbstractController):
                         erp_anschrift_entity=erp_anschrift_entity,
                         address_type=address_type
                     )
+                    self._remember_in_address_index(erp_anschrift_entity)
                     self.logger.info("Anschrift entity updated successfully!")
                     return erp_anschrift_entity
                 else:
@@ -502,16 +549,37 @@ class ERPAdressenController(ERPAbstractController):
                         erp_adresse_entity=erp_adresse_entity,
                         address_type=address_type
                     )
+                    self._remember_in_address_index(erp_anschrift_entity)
                     self.logger.info(f"New Anschrift created successfully! ID: {erp_anschrift_entity.get_ansnr()}")
                     return erp_anschrift_entity
             else:
-                # If erp_combined_id not provided, create a new Anschrift
+                # If erp_combined_id not provided, look for the same Anschrift of the customer in the address index
+                match = ERPAddressIndexController().find_anschrift(
+                    adr_nr=erp_adresse_entity.get_adrnr(),
+                    name=[bridge_entity.get_name1(), bridge_entity.get_name2(), bridge_entity.get_name3()],
+                    street=bridge_entity.get_street(),
+                    postal_code=bridge_entity.get_postal_code())
+                if match:
+                    erp_anschrift_entity = ERPAnschriftenEntity(erp=self._erp.connect())
+                    if erp_anschrift_entity.find_one(search_value=[match['adr_nr'], match['ans_nr']]):
+                        self.logger.info(f"Anschrift {match['adr_nr']}-{match['ans_nr']} found in address index. Updating...")
+                        erp_anschrift_entity = self._update_anschrift(
+                            bridge_entity=bridge_entity,
+                            erp_adresse_entity=erp_adresse_entity,
+                            erp_anschrift_entity=erp_anschrift_entity,
+                            address_type=address_type
+                        )
+                        self._remember_in_address_index(erp_anschrift_entity)
+                        return erp_anschrift_entity
+
+                # Otherwise create a new Anschrift
                 self.logger.info("erp_combined_id not provided. Creating new Anschrift...")
                 erp_anschrift_entity = self._create_anschrift(
                     bridge_entity=bridge_entity,
                     erp_adresse_entity=erp_adresse_entity,
                     address_type=address_type
                 )
+                self._remember_in_address_index(erp_anschrift_entity)
                 self.logger.info("New Anschrift created successfully!")
                 return erp_anschrift_entity
         except Exception as error:
@@ -535,7 +603,7 @@ class ERPAdressenController(ERPAbstractController):
 
         try:
             # Map bridge information to ERP address entity
-            erp_anschrift_entity = ERPAnschriftenEntity().map_bridge_to_erp(
+            erp_anschrift_entity = ERPAnschriftenEntity(erp=self._erp.connect()).map_bridge_to_erp(
                 bridge_entity=bridge_entity,
                 erp_adresse_entity=erp_adresse_entity,
                 address_type=address_type
@@ -584,7 +652,7 @@ class ERPAdressenController(ERPAbstractController):
         it back to ERP system.
         """
         try:
-            erp_entity_for_cleanup = ERPAdressenEntity()
+            erp_entity_for_cleanup = ERPAdressenEntity(erp=self._erp.connect())
             found = erp_entity_for_cleanup.find_one(bridge_entity.get_erp_nr())
 
             # If entity found in ERP
@@ -657,7 +725,7 @@ class ERPAdressenController(ERPAbstractController):
             if bridge_entity.get_id_for_erp_ansprechpartner_from_combined_id():
                 print(f"Update Ansprechpartner: {bridge_entity.get_id_for_erp_anschrift_from_combined_id()}")
 
-                erp_ansprechpartner_entity = ERPAnsprechpartnerEntity()
+                erp_ansprechpartner_entity = ERPAnsprechpartnerEntity(erp=self._erp.connect())
                 found = None
 
                 try:
@@ -683,19 +751,45 @@ class ERPAdressenController(ERPAbstractController):
                         erp_adresse_entity=erp_adresse_entity,
                         erp_anschrift_entity=erp_anschrift_entity
                     )
+                self._remember_in_address_index(erp_ansprechpartner_entity)
                 return erp_ansprechpartner_entity
             else:
-                # When ID isn't found, a new entry is created.
-                erp_ansprechpartner_entity = self._create_ansprechpartner(
-                    bridge_entity=bridge_entity,
-                    erp_adresse_entity=erp_adresse_entity,
-                    erp_anschrift_entity=erp_anschrift_entity
-                )
+                # When ID isn't found, look for the same Ansprechpartner of the Anschrift in the address index
+                match = ERPAddressIndexController().find_ansprechpartner(
+                    adr_nr=erp_adresse_entity.get_adrnr(),
+                    ans_nr=erp_anschrift_entity.get_ansnr(),
+                    first_name=bridge_entity.get_first_name(),
+                    last_name=bridge_entity.get_last_name())
+                erp_ansprechpartner_entity = ERPAnsprechpartnerEntity(erp=self._erp.connect()) if match else None
+                if match and erp_ansprechpartner_entity.find_one(
+                        search_value=[match['adr_nr'], match['ans_nr'], match['asp_nr']]):
+                    erp_ansprechpartner_entity = self._update_ansprechpartner(
+                        bridge_entity=bridge_entity,
+                        erp_adresse_entity=erp_adresse_entity,
+                        erp_anschrift_entity=erp_anschrift_entity,
+                        erp_ansprechpartner_entity=erp_ansprechpartner_entity
+                    )
+                else:
+                    # Otherwise a new entry is created.
+                    erp_ansprechpartner_entity = self._create_ansprechpartner(
+                        bridge_entity=bridge_entity,
+                        erp_adresse_entity=erp_adresse_entity,
+                        erp_anschrift_entity=erp_anschrift_entity
+                    )
+            self._remember_in_address_index(erp_ansprechpartner_entity)
             return erp_ansprechpartner_entity
         except Exception as error:
             self.logger.error(f"Error occurred in downsert_ansprechpartner method: {error}")
             return False
 
+    @staticmethod
+    def _remember_in_address_index(erp_entity):
+        """
+        Add an Anschrift or Ansprechpartner written to the ERP to the address index, so the next order matches it.
+        """
+        if erp_entity:
+            ERPAddressIndexController().remember(erp_entity)
+
     def _create_ansprechpartner(self, bridge_entity, erp_adresse_entity, erp_anschrift_entity):
         """
         Method to create an Ansprechpartner entity based on the provided arguments.
@@ -714,7 +808,7 @@ class ERPAdressenController(ERPAbstractController):
                 f"Create Ansprechpartner for Adr: {erp_adresse_entity.get_adrnr()} and Ans: {erp_anschrift_entity.get_ansnr()}")
 
             # Create a new Ansprechpartner entity by mapping the Bridge Entity to the ERP Ansprechpartner entity
-            erp_ansprechpartner_entity = ERPAnsprechpartnerEntity().map_bridge_to_erp(
+            erp_ansprechpartner_entity = ERPAnsprechpartnerEntity(erp=self._erp.connect()).map_bridge_to_erp(
                 bridge_entity=bridge_entity,
                 erp_adresse_entity=erp_adresse_entity,
                 erp_anschrift_entity=erp_anschrift_entity
@@ -760,4 +854,4 @@ class ERPAdressenController(ERPAbstractController):
         print("ERPAdressenController del called.")
         erp_co_ctrl = ERPConnectionController()
 
-        erp_co_ctrl.close()
+        erp_co_ctrl.release()
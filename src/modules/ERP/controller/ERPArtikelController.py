@@ -13,7 +13,10 @@ from src.modules.Bridge.controller.BridgeProductController import BridgeProductC
 from src.modules.Bridge.entities.BridgeTaxEntity import BridgeTaxEntity
 from src.modules.Bridge.entities.BridgeCategoryEntity import BridgeCategoryEntity
 from src.modules.Bridge.entities.BridgeMediaEntity import BridgeMediaEntity, BridgeProductsMediaAssoc
+from src.modules.Bridge.controller.BridgeMediaMetaCache import BridgeMediaMetaCache
+from ..entities.ERPCategoryTree import ERPCategoryTree
 from src.modules.Bridge.controller.BridgePriceController import BridgePriceController
+from src.modules.Bridge.entities.BridgeMarketplaceEntity import BridgeMarketplaceEntity
 
 
 class ERPArtikelController(ERPAbstractController):
@@ -40,6 +43,11 @@ class ERPArtikelController(ERPAbstractController):
             print(f"{key}: {value}")
 
     """
+    lookup_key_field = 'erp_nr'
+    lookup_entity_class = BridgeProductEntity
+    lookup_row_field = "ArtNr"
+    dataset_entity_class = ERPArtikelEntity
+
     def __init__(self, search_value=None, index=None, range_end=None):
         self._search_value = search_value
         self._index = index
@@ -52,8 +60,24 @@ class ERPArtikelController(ERPAbstractController):
             search_value=search_value
         )
 
+    def create_dataset_entity(self, erp):
+        try:
+            self._dataset_entity = ERPArtikelEntity(
+                search_value=self._search_value,
+                index=self._index,
+                erp=erp,
+                range_end=self._range_end)
+        except Exception as e:
+            print(f"Error creating Artikel Dataset: {str(e)}")
+
+    def destroy_dataset_entity(self):
+        print("Artikel destroy dataset")
+        if self._dataset_entity:
+            self._dataset_entity.release_created_dataset()
+        self._dataset_entity = None
+
     def is_in_db(self, bridge_entity_new):
-        bridge_product_entity_in_db = self._bridge_controller.get_entity().query.filter_by(erp_nr=bridge_entity_new.erp_nr).one_or_none()
+        bridge_product_entity_in_db = self.find_in_db(BridgeProductEntity, 'erp_nr', bridge_entity_new.erp_nr)
         if bridge_product_entity_in_db:
             self.logger.info(f"Entity {bridge_entity_new.erp_nr} found in the db!")
             return bridge_product_entity_in_db
@@ -122,9 +146,11 @@ class ERPArtikelController(ERPAbstractController):
             # 1 Upsert price for all marketplaces
             bridge_price_new = self._dataset_entity.map_erp_price_to_bridge()
             if bridge_price_new:
+                lookup_cache = self.get_lookup_cache()
                 BridgePriceController().upsert_price_for_all_marketplaces(
                     bridge_price_entity=bridge_price_new,
-                    bridge_product_entity=bridge_entity
+                    bridge_product_entity=bridge_entity,
+                    marketplaces=lookup_cache.get_all(BridgeMarketplaceEntity) if lookup_cache else None
                 )
             else:
                 print("No prices were mapped from erp -> sw6 for", bridge_entity.get_translation().get_name())
@@ -150,7 +176,7 @@ class ERPArtikelController(ERPAbstractController):
 
         try:
             stschl = self.get_entity().get_stschl()
-            tax_in_db = BridgeTaxEntity.query.filter_by(erp_nr=stschl).one_or_none()
+            tax_in_db = self.find_in_db(BridgeTaxEntity, 'erp_nr', stschl)
             # Wenn die Steuer nicht in der Datenbank gefunden wird, erfolgt ein Sync-Versuch
             if tax_in_db is None:
                 self.logger.warning(f"Tax with ERP number: {stschl} not found in database. Attempting to sync.")
@@ -159,6 +185,7 @@ class ERPArtikelController(ERPAbstractController):
                 tax_ctrl = ERPMandantSteuerController(config.ERPConfig.MANDANT)
                 bridge_tax_entity_new = tax_ctrl.get_entity().map_erp_to_bridge(stschl=stschl)
                 bridge_entity.tax = bridge_tax_entity_new
+                self.add_to_lookup_cache(bridge_tax_entity_new, 'erp_nr')
             else:
                 bridge_entity.tax = tax_in_db
 
@@ -180,7 +207,7 @@ class ERPArtikelController(ERPAbstractController):
             for category_erp_nr in categories_list:
                 # Check DB for existing entries
                 try:
-                    category_entity = BridgeCategoryEntity.query.filter_by(erp_nr=category_erp_nr).one_or_none()
+                    category_entity = self.find_in_db(BridgeCategoryEntity, 'erp_nr', category_erp_nr)
                 except Exception as e:
                     self.logger.error(f"No category found with this ID {category_erp_nr}")
                     continue
@@ -197,22 +224,32 @@ class ERPArtikelController(ERPAbstractController):
 
         return bridge_entity
 
+    def start_lookup_cache(self):
+        super().start_lookup_cache()
+        # Categories may have changed since the last sync, the tree is built again on first use
+        ERPCategoryTree.invalidate()
+
     def _set_media_relation(self, bridge_entity):
         for media_assoc in bridge_entity.media_assocs:
             self.db.session.delete(media_assoc)
-        self.db.session.commit()
+        # Only flush, the commit is done by upsert or once per batch in sync_all_to_bridge
+        self.db.session.flush()
 
         images = self._dataset_entity.get_images_file_list()
+        # The sizes of all images of the article in one go, concurrently if not known yet
+        BridgeMediaMetaCache().prefetch(images or [])
 
         for index, image in enumerate(images):
             bridge_media_entity_new = self._dataset_entity.map_erp_media_to_bridge(media=image, index=index)
 
-            media_in_db = BridgeMediaEntity.query.filter_by(file_name=bridge_media_entity_new.get_file_name()).one_or_none()
+            media_in_db = self.find_in_db(BridgeMediaEntity, 'file_name', bridge_media_entity_new.get_file_name())
 
             if media_in_db:
                 bridge_media_entity_for_db = media_in_db.update(bridge_media_entity_new)
             else:
                 bridge_media_entity_for_db = bridge_media_entity_new
+                # The next product with this image must find it, even before it is flushed
+                self.add_to_lookup_cache(bridge_media_entity_for_db, 'file_name')
 
             # create a new association object
             assoc = BridgeProductsMediaAssoc(sort=index,
@@ -254,6 +291,111 @@ class ERPArtikelController(ERPAbstractController):
                 self.logger.warning("No Umsatz retrieved")
             return ums
 
+    def get_umsatz_matrix(self, return_fields=None, nested_dataset_name="Ums"):
+        """
+        Revenue of the current article for all years, see ERPArtikelEntity.get_nested_ums_matrix.
+        """
+        return self._dataset_entity.get_nested_ums_matrix(return_fields=return_fields,
+                                                          nested_dataset_name=nested_dataset_name)
+
+    def get_umsatz_report(self, return_fields=None, jahre=None, nested_dataset_name="Ums"):
+        """
+        Revenue of all articles of the range in one pass through the dataset.
+
+        :param return_fields: The fields to retrieve, e.g. ["UmsGes"]. Defaults to all fields.
+        :param jahre: Only these years, e.g. [2023, 2024]. Defaults to all years.
+        :param nested_dataset_name: "Ums", "StGUms" or "SLiUms".
+        :return: dict article number -> {year: {field: value}}
+
+        Example:
+            erp_product_controller = ERPArtikelController(search_value="090000", range_end="099999")
+            report = erp_product_controller.get_umsatz_report(return_fields=["UmsGes"], jahre=[2023])
+        """
+        report = {}
+        for nr, ums in self._dataset_entity.iter_nested_matrices(nested_dataset_name=nested_dataset_name,
+                                                                index_field="Jahr",
+                                                                fields=return_fields,
+                                                                key_fields=["ArtNr"]):
+            if jahre is not None:
+                ums = {jahr: values for jahr, values in ums.items() if jahr in jahre}
+            report[nr] = ums
+        self.logger.info(f"Umsatz of {len(report)} articles retrieved.")
+        return report
+
+    """ Prices """
+    def read_prices(self):
+        """
+        Read the prices of all articles of the range in one pass through the dataset.
+
+        :return: dict ArtNr -> price values, see ERPArtikelEntity.map_erp_price_values.
+            Articles with a rebate mismatch are left out.
+        """
+        prices = {}
+        for row in self._dataset_entity.iter_rows(fields=self._dataset_entity.get_price_read_fields()):
+            art_nr = row.get("ArtNr")
+            if not art_nr:
+                continue
+            price_values = self._dataset_entity.map_erp_price_values()
+            if price_values is not None:
+                prices[str(art_nr)] = price_values
+        return prices
+
+    def read_units(self, erp_nrs=None):
+        """
+        Read the raw units (with '%') of the articles of the range in one pass through the dataset,
+        e.g. for the positions of many Vorgänge.
+
+        :param erp_nrs: Optional ArtNrs, only their units are kept.
+        :return: dict ArtNr -> raw unit.
+        """
+        erp_nrs = {str(erp_nr) for erp_nr in erp_nrs} if erp_nrs is not None else None
+        units = {}
+        for row in self._dataset_entity.iter_rows(fields=["ArtNr", "Einh"]):
+            art_nr = row.get("ArtNr")
+            if not art_nr or (erp_nrs is not None and str(art_nr) not in erp_nrs):
+                continue
+            units[str(art_nr)] = self._dataset_entity.get_unit(raw=True)
+        return units
+
+    def sync_prices_to_bridge(self):
+        """
+        Price-only sync. Reads the prices from the Artikel dataset and writes the changed prices of all
+        marketplaces to the bridge in bulk. Translations, categories, media and stock are not touched.
+        Products without a price in the bridge are left to the full article sync.
+
+        :return: dict report with 'read', 'changed', 'missing', 'errors' and 'changed_products'.
+            'changed_products' is a list of dicts with 'product_id', 'erp_nr' and 'sw6_id', their prices
+            need an update in SW6.
+
+        Example:
+            report = ERPArtikelController(search_value="090000", range_end="999999").sync_prices_to_bridge()
+        """
+        report = {'read': 0, 'changed': 0, 'missing': [], 'errors': 0, 'changed_products': []}
+
+        erp = self._erp.connect()
+        self.create_dataset_entity(erp=erp)
+        try:
+            prices = self.read_prices()
+        finally:
+            self.destroy_dataset_entity()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+        report['read'] = len(prices)
+
+        try:
+            delta = BridgePriceController().sync_price_delta(prices)
+        except Exception as e:
+            self.logger.error(f"Error while updating the prices in the bridge: {str(e)}")
+            report['errors'] += 1
+            return report
+
+        report['changed'] = delta['changed_prices']
+        report['missing'] = delta['missing']
+        report['changed_products'] = delta['changed_products']
+        self.logger.info(f"Price sync: {report['read']} read, {report['changed']} prices changed, "
+                         f"{len(report['missing'])} products missing in the bridge.")
+        return report
+
     def get_categories_list(self):
         return self._dataset_entity.get_categories_list()
 
@@ -268,6 +410,61 @@ class ERPArtikelController(ERPAbstractController):
         }
         return infos
 
+    def downsert_many(self, bridge_entities):
+        """
+        Write the special prices of many bridge products back to the ERP, e.g. after a special price campaign.
+        All articles are written in one session and one transaction, each article is found by an index seek
+        and written in one edit/post cycle (see ERPArtikelEntity.map_bridge_to_erp).
+
+        :param bridge_entities: List of BridgeProductEntity.
+        :return: dict bridge product ID -> True or the error message.
+
+        Example:
+            products = BridgeProductEntity.query.filter(BridgeProductEntity.id.in_(product_ids)).all()
+            results = ERPArtikelController().downsert_many(products)
+        """
+        results = {}
+        if not bridge_entities:
+            return results
+
+        # Seeks in index order
+        bridge_entities = sorted(bridge_entities, key=lambda bridge_entity: str(bridge_entity.get_erp_nr()))
+        if not self._search_value:
+            self._search_value = bridge_entities[0].get_erp_nr()
+
+        erp = self._erp.connect()
+        self.create_dataset_entity(erp=erp)
+        try:
+            erp_product_entity = self.get_entity()
+            erp_product_entity.start_transaction()
+            try:
+                for bridge_entity in bridge_entities:
+                    try:
+                        if not erp_product_entity.find_one(bridge_entity.get_erp_nr()):
+                            raise ValueError(f"Article {bridge_entity.get_erp_nr()} not found in the ERP.")
+                        results[bridge_entity.id] = erp_product_entity.map_bridge_to_erp(bridge_entity=bridge_entity)
+                    except Exception as e:
+                        self.logger.error(f"Error writing the price of article {bridge_entity.get_erp_nr()}: {str(e)}")
+                        results[bridge_entity.id] = str(e)
+                if not erp_product_entity.commit():
+                    # The transaction was rolled back, none of the prices is in the ERP
+                    error = "The ERP transaction could not be committed and was rolled back."
+                    for bridge_entity in bridge_entities:
+                        results[bridge_entity.id] = error
+            except Exception as e:
+                self.logger.error(f"Error writing the prices of {len(bridge_entities)} articles: {str(e)}")
+                erp_product_entity.rollback()
+                for bridge_entity in bridge_entities:
+                    results[bridge_entity.id] = str(e)
+        finally:
+            self.destroy_dataset_entity()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+
+        written = sum(1 for result in results.values() if result is True)
+        self.logger.info(f"Prices of {written} of {len(bridge_entities)} articles written to the ERP.")
+        return results
+
     def downsert(self, bridge_entity):
         # This is the update method
         erp_product_entity = self.get_entity()
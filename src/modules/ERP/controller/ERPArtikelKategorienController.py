@@ -9,6 +9,10 @@ from src.modules.Bridge.entities.BridgeCategoryEntity import BridgeCategoryEntit
 
 
 class ERPArtikelKategorienController(ERPAbstractController):
+    lookup_key_field = 'erp_nr'
+    lookup_entity_class = BridgeCategoryEntity
+    lookup_row_field = "Nr"
+
     def __init__(self, search_value=None, index=None, range_end=None):
         self._search_value = search_value
         self._index = index
@@ -24,6 +28,7 @@ class ERPArtikelKategorienController(ERPAbstractController):
     def create_dataset_entity(self, erp):
         try:
             self._dataset_entity = ERPArtikelKategorienEntity(
+                erp=erp,
                 search_value=self._search_value,
                 index=self._index,
                 range_end=self._range_end
@@ -34,6 +39,8 @@ class ERPArtikelKategorienController(ERPAbstractController):
 
     def destroy_dataset_entity(self):
         print("ArtikelKategorien destroy dataset")
+        if self._dataset_entity:
+            self._dataset_entity.release_created_dataset()
         self._dataset_entity = None
 
     def set_relations(self, bridge_entity):
@@ -42,7 +49,7 @@ class ERPArtikelKategorienController(ERPAbstractController):
         return bridge_entity
 
     def is_in_db(self, bridge_entity_new):
-        bridge_entity_in_db = self._bridge_controller.get_entity().query.filter_by(erp_nr=bridge_entity_new.erp_nr).one_or_none()
+        bridge_entity_in_db = self.find_in_db(BridgeCategoryEntity, 'erp_nr', bridge_entity_new.erp_nr)
         if bridge_entity_in_db:
             self.logger.info(f"Entity {bridge_entity_new.erp_nr} found in the db!")
             return bridge_entity_in_db
@@ -1,10 +1,28 @@
 """
 This Object is for creating the connection to büro+ microtech. You can get all different Datasets
+
+The session is kept alive between syncs (see set_session_mode). Before a session is reused,
+GetMandState is called as a cheap liveness probe, dead sessions are reconnected.
+
+A session which isn't used for ERPConfig.IDLE_TIMEOUT seconds after release() is closed, so it
+doesn't hold a büro+ license. COM objects are bound to the thread which created them, so the idle
+timer doesn't close the session itself. It calls the idle handler, the ERP worker registers one
+which closes the session in the worker thread (see set_idle_handler).
+
+Examples:
+    erp_ctrl = ERPConnectionController()
+    result = erp_ctrl.execute(lambda erp: erp.GetMandState())
+    erp_ctrl.release()
+    print(erp_ctrl.get_metrics())
 """
+import threading
+import time
+
 import win32com.client as win32
 import pythoncom
 import pywintypes
 from config import ERPConfig
+from .ERPDatasetPool import ERPDatasetPool
 
 
 class ERPConnectionController:
@@ -17,11 +35,28 @@ class ERPConnectionController:
         if cls._instance is None:
             cls._instance = super(ERPConnectionController, cls).__new__(cls)
             cls._instance._erp = None  # Initialisieren Sie das Attribut hier
+            cls._instance._dataset_pool = None
+            cls._instance._keep_alive = getattr(ERPConfig, "KEEP_ALIVE", True)
+            cls._instance._idle_timeout = getattr(ERPConfig, "IDLE_TIMEOUT", 300)
+            cls._instance._last_used = None
+            cls._instance._idle_timer = None
+            cls._instance._idle_handler = None
+            cls._instance._lock = threading.RLock()
+            cls._instance._metrics = {
+                "connects": 0,
+                "reconnects": 0,
+                "reuses": 0,
+                "probe_failures": 0,
+                "idle_closes": 0,
+                "connect_seconds": 0.0,
+                "work_seconds": 0.0,
+            }
         return cls._instance
 
     def erp_connect(self):
         if self._erp is None:
             print("Connect ERP")
+            start = time.perf_counter()
             erp_config = ERPConfig()
             pythoncom.CoInitialize()
             self._erp = win32.dynamic.Dispatch("BpNT.Application")
@@ -31,10 +66,24 @@ class ERPConnectionController:
             message += f"The Mandant State is:{self._erp.GetMandState()} | Process ID: {self._erp.GetSpecialObject(4).GetAppProcessId()}"
             print(message)
             # self.logger.info(message)
+            self._metrics["connects"] += 1
+            self._metrics["connect_seconds"] += time.perf_counter() - start
+            self._last_used = time.monotonic()
 
     def ensure_connected(self):
-        if self._erp is None:
-            self.erp_connect()
+        with self._lock:
+            self._cancel_idle_timer()
+            if self._erp is not None:
+                if not self.is_alive():
+                    print("ERP session is not alive anymore. Reconnect.")
+                    self._metrics["probe_failures"] += 1
+                    self.close()
+                else:
+                    self._metrics["reuses"] += 1
+
+            if self._erp is None:
+                self.erp_connect()
+            self._last_used = time.monotonic()
 
     def get_erp(self):
         self.ensure_connected()
@@ -44,11 +93,170 @@ class ERPConnectionController:
         self.ensure_connected()
         return self._erp
 
+    """ Session """
+    def set_session_mode(self, keep_alive=True, idle_timeout=None):
+        """
+        Configure whether the session stays open between syncs.
+
+        :param keep_alive: If True, release() keeps the session open, else it closes it.
+        :param idle_timeout: Seconds a session may be unused after release(), before it is closed.
+                             None keeps the current value, 0 keeps idle sessions open.
+        """
+        self._keep_alive = keep_alive
+        if idle_timeout is not None:
+            self._idle_timeout = idle_timeout
+
+    def is_idle(self):
+        if self._last_used is None or not self._idle_timeout:
+            return False
+        return time.monotonic() - self._last_used > self._idle_timeout
+
+    def set_idle_handler(self, handler):
+        """
+        :param handler: Callable without arguments, called by the idle timer in its own thread. It must get
+                        close_if_idle called in the thread which owns the session. None disables idle closes.
+        """
+        self._idle_handler = handler
+
+    def close_if_idle(self):
+        """
+        Close the session, if it wasn't used since the idle timeout. Call it in the thread which owns the session.
+
+        :return: True if the session was closed.
+        """
+        with self._lock:
+            if self._erp is None or not self.is_idle():
+                return False
+            print(f"ERP session was idle for more than {self._idle_timeout}s. Close it.")
+            self._metrics["idle_closes"] += 1
+            self.close()
+            return True
+
+    def _start_idle_timer(self):
+        self._cancel_idle_timer()
+        if self._erp is None or not self._idle_timeout or self._idle_handler is None:
+            return
+        # A bit later than the timeout, so is_idle is true when it fires
+        self._idle_timer = threading.Timer(self._idle_timeout + 1, self._on_idle_timer)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _on_idle_timer(self):
+        handler = self._idle_handler
+        if handler is None or self._erp is None or not self.is_idle():
+            return
+        try:
+            handler()
+        except Exception as e:
+            print(f"Error calling the ERP idle handler: {str(e)}")
+
+    def is_alive(self):
+        """
+        Cheap liveness probe of the current session.
+
+        :return: True if GetMandState answers, False otherwise.
+        """
+        if self._erp is None:
+            return False
+        try:
+            self._erp.GetMandState()
+            return True
+        except (pywintypes.com_error, AttributeError) as e:
+            print(f"ERP liveness probe failed: {str(e)}")
+            return False
+
+    def reconnect(self):
+        """
+        Drop the current session, even if it is broken, and connect again.
+        """
+        with self._lock:
+            self._metrics["reconnects"] += 1
+            try:
+                self.close()
+            except Exception as e:
+                print(f"Error closing broken ERP session: {str(e)}")
+                self._erp = None
+                self._dataset_pool = None
+            return self.connect()
+
+    def execute(self, work, retries=1):
+        """
+        Run work with the connected erp object. On COM errors the session is reconnected
+        and the work is run again.
+
+        :param work: Callable which gets the erp object.
+        :param retries: How many times the work is repeated after a COM error.
+        :return: The result of work.
+        """
+        attempt = 0
+        while True:
+            erp = self.connect()
+            start = time.perf_counter()
+            try:
+                return work(erp)
+            except pywintypes.com_error as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                print(f"COM error in ERP session, reconnect and retry ({attempt}/{retries}): {str(e)}")
+            finally:
+                self._metrics["work_seconds"] += time.perf_counter() - start
+                self._last_used = time.monotonic()
+
+            self.reconnect()
+
+    def release(self):
+        """
+        End of a unit of work. Closes the session, unless the session is kept alive.
+        """
+        if self._keep_alive:
+            with self._lock:
+                self._last_used = time.monotonic()
+                self._start_idle_timer()
+            return True
+        return self.close()
+
+    def get_metrics(self):
+        """
+        :return: dict with the number of connects, reconnects and reuses and the time spent
+                 connecting vs. working in the ERP.
+        """
+        metrics = dict(self._metrics)
+        metrics["keep_alive"] = self._keep_alive
+        metrics["connected"] = self._erp is not None
+        return metrics
+
+    def get_dataset_pool(self, erp=None):
+        """
+        Get the dataset pool of the current connection.
+
+        :param erp: Optional connection object of the caller. If it is not the current connection
+                    (e.g. an old or a fake one), there is no pool for it and None is returned.
+        :return: ERPDatasetPool or None
+        """
+        if self._erp is None or (erp is not None and erp is not self._erp):
+            return None
+        if self._dataset_pool is None or self._dataset_pool.get_erp() is not self._erp:
+            self._dataset_pool = ERPDatasetPool(erp=self._erp)
+        return self._dataset_pool
+
     def close(self):
+        self._cancel_idle_timer()
         if self._erp is not None:
             print("Close ERP")
-            self._erp.DeInit()
-            self._erp = None
+            if self._dataset_pool is not None:
+                self._dataset_pool.clear()
+                self._dataset_pool = None
+            try:
+                self._erp.DeInit()
+            finally:
+                self._erp = None
+                self._last_used = None
             pythoncom.CoInitialize()
             # self.logger.info(f"Erp is set to None. ERP:'{self._erp}'")
             return True
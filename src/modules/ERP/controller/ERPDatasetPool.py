@@ -0,0 +1,126 @@
+"""
+Pool of created ERP datasets. CreateDataSet is an expensive COM call, so datasets
+are handed out per dataset name and index and put back after use instead of being
+created again for every entity.
+
+Examples:
+    pool = ERPConnectionController().get_dataset_pool()
+    lager_ds = pool.acquire("Lager", "ArtNrLagNr")
+    if lager_ds.FindKey("ArtNrLagNr", ["204116", 1]):
+        print(lager_ds.Fields("Pos").AsString)
+    pool.release("Lager", lager_ds, "ArtNrLagNr")
+"""
+import logging
+import threading
+
+
+class ERPDatasetPool:
+    def __init__(self, erp, max_idle_per_key=8):
+        """
+        Initialize the pool for one ERP connection.
+
+        Parameters:
+            erp: The connected BpNT.Application object.
+            max_idle_per_key (int): Maximal number of idle datasets kept per dataset name and index.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._erp = erp
+        self._max_idle_per_key = max_idle_per_key
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "released": 0, "discarded": 0}
+
+    def get_erp(self):
+        return self._erp
+
+    def acquire(self, dataset_name, dataset_index=None):
+        """
+        Hand out a created dataset. Reuses an idle one, otherwise creates a new one.
+
+        Parameters:
+            dataset_name (str): Name of the dataset, e.g. "Artikel".
+            dataset_index (str, optional): Index the dataset is used with.
+
+        Returns:
+            The created dataset object.
+        """
+        key = (dataset_name, dataset_index)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._stats["reused"] += 1
+                return idle.pop()
+
+        dataset = self._erp.DataSetInfos.Item(dataset_name).CreateDataSet()
+        with self._lock:
+            self._stats["created"] += 1
+        return dataset
+
+    def release(self, dataset_name, dataset, dataset_index=None):
+        """
+        Take a dataset back. Pending edits are cancelled, ranges and filters are removed,
+        so the next user gets a clean dataset. Datasets which can't be reset are dropped.
+
+        Parameters:
+            dataset_name (str): Name of the dataset.
+            dataset: The dataset handed out by acquire.
+            dataset_index (str, optional): Index the dataset was acquired with.
+
+        Returns:
+            bool: True if the dataset is back in the pool, False if it was dropped.
+        """
+        if dataset is None:
+            return False
+
+        if not self.reset_dataset(dataset):
+            with self._lock:
+                self._stats["discarded"] += 1
+            return False
+
+        key = (dataset_name, dataset_index)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) >= self._max_idle_per_key:
+                self._stats["discarded"] += 1
+                return False
+            idle.append(dataset)
+            self._stats["released"] += 1
+        return True
+
+    def reset_dataset(self, dataset):
+        """
+        Bring a dataset back to browse state without range and filter.
+
+        Returns:
+            bool: True if the dataset could be reset.
+        """
+        try:
+            # dsEdit = 2, dsInsert = 3
+            if dataset.State in [2, 3]:
+                dataset.Cancel()
+            if dataset.IsRanged():
+                dataset.CancelRange()
+            if dataset.Filtered:
+                dataset.Filtered = False
+                dataset.Filter = ""
+            return True
+        except Exception as e:
+            self.logger.warning(f"Dataset could not be reset and is dropped from the pool: {str(e)}")
+            return False
+
+    def clear(self):
+        """
+        Drop all idle datasets. Is called before the ERP connection is closed.
+        """
+        with self._lock:
+            self._idle = {}
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Counters of created, reused, released and discarded datasets and the number of idle ones.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = sum(len(idle) for idle in self._idle.values())
+        return stats
@@ -3,27 +3,51 @@ from pprint import pprint
 from sqlalchemy.exc import NoResultFound, MultipleResultsFound
 
 import config
+from config import GCBridgeConfig
 from ..controller.ERPAbstractController import ERPAbstractController
 from ..entities.ERPLagerEntity import ERPLagerEntity
+from src.modules.Bridge.controller.BridgeProductController import BridgeProductController
 
 
 class ERPLagerController(ERPAbstractController):
     """
-
+    Examples:
+        Refresh the stock of all articles in the bridge and push the changes to SW6:
+        report = ERPLagerController(search_value="090000", range_end="999999").sync_stock_to_bridge()
+        print(report)
     """
+    dataset_entity_class = ERPLagerEntity
+
+    # The storage location (Pos) is taken from this Lager, the same as ERPArtikelEntity.get_storage_location
+    storage_location_lager_nr = "1"
+
     def __init__(self, search_value=None, index=None, range_end=None):
-        self._dataset_entity = ERPLagerEntity(
-            search_value=search_value,
-            index=index,
-            range_end=range_end
-        )
-        self._bridge_controller = None
+        self._search_value = search_value
+        self._index = index
+        self._range_end = range_end
+        self._dataset_entity = None  # Is created later on
+        self._bridge_controller = BridgeProductController()
 
         super().__init__(
-            dataset_entity=self._dataset_entity,
-            bridge_controller=self._bridge_controller
+            bridge_controller=self._bridge_controller,
+            search_value=search_value
         )
 
+    def create_dataset_entity(self, erp):
+        try:
+            self._dataset_entity = ERPLagerEntity(
+                search_value=self._search_value,
+                index=self._index,
+                erp=erp,
+                range_end=self._range_end)
+        except Exception as e:
+            print(f"Error creating Lager Dataset: {str(e)}")
+
+    def destroy_dataset_entity(self):
+        if self._dataset_entity:
+            self._dataset_entity.release_created_dataset()
+        self._dataset_entity = None
+
     def is_in_db(self, bridge_entity_new):
         pass
 
@@ -32,3 +56,80 @@ class ERPLagerController(ERPAbstractController):
 
     def set_relations(self, bridge_entity):
         pass
+
+    """ Stock """
+    def read_stock(self):
+        """
+        Read stock and storage location of all articles of the range in one pass through the Lager dataset.
+        The stock of an article is the sum over all its Lager entries.
+
+        :return: dict ArtNr -> {'stock': int, 'storage_location': str or None}
+        """
+        stock = {}
+        for row in self._dataset_entity.iter_rows(fields=self._dataset_entity.get_bulk_read_fields()):
+            art_nr = row.get("ArtNr")
+            if not art_nr:
+                continue
+            art_nr = str(art_nr)
+            entry = stock.setdefault(art_nr, {'stock': 0, 'storage_location': None})
+            entry['stock'] += int(row.get("Mge") or 0)
+            if str(row.get("LagNr")) == self.storage_location_lager_nr and row.get("Pos"):
+                entry['storage_location'] = str(row.get("Pos"))
+        return stock
+
+    def sync_stock_to_bridge(self, push_to_sw6=True, batch_size=None):
+        """
+        Stock-only sync. Reads stock and storage location from the Lager dataset, pushes the changed stock
+        to SW6 in batched sync calls and updates the changed products of the bridge in bulk.
+        Prices, translations, categories and media are not touched, so it can run every few minutes.
+
+        The bridge is only updated for the products which were pushed. The others keep their old stock,
+        so the next run finds them changed again and pushes them again.
+
+        :param push_to_sw6: Push the changed stock to SW6. Defaults to True.
+        :param batch_size: Products per SW6 sync call. Defaults to GCBridgeConfig.SW6_SYNC_BATCH_SIZE or 100.
+        :return: dict report with 'read', 'changed', 'pushed' and 'errors'.
+        """
+        if batch_size is None:
+            batch_size = getattr(GCBridgeConfig, "SW6_SYNC_BATCH_SIZE", 100)
+
+        report = {'read': 0, 'changed': 0, 'pushed': 0, 'errors': 0}
+
+        erp = self._erp.connect()
+        self.create_dataset_entity(erp=erp)
+        try:
+            stock = self.read_stock()
+        finally:
+            self.destroy_dataset_entity()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+        report['read'] = len(stock)
+
+        try:
+            changed = self._bridge_controller.get_changed_stock(stock)
+        except Exception as e:
+            self.logger.error(f"Error while comparing the stock with the bridge: {str(e)}")
+            report['errors'] += 1
+            return report
+        report['changed'] = len(changed)
+
+        if push_to_sw6 and changed:
+            # Imported here, the SW6 module imports the bridge and the ERP is imported by create_app first
+            from src.modules.SW6.controller.SW6ProductController import SW6ProductController
+            try:
+                pushed, failed = SW6ProductController().sync_stock_from_bridge(changed, batch_size=batch_size)
+            except Exception as e:
+                self.logger.error(f"Error while pushing the stock to SW6: {str(e)}")
+                pushed, failed = 0, {product['sw6_id'] for product in changed}
+            report['pushed'] = pushed
+            report['errors'] += len(failed)
+            changed = [product for product in changed if not product['sw6_id'] or product['sw6_id'] not in failed]
+
+        try:
+            self._bridge_controller.bulk_update_stock(changed)
+        except Exception as e:
+            self.logger.error(f"Error while updating the stock in the bridge: {str(e)}")
+            report['errors'] += 1
+
+        self.logger.info(f"Stock sync: {report}")
+        return report
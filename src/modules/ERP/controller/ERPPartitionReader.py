@@ -0,0 +1,105 @@
+"""
+Reads one partition (sub-range) of an ERP dataset in its own process with its own COM session.
+Büro+ supports several sessions at once, so the partitions of a long range are read in parallel.
+The rows (bulk read fields and extras, see ERPAbstractEntity.get_bulk_read_extras) are sent in
+chunks to a queue, the single bridge writer in the main process maps and upserts them.
+
+Messages on the queue are dicts with 'kind' and 'partition':
+    total: 'total' rows of the partition
+    rows: 'dataset_name', 'field_types', 'indices', 'index_fields' and 'rows' of one chunk
+    done: 'read' rows
+    error: 'error' message
+
+Examples:
+    See ERPAbstractController.sync_all_to_bridge_parallel
+"""
+import datetime
+import logging
+
+
+class ERPPartitionReader:
+    def __init__(self, entity_class, partition, search_value, range_end, chunk_size=50):
+        """
+        :param entity_class: ERP entity class, e.g. ERPArtikelEntity. It is created with erp, search_value and range_end.
+        :param partition: Number of the partition, sent with every message.
+        :param search_value: Start of the sub-range.
+        :param range_end: End of the sub-range.
+        :param chunk_size: Rows per message.
+        """
+        self.entity_class = entity_class
+        self.partition = partition
+        self.search_value = search_value
+        self.range_end = range_end
+        self.chunk_size = chunk_size
+
+    def run(self, result_queue):
+        """
+        Entry point of the reading process.
+        """
+        # Imported here, the spawned process imports this module before COM is set up
+        from .ERPConnectionController import ERPConnectionController
+
+        logger = logging.getLogger(self.__class__.__name__)
+        erp_connection = ERPConnectionController()
+        read = 0
+        try:
+            erp = erp_connection.connect()
+            entity = self.entity_class(erp=erp, search_value=self.search_value, range_end=self.range_end)
+
+            layout = entity.get_row_layout()
+
+            result_queue.put({'kind': 'total', 'partition': self.partition, 'total': entity.get_range_count() or 0})
+
+            chunk = []
+            for row in entity.iter_rows(fields=list(layout['field_types'])):
+                entity.read_bulk_extras(row)
+                chunk.append({key: self._to_picklable(value) for key, value in row.items()})
+                read += 1
+                if len(chunk) >= self.chunk_size:
+                    result_queue.put(self._rows_message(layout, chunk))
+                    chunk = []
+            if chunk:
+                result_queue.put(self._rows_message(layout, chunk))
+
+            entity.release_created_dataset()
+            result_queue.put({'kind': 'done', 'partition': self.partition, 'read': read})
+
+        except Exception as e:
+            logger.error(f"Partition {self.partition} ({self.search_value} - {self.range_end}) failed: {str(e)}")
+            result_queue.put({'kind': 'error', 'partition': self.partition, 'read': read, 'error': str(e)})
+
+        finally:
+            erp_connection.close()
+
+    def _rows_message(self, layout, rows):
+        return dict(layout, kind='rows', partition=self.partition, rows=rows)
+
+    @staticmethod
+    def _to_picklable(value):
+        # pywintypes datetimes can't be rebuilt everywhere, send plain datetimes
+        if isinstance(value, datetime.datetime):
+            return datetime.datetime(value.year, value.month, value.day,
+                                     value.hour, value.minute, value.second, value.microsecond)
+        return value
+
+    @staticmethod
+    def split_range(search_value, range_end, partitions):
+        """
+        Split a numeric range like '090000' - '999999' into sub-ranges of the same size.
+        The numbers keep the zero padding of range_end.
+
+        :return: List of (search_value, range_end) tuples. The whole range, if it isn't numeric.
+        """
+        try:
+            start = int(search_value)
+            end = int(range_end)
+        except (TypeError, ValueError):
+            return [(search_value, range_end)]
+
+        if partitions < 2 or end <= start:
+            return [(search_value, range_end)]
+
+        width = len(str(range_end))
+        step = -(-(end - start + 1) // partitions)
+        return [(str(sub_start).zfill(width), str(min(sub_start + step - 1, end)).zfill(width))
+                for sub_start in range(start, end + 1, step)]
@@ -1,5 +1,4 @@
 from pprint import pprint
-from datetime import datetime
 # Handbuch 3.1.72
 from .ERPAbstractController import ERPAbstractController
 from .ERPConnectionController import ERPConnectionController
@@ -8,46 +7,52 @@ from .ERPArtikelController import ERPArtikelController
 from src.modules.Bridge.controller.BridgeOrderController import BridgeOrderController
 from src.modules.Bridge.controller.BridgeCustomerController import BridgeCustomerController
 from .ERPAdressenController import ERPAdressenController
+from .ERPAddressIndexController import ERPAddressIndexController
 
 
 class ERPVorgangController(ERPAbstractController):
+    """
+    Examples:
+        Create the Vorgänge of all open bridge orders, which are not in the ERP yet:
+        report = ERPVorgangController().create_open_orders()
+        print(report)
+    """
+    dataset_entity_class = ERPVorgangEntity
+
     def __init__(self, search_value=None, index=None, range_end=None):
-        self._dataset_entity = ERPVorgangEntity(
-            search_value=search_value,
-            index=index,
-            range_end=range_end
-        )
+        self._search_value = search_value
+        self._index = index
+        self._range_end = range_end
+        self._dataset_entity = None  # Is created later on
         self._bridge_controller = BridgeOrderController()
 
         super().__init__(
-            dataset_entity=self._dataset_entity,
             bridge_controller=self._bridge_controller,
             search_value=search_value
         )
 
-    def downsert(self, bridge_entity):
-        """ Timer Start """
-        before = datetime.now()
-        """ Timer Start """
-
-        # 1 downsert customer
-        bridge_customer_entity = ERPAdressenController().sync_order_addresses_from_bridge(
-            bridge_entity=bridge_entity.customer,
-            bridge_marketplace_entity=bridge_entity.marketplace
-        )
-        #
-        # print(f"Customer {bridge_customer_entity.get_erp_nr()} ready. Now to the orders:")
+    def create_dataset_entity(self, erp):
+        try:
+            self._dataset_entity = ERPVorgangEntity(
+                search_value=self._search_value,
+                index=self._index,
+                erp=erp,
+                range_end=self._range_end)
+        except Exception as e:
+            print(f"Error creating Vorgang Dataset: {str(e)}")
+
+    def destroy_dataset_entity(self):
+        if self._dataset_entity:
+            self._dataset_entity.release_created_dataset()
+        self._dataset_entity = None
 
-        # 2 downsert order
-        # for detail in bridge_entity.order_details:
-        #     print(f"ArtNr: {detail.get_erp_nr()} Quantity: {detail.get_quantity()} - Sum: {detail.get_total_price()} ")
-        erp_vorgang_entity = ERPVorgangController().sync_one_from_bridge(bridge_entity=bridge_entity)
+    def downsert(self, bridge_entity):
+        """
+        Create the Vorgang of one bridge order, including its customer.
 
-        """ Timer End """
-        after = datetime.now()
-        time = after - before
-        print(f"The script took {time}")
-        """ Timer End """
+        :return: dict report, see create_orders.
+        """
+        return self.create_orders(bridge_orders=[bridge_entity])
 
     def get_entity(self):
         return self._dataset_entity
@@ -62,29 +67,123 @@ class ERPVorgangController(ERPAbstractController):
     Downsert
     """
     def sync_one_from_bridge(self, bridge_entity):
-        erp_vorgang_entity = self.get_entity()
-        erp_vorgang_entity.create_new_order(bridge_entity=bridge_entity)
-
-        # erp_vorgang_beleg_nr = erp_vorgang_entity.get_beleg_nr()
-        # print("Vorgang angelegt mit BelegNr:", erp_vorgang_beleg_nr)
-        #
-        # for detail in bridge_entity.order_details:
-        #     erp_artikel_entity = ERPArtikelController().get_entity()
-        #     unit = detail.get_unit()
-        #     found = erp_artikel_entity.find_one(search_value=detail.get_erp_nr())
-        #     if found:
-        #         unit = erp_artikel_entity.get_unit(raw=True)
-        #         print("Unit:", unit)
-        #
-        #     erp_vorgang_positionen_obj.Positionen.Add(detail.get_quantity(), unit, detail.get_erp_nr())
-        #
-        # erp_vorgang_positionen_obj.Post()
-
-        return True
-
-    def __del__(self):
-        print("ERPVorgangEnity del called.")
-        erp_co_ctrl = ERPConnectionController()
-
-        erp_co_ctrl.close()
-
+        return self.create_orders(bridge_orders=[bridge_entity], sync_customers=False)
+
+    def create_open_orders(self, order_ids=None):
+        """
+        Create the Vorgänge of all open bridge orders, which have no erp_order_id yet.
+
+        :param order_ids: Optional list of bridge order IDs to restrict the orders to.
+        :return: dict report, see create_orders.
+        """
+        bridge_orders = self._bridge_controller.get_orders_without_erp_order(order_ids=order_ids)
+        return self.create_orders(bridge_orders=bridge_orders)
+
+    def create_orders(self, bridge_orders, sync_customers=True):
+        """
+        Create the Vorgänge of many bridge orders in one ERP session.
+
+        The address index is refreshed if due, then the customers are synced. Then the units of all ordered articles are read in one ranged
+        pass through the Artikel dataset and the Vorgänge are appended one after the other to the same
+        soVorgang object. An order is skipped, if it has an erp_order_id or a Vorgang with its AuftrNr
+        exists already, so the import can be run again after a failure. The BelegNr of all orders are
+        written to the bridge in one commit.
+
+        :param bridge_orders: List of BridgeOrderEntity.
+        :param sync_customers: Sync the customers and their addresses to the ERP first. Defaults to True.
+        :return: dict report with 'created' and 'existing' (bridge order ID -> BelegNr) and
+            'errors' (bridge order ID -> error message).
+        """
+        report = {'created': {}, 'existing': {}, 'errors': {}}
+
+        if sync_customers and any(not bridge_order.get_erp_order_id() for bridge_order in bridge_orders or []):
+            # Once per import, before any customer is synced. The refresh commits the session.
+            try:
+                ERPAddressIndexController().refresh_if_due()
+            except Exception as e:
+                self.logger.error(f"Error refreshing the address index, matching with the last state: {str(e)}")
+
+        pending = []
+        for bridge_order in bridge_orders or []:
+            if bridge_order.get_erp_order_id():
+                report['existing'][bridge_order.id] = bridge_order.get_erp_order_id()
+                continue
+            if sync_customers:
+                try:
+                    ERPAdressenController().sync_order_addresses_from_bridge(
+                        bridge_entity=bridge_order.customer,
+                        bridge_marketplace_entity=bridge_order.marketplace
+                    )
+                except Exception as e:
+                    self.logger.error(f"Error syncing the customer of order {bridge_order.get_order_number()}: {str(e)}")
+                    report['errors'][bridge_order.id] = str(e)
+                    continue
+            pending.append(bridge_order)
+
+        if not pending:
+            return report
+
+        erp_nrs = sorted({str(detail.get_erp_nr()) for bridge_order in pending
+                          for detail in bridge_order.order_details if detail.get_erp_nr()})
+
+        erp = self._erp.connect()
+        self.create_dataset_entity(erp=erp)
+        try:
+            units = self.read_units(erp=erp, erp_nrs=erp_nrs)
+            erp_vorgang_entity = self.get_entity()
+            order = erp_vorgang_entity.get_erp_app_object_vorgang()
+            for bridge_order in pending:
+                auftr_nr = ERPVorgangEntity.get_auftr_nr(bridge_order)
+                try:
+                    beleg_nr = erp_vorgang_entity.find_beleg_nr_by_auftr_nr(auftr_nr)
+                    if beleg_nr:
+                        self.logger.info(f"Vorgang {beleg_nr} with AuftrNr {auftr_nr} exists already.")
+                        report['existing'][bridge_order.id] = beleg_nr
+                    else:
+                        beleg_nr = erp_vorgang_entity.create_new_order(bridge_entity=bridge_order, order=order,
+                                                                       units=units)
+                        if not beleg_nr:
+                            raise ValueError(f"Vorgang for order {auftr_nr} could not be created.")
+                        report['created'][bridge_order.id] = beleg_nr
+                    bridge_order.set_erp_order_id(beleg_nr)
+                except Exception as e:
+                    self.logger.error(f"Error creating the Vorgang of order {auftr_nr}: {str(e)}")
+                    report['errors'][bridge_order.id] = str(e)
+        finally:
+            self.destroy_dataset_entity()
+            # Keeps the session open for the next sync, if the connection is in keep alive mode
+            self._erp.release()
+
+        try:
+            self.db.session.commit()
+        except Exception as e:
+            # The Vorgänge are in the ERP, the next run finds them by their AuftrNr
+            self.db.session.rollback()
+            self.logger.error(f"Error writing the erp_order_id of {len(pending)} orders to the bridge: {str(e)}")
+            for bridge_order_id in list(report['created']) + list(report['existing']):
+                report['errors'][bridge_order_id] = str(e)
+
+        self.logger.info(f"Orders to ERP: {len(report['created'])} created, {len(report['existing'])} existing, "
+                         f"{len(report['errors'])} errors.")
+        return report
+
+    def read_units(self, erp, erp_nrs):
+        """
+        Read the units of the ordered articles in one ranged pass, instead of one seek per position.
+
+        :param erp: The connected erp object.
+        :param erp_nrs: Sorted list of ArtNrs.
+        :return: dict ArtNr -> raw unit.
+        """
+        if not erp_nrs:
+            return {}
+        erp_product_controller = ERPArtikelController(search_value=erp_nrs[0], range_end=erp_nrs[-1])
+        erp_product_controller.create_dataset_entity(erp=erp)
+        try:
+            return erp_product_controller.read_units(erp_nrs=erp_nrs)
+        except Exception as e:
+            # The positions read their unit one by one then
+            self.logger.error(f"Error reading the units of {len(erp_nrs)} articles: {str(e)}")
+            return {}
+        finally:
+            erp_product_controller.destroy_dataset_entity()
@@ -0,0 +1,406 @@
+"""
+The ERP worker owns the COM connection to büro+ microtech. COM objects are bound to the thread
+which created them, so Flask views and sync jobs don't talk to the ERP themselves. They submit
+typed requests to the queue of the worker, the worker runs them one after another in its own thread.
+
+Examples:
+    # In create_app
+    ERPWorkerController().start(app)
+
+    # Wait for the result, e.g. in a view. Raises ERPWorkerBusy, if the worker doesn't answer in time.
+    bridge_product_id = ERPWorkerController().call(ERPWorkerRequest.READ_ARTICLE, erp_nr="204116")
+
+    # Don't wait, e.g. for long syncs
+    request = ERPWorkerController().submit(ERPWorkerRequest.SYNC_ALL_ARTICLES, search_value="1", range_end="999999")
+    print(ERPWorkerController().get_request_state(request.id))
+
+Requests which don't use the ERP (ERPWorkerRequest.NO_ERP_KINDS, e.g. the SW6 price push) don't wait
+behind the ERP syncs. They run in a background thread of their own, with the same request states.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError, ThreadPoolExecutor
+
+import pythoncom
+
+from config import ERPConfig
+from .ERPConnectionController import ERPConnectionController
+
+# Default of ERPWorkerController.call, None already means "wait until it is done"
+DEFAULT_CALL_TIMEOUT = object()
+
+
+class ERPWorkerRequest:
+    READ_ARTICLE = "read_article"
+    SYNC_ALL_ARTICLES = "sync_all_articles"
+    SYNC_CHANGED_ARTICLES = "sync_changed_articles"
+    SYNC_STOCK = "sync_stock"
+    SYNC_PRICES = "sync_prices"
+    WRITE_PRICE = "write_price"
+    WRITE_PRICES = "write_prices"
+    CREATE_VORGANG = "create_vorgang"
+    CREATE_OPEN_VORGAENGE = "create_open_vorgaenge"
+    REFRESH_ADDRESS_INDEX = "refresh_address_index"
+    # No ERP request, the worker is the background queue of the app, e.g. for pushes after a price change
+    PUSH_PRICES_TO_SW6 = "push_prices_to_sw6"
+    # Submitted by the idle timer of the ERPConnectionController, the session must be closed in the worker thread
+    CLOSE_IDLE_SESSION = "close_idle_session"
+
+    # Requests which don't use the ERP session. They run outside of the COM worker queue
+    # and don't release the session.
+    NO_ERP_KINDS = [PUSH_PRICES_TO_SW6]
+
+    # Requests of a user waiting in a view are taken from the queue before the queued syncs
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BATCH = 1
+    INTERACTIVE_KINDS = [READ_ARTICLE, WRITE_PRICE, CREATE_VORGANG]
+
+    def __init__(self, kind, payload=None, priority=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.payload = payload or {}
+        if priority is None:
+            priority = self.PRIORITY_INTERACTIVE if kind in self.INTERACTIVE_KINDS else self.PRIORITY_BATCH
+        self.priority = priority
+        self.future = Future()
+        self.state = "queued"
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ERPWorkerBusy(Exception):
+    """
+    Raised by ERPWorkerController.call, if the request is not done within the timeout, e.g. behind a long sync.
+    The request stays in the queue, its state is available by request_id.
+    """
+
+    def __init__(self, request):
+        super().__init__(f"ERP worker request {request.kind} is still {request.state}, id: {request.id}")
+        self.request_id = request.id
+        self.state = request.state
+
+
+class ERPWorkerController:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ERPWorkerController, cls).__new__(cls)
+            cls._instance.logger = logging.getLogger(cls.__name__)
+            cls._instance._app = None
+            # (priority, sequence, request), the sequence keeps the order within a priority
+            cls._instance._queue = queue.PriorityQueue()
+            cls._instance._sequence = itertools.count()
+            cls._instance._call_timeout = getattr(ERPConfig, "WORKER_CALL_TIMEOUT", 30)
+            cls._instance._thread = None
+            # Runs the NO_ERP_KINDS requests, one after the other
+            cls._instance._background = None
+            cls._instance._requests = OrderedDict()
+            cls._instance._max_finished_requests = 100
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    """ Lifecycle """
+    def start(self, app):
+        """
+        Start the worker thread. Requests are executed inside the app context of the given app.
+
+        :param app: The Flask app.
+        """
+        with self._lock:
+            if self.is_running():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name="ERPWorker", daemon=True)
+            self._thread.start()
+            ERPConnectionController().set_idle_handler(lambda: self.submit(ERPWorkerRequest.CLOSE_IDLE_SESSION))
+            print("ERP worker started")
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker after the queued requests are done. The ERP session is closed by the worker.
+        """
+        if not self.is_running():
+            return
+        ERPConnectionController().set_idle_handler(None)
+        self._queue.put((ERPWorkerRequest.PRIORITY_BATCH + 1, next(self._sequence), None))
+        self._thread.join(timeout=timeout)
+        if self._background is not None:
+            self._background.shutdown(wait=False)
+            self._background = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_worker_thread(self):
+        return threading.current_thread() is self._thread
+
+    """ Requests """
+    def submit(self, kind, priority=None, **payload):
+        """
+        Put a request into the queue.
+
+        If the worker isn't running (scripts, shell) or the caller is the worker itself,
+        the request is executed directly in the calling thread.
+
+        :param kind: One of the ERPWorkerRequest kinds.
+        :param priority: ERPWorkerRequest.PRIORITY_INTERACTIVE or PRIORITY_BATCH. Defaults by the kind.
+        :param payload: Keyword arguments for the handler of the kind.
+        :return: ERPWorkerRequest, its future holds the result.
+        """
+        if kind not in self._get_handlers():
+            raise ValueError(f"Unknown ERP worker request: {kind}")
+
+        request = ERPWorkerRequest(kind=kind, payload=payload, priority=priority)
+        self._remember(request)
+
+        if not self.is_running() or self.is_worker_thread():
+            self._execute(request)
+        elif kind in ERPWorkerRequest.NO_ERP_KINDS:
+            # E.g. the SW6 push of a campaign, it must not wait behind an article sync of an hour
+            self._get_background().submit(self._execute_in_app_context, request)
+        else:
+            self._queue.put((request.priority, next(self._sequence), request))
+        return request
+
+    def call(self, kind, timeout=DEFAULT_CALL_TIMEOUT, **payload):
+        """
+        Submit a request and wait for its result.
+
+        :param timeout: Seconds to wait. Defaults to ERPConfig.WORKER_CALL_TIMEOUT or 30, None waits until it is done.
+        :return: The result of the handler. Exceptions of the handler are raised again.
+        :raises ERPWorkerBusy: If the request is not done within the timeout. It keeps running in the worker.
+        """
+        if timeout is DEFAULT_CALL_TIMEOUT:
+            timeout = self._call_timeout
+        request = self.submit(kind, **payload)
+        try:
+            return request.future.result(timeout=timeout)
+        except TimeoutError:
+            raise ERPWorkerBusy(request)
+
+    def get_request_state(self, request_id):
+        """
+        :return: dict with the state of a queued, running or recently finished request, None if unknown.
+        """
+        request = self._requests.get(request_id)
+        return request.to_dict() if request else None
+
+    def get_queue_size(self):
+        return self._queue.qsize()
+
+    def _remember(self, request):
+        with self._lock:
+            self._requests[request.id] = request
+            while len(self._requests) > self._max_finished_requests:
+                oldest_id, oldest = next(iter(self._requests.items()))
+                if oldest.state in ["queued", "running"]:
+                    break
+                del self._requests[oldest_id]
+
+    def _run(self):
+        pythoncom.CoInitialize()
+        try:
+            while True:
+                _, _, request = self._queue.get()
+                if request is None:
+                    break
+                try:
+                    with self._app.app_context():
+                        self._execute(request)
+                finally:
+                    self._queue.task_done()
+        finally:
+            ERPConnectionController().close()
+            pythoncom.CoUninitialize()
+            print("ERP worker stopped")
+
+    def _get_background(self):
+        with self._lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="BridgeBackground")
+            return self._background
+
+    def _execute_in_app_context(self, request):
+        with self._app.app_context():
+            self._execute(request)
+
+    def _execute(self, request):
+        request.state = "running"
+        request.started_at = time.time()
+        try:
+            result = self._get_handlers()[request.kind](**request.payload)
+            request.state = "done"
+            request.future.set_result(result)
+        except Exception as e:
+            self.logger.error(f"ERP worker request {request.kind} failed: {str(e)}")
+            request.state = "error"
+            request.error = str(e)
+            request.future.set_exception(e)
+        finally:
+            request.finished_at = time.time()
+            if request.kind not in ERPWorkerRequest.NO_ERP_KINDS + [ERPWorkerRequest.CLOSE_IDLE_SESSION]:
+                # Keeps the session open for the next request, if the connection is in keep alive mode
+                ERPConnectionController().release()
+
+    """ Handlers """
+    def _get_handlers(self):
+        return {
+            ERPWorkerRequest.READ_ARTICLE: self._read_article,
+            ERPWorkerRequest.SYNC_ALL_ARTICLES: self._sync_all_articles,
+            ERPWorkerRequest.SYNC_CHANGED_ARTICLES: self._sync_changed_articles,
+            ERPWorkerRequest.SYNC_STOCK: self._sync_stock,
+            ERPWorkerRequest.SYNC_PRICES: self._sync_prices,
+            ERPWorkerRequest.WRITE_PRICE: self._write_price,
+            ERPWorkerRequest.WRITE_PRICES: self._write_prices,
+            ERPWorkerRequest.CREATE_VORGANG: self._create_vorgang,
+            ERPWorkerRequest.CREATE_OPEN_VORGAENGE: self._create_open_vorgaenge,
+            ERPWorkerRequest.REFRESH_ADDRESS_INDEX: self._refresh_address_index,
+            ERPWorkerRequest.PUSH_PRICES_TO_SW6: self._push_prices_to_sw6,
+            ERPWorkerRequest.CLOSE_IDLE_SESSION: self._close_idle_session,
+        }
+
+    def _read_article(self, erp_nr):
+        """
+        Read one article from the ERP into the bridge.
+
+        :return: ID of the bridge product.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        return ERPArtikelController(search_value=erp_nr).sync_one_to_bridge()
+
+    def _sync_all_articles(self, search_value, range_end=None, set_relations=True, partitions=None):
+        """
+        :param partitions: If set, the range is read by this many processes in parallel.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        erp_product_controller = ERPArtikelController(search_value=search_value, range_end=range_end)
+        if partitions:
+            return erp_product_controller.sync_all_to_bridge_parallel(partitions=partitions,
+                                                                      set_relations=set_relations)
+        return erp_product_controller.sync_all_to_bridge(set_relations=set_relations)
+
+    def _sync_changed_articles(self, search_value=None, range_end=None, set_relations=True, full_rescan=False):
+        """
+        :return: dict report of ERPAbstractController.sync_changed_to_bridge.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        return ERPArtikelController(search_value=search_value, range_end=range_end).sync_changed_to_bridge(
+            set_relations=set_relations, full_rescan=full_rescan)
+
+    def _sync_stock(self, search_value=None, range_end=None, push_to_sw6=True):
+        """
+        :return: dict report of ERPLagerController.sync_stock_to_bridge.
+        """
+        from .ERPLagerController import ERPLagerController
+        return ERPLagerController(search_value=search_value, range_end=range_end).sync_stock_to_bridge(
+            push_to_sw6=push_to_sw6)
+
+    def _sync_prices(self, search_value=None, range_end=None):
+        """
+        :return: dict report of ERPArtikelController.sync_prices_to_bridge.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        return ERPArtikelController(search_value=search_value, range_end=range_end).sync_prices_to_bridge()
+
+    def _write_price(self, bridge_product_id):
+        """
+        Write the price of a bridge product back to the ERP.
+        The product is loaded again in the worker, entities of the caller's session are not passed around.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        from src.modules.Bridge.entities.BridgeProductEntity import BridgeProductEntity
+
+        product = BridgeProductEntity.query.get(bridge_product_id)
+        if product is None:
+            raise ValueError(f"No product found in bridge by ID:{bridge_product_id}")
+
+        erp_product_controller = ERPArtikelController(search_value=product.get_erp_nr())
+        erp_product_controller.create_dataset_entity(erp=ERPConnectionController().connect())
+        try:
+            return erp_product_controller.sync_one_from_bridge(bridge_entity=product)
+        finally:
+            erp_product_controller.destroy_dataset_entity()
+
+    def _write_prices(self, bridge_product_ids):
+        """
+        Write the prices of many bridge products back to the ERP in one transaction,
+        see ERPArtikelController.downsert_many.
+
+        :return: dict bridge product ID -> True or the error message.
+        """
+        from .ERPArtikelController import ERPArtikelController
+        from src.modules.Bridge.entities.BridgeProductEntity import BridgeProductEntity
+
+        products = BridgeProductEntity.query.filter(BridgeProductEntity.id.in_(bridge_product_ids)).all()
+        results = ERPArtikelController().downsert_many(products)
+        for bridge_product_id in bridge_product_ids:
+            results.setdefault(bridge_product_id, f"No product found in bridge by ID:{bridge_product_id}")
+        return results
+
+    def _create_vorgang(self, bridge_order_id):
+        """
+        Create the Vorgang of a bridge order in the ERP.
+        """
+        from .ERPVorgangController import ERPVorgangController
+        from src.modules.Bridge.entities.BridgeOrderEntity import BridgeOrderEntity
+
+        bridge_order = BridgeOrderEntity.query.get(bridge_order_id)
+        if bridge_order is None:
+            raise ValueError(f"No order found in bridge by ID:{bridge_order_id}")
+
+        return ERPVorgangController().downsert(bridge_entity=bridge_order)
+
+    def _create_open_vorgaenge(self, order_ids=None):
+        """
+        Create the Vorgänge of all open bridge orders, which are not in the ERP yet.
+
+        :param order_ids: Optional list of bridge order IDs to restrict the orders to.
+        :return: dict report of ERPVorgangController.create_orders.
+        """
+        from .ERPVorgangController import ERPVorgangController
+        return ERPVorgangController().create_open_orders(order_ids=order_ids)
+
+    def _refresh_address_index(self, full_rescan=False):
+        """
+        :return: dict report of ERPAddressIndexController.refresh.
+        """
+        from .ERPAddressIndexController import ERPAddressIndexController
+        return ERPAddressIndexController().refresh(full_rescan=full_rescan)
+
+    def _push_prices_to_sw6(self, bridge_product_ids):
+        """
+        Push the prices of many bridge products to SW6, see SW6ProductController.sync_prices_from_bridge.
+
+        :return: dict with 'pushed' and 'errors'.
+        """
+        from config import GCBridgeConfig
+        from src.modules.SW6.controller.SW6ProductController import SW6ProductController
+        pushed, errors = SW6ProductController().sync_prices_from_bridge(
+            bridge_product_ids, batch_size=getattr(GCBridgeConfig, "SW6_SYNC_BATCH_SIZE", 100))
+        return {'pushed': pushed, 'errors': errors}
+
+    def _close_idle_session(self):
+        """
+        :return: True if the session was closed. A request run since the timer fired keeps it open.
+        """
+        return ERPConnectionController().close_if_idle()
@@ -21,14 +21,20 @@ from pprint import pprint
 from typing import List, Union, Tuple, Any, Dict
 # Is used to get the basename of the image
 import os
+import time
 from abc import abstractmethod
-import requests
+from contextlib import contextmanager
 import yaml
 from typing_extensions import deprecated
 
 from ..ERPCoreController import ERPCoreController
+from ..controller.ERPConnectionController import ERPConnectionController
+from .ERPFakeDataset import ERPFakeDataset
+from .ERPRowReplay import ERPRowReplayDataset
+from .ERPSnapshot import ERPSnapshotWriter
 from config import GCBridgeConfig
 from ...Bridge.entities.BridgeMediaEntity import BridgeMediaEntity
+from ...Bridge.controller.BridgeMediaMetaCache import BridgeMediaMetaCache
 
 
 class ERPAbstractEntity(ERPCoreController):
@@ -43,6 +49,47 @@ class ERPAbstractEntity(ERPCoreController):
         created_dataset: Cached created dataset object.
     """
 
+    # Field Types and how to read them:
+    field_types_to_read = {
+        'WideString': 'AsString',
+        'Float': 'AsFloat',
+        'Blob': 'Text',
+        'Date': 'AsDatetime',
+        'DateTime': 'AsDatetime',
+        'Integer': 'AsInteger',
+        'Boolean': 'AsInteger',  # AsBoolean: True/False | AsInteger: 1/0
+        'Byte': 'AsInteger',
+        'Info': 'Text',
+        'String': 'AsString',
+        'Double': 'AsString',
+        'AutoInc': 'AsInteger'
+    }
+    # Field types and how to write them
+    field_types_to_write = {
+        'WideString': 'AsString',
+        'Float': 'AsFloat',
+        'Blob': 'Text',
+        'Date': 'AsString',
+        'DateTime': 'AsString',
+        'Integer': 'AsInteger',
+        'Boolean': 'AsInteger',  # AsBoolean: True/False | AsInteger: 1/0
+        'Byte': 'AsInteger',
+        'Info': 'Text',
+        'String': 'AsString',
+        'Double': 'AsString'
+    }
+
+    # Process wide field descriptors per dataset name, shared by all entities.
+    # Built lazily by get_field_descriptors and dropped when the ERP connection changes.
+    _field_descriptor_cache = {}
+    _field_descriptor_erp = None
+
+    # Process wide write timings per (dataset name, field name): [count, seconds]
+    _field_write_stats = {}
+
+    # Returned by get_prefetched, if a value was not prefetched for the current row
+    NOT_PREFETCHED = object()
+
     def __init__(self,
                  dataset_name,
                  dataset_index,
@@ -136,19 +183,21 @@ class ERPAbstractEntity(ERPCoreController):
             raise e
 
         try:
-            #4 Initialize created dataset
-            self._created_dataset = None
-            self.set_created_dataset()
+            #4 Set the Index of the Dataset
+            self._dataset_index = None
+            self.set_dataset_index(dataset_index=dataset_index)
         except Exception as e:
-            self.logger.error(f"Failed to initialize created dataset: {str(e)}")
+            self.logger.error(f"Failed to set dataset index: {str(e)}")
             raise e
 
         try:
-            #5 Set the Index of the Dataset
-            self._dataset_index = None
-            self.set_dataset_index(dataset_index=dataset_index)
+            #5 Initialize created dataset. The index is the key in the dataset pool
+            self._created_dataset = None
+            self._pooled_dataset = None
+            self._pooled_dataset_key = None
+            self.set_created_dataset()
         except Exception as e:
-            self.logger.error(f"Failed to set dataset index: {str(e)}")
+            self.logger.error(f"Failed to initialize created dataset: {str(e)}")
             raise e
 
         try:
@@ -192,44 +241,13 @@ class ERPAbstractEntity(ERPCoreController):
         try:
             # Initialize nested dataset as none until it is set
             self._nested_dataset = None
+            # Nested datasets and their field readers by name, they follow the cursor of the created dataset
+            self._nested_datasets = {}
+            self._nested_readers = {}
         except Exception as e:
             self.logger.error(f"Failed to initialize nested dataset: {str(e)}")
             raise e
 
-        try:
-            # Field Types and how to read them:
-            self.field_types_to_read = {
-                'WideString': 'AsString',
-                'Float': 'AsFloat',
-                'Blob': 'Text',
-                'Date': 'AsDatetime',
-                'DateTime': 'AsDatetime',
-                'Integer': 'AsInteger',
-                'Boolean': 'AsInteger',  # AsBoolean: True/False | AsInteger: 1/0
-                'Byte': 'AsInteger',
-                'Info': 'Text',
-                'String': 'AsString',
-                'Double': 'AsString',
-                'AutoInc': 'AsInteger'
-            }
-            # Field types and how to write them
-            self.field_types_to_write = {
-                'WideString': 'AsString',
-                'Float': 'AsFloat',
-                'Blob': 'Text',
-                'Date': 'AsString',
-                'DateTime': 'AsString',
-                'Integer': 'AsInteger',
-                'Boolean': 'AsInteger',  # AsBoolean: True/False | AsInteger: 1/0
-                'Byte': 'AsInteger',
-                'Info': 'Text',
-                'String': 'AsString',
-                'Double': 'AsString'
-            }
-        except Exception as e:
-            self.logger.error(f"Failed to initialize field types to read or write: {str(e)}")
-            raise e
-
         try:
             # Holds the current state of the dataset:
             self._dataset_state = None
@@ -243,6 +261,14 @@ class ERPAbstractEntity(ERPCoreController):
             # by the self.get_dataset_fields
             self._dataset_fields = None
 
+            # Holds the values of the current row while iterating with iter_rows.
+            # get_ returns these values without asking the ERP again.
+            self._current_row = None
+
+            # Setters per field of the created dataset, see get_field_setter
+            self._field_setters = {}
+            self._field_setters_dataset = None
+
             # self.logger.info("%s initialized successfully for dataset: %s", self.__class__.__name__, dataset_name)
 
         except Exception as e:
@@ -353,17 +379,45 @@ class ERPAbstractEntity(ERPCoreController):
     def set_created_dataset(self) -> None:
         """
         Create and set the dataset using the dataset name.
+        The dataset comes from the dataset pool of the connection, if there is one.
         """
         try:
             if self.get_dataset_name():
-                erp = self.get_dataset_infos()
-                self._created_dataset = erp.Item(self.get_dataset_name()).CreateDataSet()
+                pool = ERPConnectionController().get_dataset_pool(erp=self._erp)
+                if pool:
+                    self._created_dataset = pool.acquire(self.get_dataset_name(), self._dataset_index)
+                    self._pooled_dataset = self._created_dataset
+                    self._pooled_dataset_key = (self.get_dataset_name(), self._dataset_index)
+                else:
+                    erp = self.get_dataset_infos()
+                    self._created_dataset = erp.Item(self.get_dataset_name()).CreateDataSet()
             else:
                 raise ValueError("Dataset name is not set. Cannot create dataset.")
         except Exception as e:
             self.logger.error(f"Error creating dataset for {self.get_dataset_name()}: {str(e)}")
             raise
 
+    def release_created_dataset(self) -> None:
+        """
+        Give the pooled dataset back to the dataset pool. The pool resets range and filter.
+        Call it when the entity is no longer needed, e.g. for lookups in loops.
+        """
+        if self._pooled_dataset is None:
+            return
+
+        pool = ERPConnectionController().get_dataset_pool(erp=self._erp)
+        if pool:
+            dataset_name, dataset_index = self._pooled_dataset_key
+            pool.release(dataset_name, self._pooled_dataset, dataset_index)
+
+        if self._created_dataset is self._pooled_dataset:
+            self._created_dataset = None
+        self._pooled_dataset = None
+        self._found = None
+        self._nested_dataset = None
+        self._nested_datasets = {}
+        self._nested_readers = {}
+
     def get_created_dataset(self) -> object: # You can replace 'Any' with the specific type of the dataset if known.
         """
         Retrieve the created dataset.
@@ -504,6 +558,73 @@ class ERPAbstractEntity(ERPCoreController):
         else:
             return True
 
+    def get_filter(self) -> Union[str, None]:
+        """
+        Returns:
+            The active filter expression of the dataset or None if the dataset is not filtered.
+        """
+        if self._created_dataset.Filtered and self._created_dataset.Filter:
+            return self._created_dataset.Filter
+        return None
+
+    """ Changed Since """
+    def get_index_starting_with(self, field_name: str) -> Union[str, None]:
+        """
+        Find an index whose first field is the given field.
+
+        Parameters:
+            field_name: The name of the field, e.g. 'LtzAend'.
+
+        Returns:
+            The name of the index or None if there is no such index.
+        """
+        try:
+            for index in self.get_created_dataset().Indices:
+                index_fields = list(index.IndexFields)
+                if index_fields and index_fields[0].Name == field_name:
+                    return index.Name
+        except Exception as e:
+            self.logger.warning(f"Indices of {self._dataset_name} could not be read: {str(e)}")
+        return None
+
+    def set_changed_since(self, since: datetime, field_name: str = "LtzAend") -> Union[str, bool]:
+        """
+        Restrict the dataset to the records changed since the given date.
+
+        If the dataset is not ranged yet and there is an index starting with field_name, a range on
+        this index is used. Otherwise the change date is added to the filter expression, so an existing
+        range (e.g. on Nr) stays intact.
+
+        Parameters:
+            since: Records with field_name >= since are kept.
+            field_name: The change date field. Defaults to 'LtzAend'.
+
+        Returns:
+            'range' or 'filter' for the way the dataset was restricted, False if it could not be restricted.
+        """
+        if not since:
+            return False
+
+        index_name = None if self._is_ranged else self.get_index_starting_with(field_name)
+        if index_name:
+            if self.range_set(index=index_name, search_value=since, range_end=datetime(2999, 12, 31)):
+                self.set_range_count()
+                self.logger.info(f"{self._dataset_name} ranged on {index_name} since {since}.")
+                return 'range'
+
+        try:
+            changed_since_expression = f"{field_name}>='{since.strftime('%d.%m.%Y %H:%M:%S')}'"
+            filter_expression = self.get_filter()
+            if filter_expression:
+                changed_since_expression = f"({filter_expression}) and ({changed_since_expression})"
+            self.set_filter(filter_expression=changed_since_expression)
+            self._found = True
+            self.range_first()
+            return 'filter'
+        except Exception as e:
+            self.logger.error(f"{self._dataset_name} could not be filtered by {field_name}: {str(e)}")
+            return False
+
     def set_dataset_state(self, state: Union[int, None] = None) -> None:
         """
         Set the state for the dataset.
@@ -548,9 +669,86 @@ class ERPAbstractEntity(ERPCoreController):
             self.set_dataset_state()
         return self._dataset_state
 
+    """ Field Descriptors """
+    @classmethod
+    def invalidate_field_descriptors(cls) -> None:
+        """
+        Drop all cached field descriptors. Is called when the ERP connection changes.
+        """
+        ERPAbstractEntity._field_descriptor_cache = {}
+        ERPAbstractEntity._field_descriptor_erp = None
+
+    def build_field_descriptors(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Read all fields and indices of the created dataset once and build the descriptor table.
+
+        Returns:
+            dict: Field name -> {'Name', 'Info', 'FieldType', 'reader', 'writer', 'indices'}.
+                  'reader' and 'writer' are the cast types from field_types_to_read/field_types_to_write,
+                  'indices' holds the names of all indices the field is part of.
+        """
+        dataset = self.get_created_dataset()
+        descriptors = {}
+        for field in dataset.Fields:
+            field_type = field.FieldType
+            descriptors[field.Name] = {
+                'Name': field.Name,
+                'Info': field.Info,
+                'FieldType': field_type,
+                'reader': self.field_types_to_read.get(field_type),
+                'writer': self.field_types_to_write.get(field_type),
+                'indices': []
+            }
+
+        try:
+            for index in dataset.Indices:
+                for index_field in index.IndexFields:
+                    if index_field.Name in descriptors:
+                        descriptors[index_field.Name]['indices'].append(index.Name)
+        except Exception as e:
+            self.logger.warning(f"Indices of {self._dataset_name} could not be read: {str(e)}")
+
+        self.logger.info(f"Built {len(descriptors)} field descriptors for {self._dataset_name}.")
+        return descriptors
+
+    def get_field_descriptors(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Retrieve the field descriptors of the dataset from the process wide cache.
+        The table is built on first use per dataset name and shared by all entities of that dataset.
+
+        Returns:
+            dict: Field name -> descriptor (see build_field_descriptors).
+        """
+        # A new connection may be a different mandant or program version
+        if ERPAbstractEntity._field_descriptor_erp is not self._erp:
+            self.invalidate_field_descriptors()
+            ERPAbstractEntity._field_descriptor_erp = self._erp
+
+        descriptors = ERPAbstractEntity._field_descriptor_cache.get(self._dataset_name)
+        if descriptors is None:
+            descriptors = self.build_field_descriptors()
+            ERPAbstractEntity._field_descriptor_cache[self._dataset_name] = descriptors
+        return descriptors
+
+    def get_field_descriptor(self, field_name: str) -> Union[Dict[str, Any], None]:
+        """
+        Retrieve the descriptor of a single field.
+
+        Parameters:
+            field_name (str): The name of the field.
+
+        Returns:
+            dict or None: The descriptor or None if the field does not exist in the dataset.
+        """
+        try:
+            return self.get_field_descriptors().get(field_name)
+        except Exception as e:
+            self.logger.error(f"Field descriptors of {self._dataset_name} could not be built: {str(e)}")
+            return None
+
     def set_dataset_fields(self) -> bool:
         """
-        Set the dataset fields to self._dataset_fields by fetching them from the dataset.
+        Set the dataset fields to self._dataset_fields from the field descriptors of the dataset.
 
         Returns:
             bool: True if the operation was successful, otherwise False.
@@ -560,9 +758,9 @@ class ERPAbstractEntity(ERPCoreController):
             # Possible output: True or False
         """
         try:
-            dataset = self.get_created_dataset()
-            if dataset:
-                self._dataset_fields = [{'Name': field.Name, 'Info': field.Info} for field in dataset.Fields]
+            descriptors = self.get_field_descriptors()
+            if descriptors:
+                self._dataset_fields = [{'Name': field['Name'], 'Info': field['Info']} for field in descriptors.values()]
                 self.logger.info("Successfully set dataset fields.")
                 return True
             else:
@@ -614,9 +812,15 @@ class ERPAbstractEntity(ERPCoreController):
             Returns False if the record is not found.
         """
 
+        # Inside iter_rows the field may already be read for the current row
+        if self._current_row is not None and return_field in self._current_row:
+            return self._current_row[return_field]
+
         # Check if the cursor is set and something was found
         if self._found:
-            field_read = self.field_reader(self._created_dataset.Fields(return_field))
+            descriptor = self.get_field_descriptor(return_field)
+            field_read = self.field_reader(self._created_dataset.Fields(return_field),
+                                           cast_type=descriptor['reader'] if descriptor else None)
             return field_read
         else:
             self.logger.error(f"Value {self.get_search_value()} NOT found in field {self.get_dataset_index()} of DataSet {self.get_dataset_name()}.")
@@ -654,6 +858,49 @@ class ERPAbstractEntity(ERPCoreController):
 
         return False
 
+    def set_many(self, values: Dict[str, Any], cast_types: Dict[str, str] = None) -> bool:
+        """
+        Set several fields of the current record in one edit/post cycle.
+
+        If the dataset is in browse state, it is set to edit mode first and posted afterwards.
+        If it is already in edit or insert mode (e.g. after append()), only the values are written
+        and the caller posts.
+
+        Parameters:
+            values: Field name -> value. Datetimes are formatted like in set_.
+            cast_types: Optional field name -> cast type for fields which need a special one.
+
+        Returns:
+            bool: True if all values were written (and posted), False otherwise.
+
+        Example:
+            erp_ans.set_many({"Na1": "Gastro-Held", "Str": "Hauptstr. 1", "PLZ": "84130", "Ort": "Dingolfing"})
+        """
+        cast_types = cast_types or {}
+
+        # Read the state from the dataset, it may have been set to insert mode outside of this entity
+        self.set_dataset_state()
+        started_edit = self.get_dataset_state() not in [2, 3]
+        if started_edit:
+            self.edit_()
+
+        failed = []
+        for field_name, value in values.items():
+            if isinstance(value, datetime):
+                value = value.strftime("%d.%m.%Y %H:%M:%S.%f")
+            if not self.field_writer(field_name, value, cast_types.get(field_name)):
+                failed.append(field_name)
+
+        if failed:
+            self.logger.error(f"Couldn't write fields {failed} of DataSet '{self.get_dataset_name()}'.")
+            if started_edit:
+                self.cancel()
+            return False
+
+        if started_edit:
+            return self.post()
+        return True
+
     def can_start_transaction(self) -> bool:
         """
         Checks if a transaction can be started or if one already exists.
@@ -781,18 +1028,20 @@ class ERPAbstractEntity(ERPCoreController):
         If it encounters an error, it calls the 'rollback' method to discard these changes and terminate the transaction.
 
         Returns:
-            None
+            bool: True if the changes were committed, False if they were rolled back.
 
         Raises:
-            Exception: If there's an issue committing changes to the dataset.
+            Exception: If there's an issue rolling back the changes after a failed commit.
         """
         try:
             self._created_dataset.Commit()
             self.set_dataset_state()
             self.logger.info(f"Transaction committed and changes saved for dataset '{self._dataset_name}'. Lock released.")
+            return True
         except Exception as e:
             self.logger.error(f"An error occurred while committing changes to the dataset '{self._dataset_name}': {str(e)}. Initiating rollback...")
             self.rollback()
+            return False
 
     # Rolling back changes made to the current dataset.
     def rollback(self):
@@ -911,7 +1160,12 @@ class ERPAbstractEntity(ERPCoreController):
         return False
 
     def set_nested_dataset(self, nested_dataset_name):
-        self._nested_dataset = self._created_dataset.NestedDataSets(nested_dataset_name)
+        # NestedDataSets(name) is resolved once, the nested dataset follows the cursor of the created dataset
+        nested_dataset = self._nested_datasets.get(nested_dataset_name)
+        if nested_dataset is None:
+            nested_dataset = self._created_dataset.NestedDataSets(nested_dataset_name)
+            self._nested_datasets[nested_dataset_name] = nested_dataset
+        self._nested_dataset = nested_dataset
 
     def get_nested_dataset(self, nested_dataset_name=None):
         if nested_dataset_name:
@@ -919,6 +1173,99 @@ class ERPAbstractEntity(ERPCoreController):
 
         return self._nested_dataset
 
+    def get_nested_field_readers(self, nested_dataset_name, fields=None):
+        """
+        Resolve the field readers of a nested dataset once, see resolve_field_readers.
+
+        Parameters:
+            nested_dataset_name (str): Name of the nested dataset, e.g. "Ums".
+            fields (list, optional): Field names. Defaults to all fields of the nested dataset.
+
+        Returns:
+            list: Tuples of (field_name, reader).
+        """
+        nested_dataset = self.get_nested_dataset(nested_dataset_name=nested_dataset_name)
+        if fields is None:
+            fields = [field.Name for field in nested_dataset.Fields]
+
+        reader_key = (nested_dataset_name, tuple(fields))
+        readers = self._nested_readers.get(reader_key)
+        if readers is None:
+            readers = self.resolve_field_readers(fields, dataset=nested_dataset)
+            self._nested_readers[reader_key] = readers
+        return readers
+
+    def iter_nested_rows(self, nested_dataset_name, fields=None):
+        """
+        Walk once through the nested dataset of the current row and yield the values of the given fields.
+
+        Parameters:
+            nested_dataset_name (str): Name of the nested dataset, e.g. "Ums".
+            fields (list, optional): Field names. Defaults to all fields of the nested dataset.
+
+        Yields:
+            dict: field_name -> value per nested row.
+        """
+        readers = self.get_nested_field_readers(nested_dataset_name=nested_dataset_name, fields=fields)
+        nested_dataset = self._nested_dataset
+        nested_dataset.First()
+        while not nested_dataset.Eof:
+            yield {field_name: reader() for field_name, reader in readers}
+            nested_dataset.Next()
+
+    def get_nested_matrix(self, nested_dataset_name, index_field, fields=None):
+        """
+        Read the whole nested dataset of the current row in one pass instead of a FindKey per value.
+
+        Parameters:
+            nested_dataset_name (str): Name of the nested dataset, e.g. "Ums".
+            index_field (str): Field which keys the rows of the matrix, e.g. "Jahr".
+            fields (list, optional): Field names of the columns. Defaults to all fields of the nested dataset.
+
+        Returns:
+            dict: index value -> {field_name: value}, e.g. {2023: {"UmsJan": 120.0, ...}, 2024: {...}}
+
+        Example:
+            erp_art = ERPArtikelEntity(erp=erp, search_value="204116")
+            ums = erp_art.get_nested_matrix("Ums", "Jahr", ["UmsJan", "UmsFeb"])
+            print(ums[2023]["UmsFeb"])
+        """
+        read_fields = None if fields is None else list(dict.fromkeys([index_field] + list(fields)))
+        matrix = {}
+        for nested_row in self.iter_nested_rows(nested_dataset_name=nested_dataset_name, fields=read_fields):
+            matrix[nested_row[index_field]] = nested_row if fields is None \
+                else {field_name: nested_row[field_name] for field_name in fields}
+        return matrix
+
+    def iter_nested_matrices(self, nested_dataset_name, index_field, fields=None, key_fields=None):
+        """
+        Bulk mode of get_nested_matrix: walk through the (ranged) dataset once and yield the
+        matrix of every row. The field readers of the nested dataset are resolved only once.
+
+        Parameters:
+            nested_dataset_name (str): Name of the nested dataset, e.g. "Ums".
+            index_field (str): Field which keys the rows of the matrix, e.g. "Jahr".
+            fields (list, optional): Field names of the columns.
+            key_fields (list, optional): Fields of the main dataset identifying the row. Defaults to the index fields.
+
+        Yields:
+            tuple: (key, matrix), key is a single value or a list for multi field keys.
+
+        Example:
+            erp_art = ERPArtikelEntity(erp=erp, search_value="090000", range_end="099999")
+            for nr, ums in erp_art.iter_nested_matrices("Ums", "Jahr", ["UmsGes"]):
+                print(nr, ums.get(2023, {}).get("UmsGes"))
+        """
+        if key_fields is None:
+            key_fields = [index_field.Name for index_field
+                          in self.get_created_dataset().Indices(self.get_dataset_index()).IndexFields]
+
+        for row in self.iter_rows(fields=key_fields, as_dict=False):
+            key = row[0] if len(row) == 1 else list(row)
+            yield key, self.get_nested_matrix(nested_dataset_name=nested_dataset_name,
+                                              index_field=index_field,
+                                              fields=fields)
+
     def get_all_nested_datasets(self):
         nested_datasets_list = []
         for nested_dataset in self.get_created_dataset().NestedDataSets:
@@ -1007,6 +1354,259 @@ class ERPAbstractEntity(ERPCoreController):
             self.logger.warning("Dataset range count called, but dataset is not ranged!")
             return None
 
+    """ Bulk Read """
+    def get_bulk_read_fields(self) -> Union[List[str], None]:
+        """
+        Fields which are read by map_erp_to_bridge and its helpers. Entities overwrite this,
+        so the controllers can prefetch them with iter_rows.
+
+        Returns:
+            list[str] or None: The field names or None if the entity does not define them.
+        """
+        return None
+
+    def get_bulk_read_extras(self) -> Dict[str, str]:
+        """
+        Values of a row which are no plain fields and need further ERP calls, e.g. the storage location.
+        A partitioned sync computes them in the reading process and sends them to the writer with the row,
+        the methods answer them with get_prefetched.
+
+        Returns:
+            dict: Row key -> name of the method computing the value.
+        """
+        return {}
+
+    def read_bulk_extras(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compute the values of get_bulk_read_extras for the current row and add them to the row.
+        """
+        for row_key, method_name in self.get_bulk_read_extras().items():
+            row[row_key] = getattr(self, method_name)()
+        return row
+
+    def get_prefetched(self, row_key: str) -> Any:
+        """
+        Returns:
+            The prefetched value of the current row or ERPAbstractEntity.NOT_PREFETCHED.
+        """
+        if self._current_row is not None and row_key in self._current_row:
+            return self._current_row[row_key]
+        # Replayed rows (partitions, snapshots) hold their extras in the in-memory dataset
+        if isinstance(self._created_dataset, (ERPFakeDataset, ERPRowReplayDataset)):
+            current_row = self._created_dataset.get_current_row()
+            if current_row is not None and row_key in current_row:
+                return current_row[row_key]
+        return ERPAbstractEntity.NOT_PREFETCHED
+
+    def get_row_layout(self, fields: List[str] = None) -> Dict[str, Any]:
+        """
+        Describe the rows of a bulk read, so they can be rebuilt as an in-memory dataset
+        by a partitioned sync (see ERPRowReplayConnection) or a snapshot (see ERPFakeDataset).
+
+        Parameters:
+            fields: List of field names. Defaults to get_bulk_read_fields or all fields of the dataset.
+                    The fields of the dataset index are always added.
+
+        Returns:
+            dict: 'dataset_name', 'field_types' (field name -> FieldType, only existing fields),
+                  'indices' (index name -> field names) and 'index_fields'.
+        """
+        dataset = self.get_created_dataset()
+        index_fields = [index_field.Name for index_field in dataset.Indices(self.get_dataset_index()).IndexFields]
+        fields = list(fields or self.get_bulk_read_fields() or [field['Name'] for field in self.get_dataset_fields()])
+        fields += [field_name for field_name in index_fields if field_name not in fields]
+
+        field_types = {}
+        for field_name in fields:
+            descriptor = self.get_field_descriptor(field_name)
+            if descriptor:
+                field_types[field_name] = descriptor['FieldType']
+
+        return {
+            'dataset_name': self.get_dataset_name(),
+            'field_types': field_types,
+            'indices': {self.get_dataset_index(): index_fields},
+            'index_fields': index_fields
+        }
+
+    def export_snapshot(self, file_path: str, fields: List[str] = None, with_extras: bool = False,
+                        chunk_size: int = 1000) -> int:
+        """
+        Write the (ranged) dataset in one pass into a columnar snapshot file (see ERPSnapshot).
+
+        Parameters:
+            file_path: Target file, .parquet (pyarrow) or .npz (numpy). Only .parquet is written while
+                       the dataset is read, .npz holds the whole range in memory until the end.
+            fields: List of field names. Defaults to get_bulk_read_fields or all fields of the dataset.
+            with_extras: Also store the values of get_bulk_read_extras, e.g. to replay map_erp_to_bridge.
+            chunk_size: Rows per written chunk.
+
+        Returns:
+            int: Number of written rows.
+
+        Example:
+            erp_art = ERPArtikelEntity(erp=erp, search_value="090000", range_end="999999")
+            erp_art.export_snapshot("artikel.parquet", with_extras=True)
+        """
+        layout = self.get_row_layout(fields=fields)
+        extras = list(self.get_bulk_read_extras()) if with_extras else []
+
+        with ERPSnapshotWriter(file_path=file_path, layout=layout, extras=extras) as writer:
+            chunk = []
+            for row in self.iter_rows(fields=list(layout['field_types'])):
+                if with_extras:
+                    self.read_bulk_extras(row)
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    writer.write_rows(chunk)
+                    chunk = []
+            if chunk:
+                writer.write_rows(chunk)
+
+        self.logger.info(f"Exported {writer.rows_written} rows of {self._dataset_name} to {file_path}.")
+        return writer.rows_written
+
+    def resolve_field_readers(self, fields: List[str], dataset=None) -> List[Tuple[str, Any]]:
+        """
+        Resolve the field objects and their reader casts once, so reading a row
+        only costs one COM call per value instead of the Fields(name), FieldType and value lookup.
+
+        The field objects of a created dataset stay bound to their column, when the cursor moves.
+
+        Parameters:
+            fields: List of field names.
+            dataset: Dataset of the fields, e.g. a nested dataset. Defaults to the created dataset.
+
+        Returns:
+            list: Tuples of (field_name, reader). The reader returns the value of the current row.
+                  Fields that don't exist in the dataset are skipped.
+        """
+        readers = []
+        for field_name in fields:
+            try:
+                if dataset is None:
+                    field = self._created_dataset.Fields(field_name)
+                    descriptor = self.get_field_descriptor(field_name)
+                else:
+                    # The descriptors only describe the created dataset
+                    field = dataset.Fields(field_name)
+                    descriptor = None
+                if descriptor:
+                    cast_type = descriptor['reader']
+                else:
+                    cast_type = self.field_types_to_read.get(field.FieldType)
+            except Exception as e:
+                self.logger.warning(f"Field '{field_name}' could not be resolved in {self._dataset_name}: {str(e)}")
+                continue
+
+            if not cast_type:
+                self.logger.warning(f"Unknown FieldType of field '{field_name}' in {self._dataset_name}")
+                continue
+
+            readers.append((field_name, self._make_field_reader(field, cast_type)))
+        return readers
+
+    def _make_field_reader(self, field, cast_type):
+        def reader():
+            try:
+                casted_attribute_or_method = getattr(field, cast_type)
+                if callable(casted_attribute_or_method):
+                    return casted_attribute_or_method()
+                return casted_attribute_or_method
+            except Exception as e:
+                self.logger.error(f"Error while casting field {field.Name}: {e}")
+                return None
+        return reader
+
+    def iter_rows(self, fields: List[str] = None, as_dict: bool = True):
+        """
+        Walk through the whole (ranged) dataset once and yield the values of the given fields per row.
+
+        The field objects and casts are resolved once per dataset (see resolve_field_readers).
+        While a row is yielded, get_ answers the prefetched fields from memory, so every
+        map_erp_to_bridge can be called inside the loop without further changes.
+
+        Parameters:
+            fields: List of field names. Defaults to all fields of the dataset.
+            as_dict: If True yield dicts (field_name -> value), otherwise tuples in the order of fields.
+
+        Yields:
+            dict or tuple: The values of the current row.
+
+        Example:
+            erp_art = ERPArtikelEntity(erp=erp, search_value="090000", range_end="999999")
+            for row in erp_art.iter_rows(fields=["ArtNr", "KuBez5", "LagMge"]):
+                print(row["ArtNr"], erp_art.map_erp_to_bridge())
+        """
+        if fields is None:
+            fields = [field['Name'] for field in self.get_dataset_fields()]
+
+        readers = self.resolve_field_readers(fields)
+        field_names = [field_name for field_name, _ in readers]
+        dataset = self._created_dataset
+
+        self.range_first()
+        try:
+            while not dataset.Eof:
+                values = tuple(reader() for _, reader in readers)
+                self._current_row = dict(zip(field_names, values))
+                yield self._current_row if as_dict else values
+                self._current_row = None
+                dataset.Next()
+        finally:
+            self._current_row = None
+
+    def get_current_key(self) -> Union[List[Any], Any, None]:
+        """
+        Read the values of the dataset index fields of the current row, so the row can be found
+        again with FindKey, e.g. to retry it after the cursor moved on.
+
+        Returns:
+            The value (single field index) or list of values, None if the cursor is at Eof.
+        """
+        dataset = self._created_dataset
+        if dataset.Eof:
+            return None
+        key = []
+        for index_field in dataset.Indices(self.get_dataset_index()).IndexFields:
+            descriptor = self.get_field_descriptor(index_field.Name)
+            key.append(self.field_reader(dataset.Fields(index_field.Name),
+                                         cast_type=descriptor['reader'] if descriptor else None))
+        return key[0] if len(key) == 1 else key
+
+    @contextmanager
+    def visit_key(self, key, row: Dict[str, Any] = None):
+        """
+        Move the cursor to the row with the given key for the duration of the with block and back
+        to the current row afterwards. Can be used inside iter_rows, the prefetched values of the
+        current row are hidden while visiting.
+
+        Parameters:
+            key: Key of the row, as returned by get_current_key.
+            row: Optional prefetched values of the visited row, get_ answers them from memory.
+
+        Yields:
+            bool: True if the row was found.
+
+        Example:
+            with erp_art.visit_key(key) as found:
+                if found:
+                    print(erp_art.get_nr())
+        """
+        dataset = self._created_dataset
+        current_key = self.get_current_key()
+        current_row = self._current_row
+        found = self._found
+        self._current_row = row
+        try:
+            self._found = dataset.FindKey(self.get_dataset_index(), key)
+            yield self._found
+        finally:
+            if current_key is not None:
+                dataset.FindKey(self.get_dataset_index(), current_key)
+            self._current_row = current_row
+            self._found = found
+
     """ Utility Methods """
     def find_one(self, search_value, dataset_index=None):
         if not search_value:
@@ -1091,8 +1691,10 @@ class ERPAbstractEntity(ERPCoreController):
         self.logger.info(f"")
         return indices_dict
 
-    def field_reader(self, field):
-        cast_type = self.field_types_to_read.get(field.FieldType)
+    def field_reader(self, field, cast_type=None):
+        # The cast type comes from the field descriptors, only unknown fields need the FieldType lookup
+        if not cast_type:
+            cast_type = self.field_types_to_read.get(field.FieldType)
 
         if not cast_type:
             print(f"Unknown FieldType: {field.FieldType}")
@@ -1115,44 +1717,111 @@ class ERPAbstractEntity(ERPCoreController):
             print(f"Error while casting field: {e}")
             return None
 
+    def get_field_setter(self, field_name: str, cast_type: str = None):
+        """
+        Resolve the setter of a field once per created dataset and cache it.
+
+        The cast type comes from the parameter or the field descriptors. The field object
+        is looked up once, every later write to the field is a single COM property put.
+
+        Parameters:
+            field_name: The name of the field.
+            cast_type: Optional cast type like 'AsString' or 'Text'. Defaults to the writer of the field descriptor.
+
+        Returns:
+            callable or None: Function taking the value to write, None if the FieldType is unknown.
+        """
+        # The created dataset can be replaced, e.g. by the DataSet of a soVorgang object
+        if self._field_setters_dataset is not self._created_dataset:
+            self._field_setters = {}
+            self._field_setters_dataset = self._created_dataset
+
+        setter = self._field_setters.get((field_name, cast_type))
+        if setter:
+            return setter
+
+        resolved_cast_type = cast_type
+        if not resolved_cast_type:
+            descriptor = self.get_field_descriptor(field_name)
+            if descriptor:
+                resolved_cast_type = descriptor['writer']
+            else:
+                resolved_cast_type = self.field_types_to_write.get(self._created_dataset.Fields.Item(field_name).FieldType)
+
+        if not resolved_cast_type:
+            return None
+
+        field = self._created_dataset.Fields(field_name)
+
+        def setter(value):
+            setattr(field, resolved_cast_type, value)
+
+        setter.cast_type = resolved_cast_type
+        self._field_setters[(field_name, cast_type)] = setter
+        return setter
+
     def field_writer(self, field_name, value, cast_type):
         """
         Set the value of a field using the appropriate cast type.
 
         Parameters:
-            field: The dataset field whose value needs to be set.
+            field_name: The name of the dataset field whose value needs to be set.
             value: The value to be set to the field.
+            cast_type: Optional cast type, defaults to the writer of the field descriptor.
 
         Returns:
             bool: True if the field's value is set successfully, False otherwise.
         """
-        field_type = self._created_dataset.Fields.Item(field_name).FieldType
-
-        # Get the cast_type from the parameter
-        if not cast_type:
-            cast_type = self.field_types_to_write.get(field_type)
-
-        # print(f"try to write {value} into {field_name} by method {cast_type}")
+        try:
+            setter = self.get_field_setter(field_name, cast_type)
+        except Exception as e:
+            self.logger.error(f"Field '{field_name}' could not be resolved in {self._dataset_name}: {e}")
+            return False
 
-        if not cast_type:
-            self.logger.warning(f"Unknown FieldType: {field_name.FieldType}")
+        if not setter:
+            self.logger.warning(f"Unknown FieldType of field: {field_name}")
             return False
 
         try:
-            # Using the setattr function to dynamically set the attribute or method's value
-            # field_object = self._created_dataset.Fields(str(field_name))
-            # setattr(field_object, cast_type, str(value))
-            exec(f'self._created_dataset.Fields("{field_name}").{cast_type} = "{value}"')
+            start = time.perf_counter()
+            # The ERP converts the string according to the cast type
+            setter("" if value is None else str(value))
+            self._count_field_write(field_name, time.perf_counter() - start)
 
-            self.logger.info(f"Value '{value}' set to field using cast type '{cast_type}'.")
+            self.logger.info(f"Value '{value}' set to field using cast type '{setter.cast_type}'.")
             return True
         except AttributeError:
-            self.logger.error(f"Field does not have an attribute or method named {cast_type}.")
+            self.logger.error(f"Field does not have an attribute or method named {setter.cast_type}.")
             return False
         except Exception as e:
             self.logger.error(f"Error while setting value to field: {e}")
             return False
 
+    def _count_field_write(self, field_name: str, seconds: float) -> None:
+        stats = ERPAbstractEntity._field_write_stats.setdefault((self._dataset_name, field_name), [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+    @classmethod
+    def get_field_write_stats(cls) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """
+        Retrieve the timing counters of all field writes in this process.
+
+        Returns:
+            dict: (dataset_name, field_name) -> {'count', 'total', 'avg'} with the times in seconds.
+
+        Example:
+            for (dataset, field), stats in sorted(ERPAbstractEntity.get_field_write_stats().items(),
+                                                  key=lambda item: item[1]['total'], reverse=True):
+                print(dataset, field, stats)
+        """
+        return {key: {'count': count, 'total': total, 'avg': total / count if count else 0.0}
+                for key, (count, total) in ERPAbstractEntity._field_write_stats.items()}
+
+    @classmethod
+    def reset_field_write_stats(cls) -> None:
+        ERPAbstractEntity._field_write_stats = {}
+
     def field_exists(self, field_name: str) -> bool:
         """
         Check if a specific field exists in the dataset.
@@ -1170,17 +1839,15 @@ class ERPAbstractEntity(ERPCoreController):
             # Possible output: True or False
         """
         try:
-            all_fields = self.get_dataset_fields()
-            if all_fields:
-                # Check if any field in all_fields has a name that matches field_name
-                for field in all_fields:
-                    if field['Name'] == field_name:
-                        self.logger.info(f"The field '{field_name}' exists in {self._dataset_name}.")
-                        return True
+            descriptors = self.get_field_descriptors()
+            if descriptors:
+                # Dictionary lookup in the cached descriptors, no COM call
+                if field_name in descriptors:
+                    return True
                 self.logger.warning(f"The field '{field_name}' does not exist in {self._dataset_name}.")
                 return False
             else:
-                self.logger.warning(f"Fields of {self._dataset_name} could not be fetched. No check for Field 'Bild' possible.")
+                self.logger.warning(f"Fields of {self._dataset_name} could not be fetched. No check for Field '{field_name}' possible.")
                 return False
         except Exception as e:
             self.logger.error(f"An error occurred while checking for the existence of the field '{field_name}': {str(e)} in {self._dataset_name}")
@@ -1248,15 +1915,10 @@ class ERPAbstractEntity(ERPCoreController):
             return None
 
     def get_med_file_size(self, media):
-        path = GCBridgeConfig.ASSETS_PATH + GCBridgeConfig.IMG_PATH
-        try:
-            img_from_web = requests.head(f"{path}/{media}")
-            img_from_web.raise_for_status()
-            file_size = int(img_from_web.headers.get('Content-Length', 0))
-            return file_size
-        except requests.RequestException as e:
-            self.logger.error(f"An error occurred while calculating the file size from the web: {str(e)}")
-            return None
+        """
+        :return: Size of the image file in bytes or None if it can't be determined. See BridgeMediaMetaCache.
+        """
+        return BridgeMediaMetaCache().get_file_size(media)
 
     def get_max_img_nr(self):
         """
@@ -1303,6 +1965,10 @@ class ERPAbstractEntity(ERPCoreController):
         Returns:
             list[str] or bool: A list of file names for all available article images if successful, otherwise False.
         """
+        prefetched = self.get_prefetched("@images_file_list")
+        if prefetched is not self.NOT_PREFETCHED:
+            return prefetched
+
         if not self.field_exists("Bild"):
             self.logger.error(f"Field 'Bild' does not exist in {self._dataset_name}. Returning False")
             return False
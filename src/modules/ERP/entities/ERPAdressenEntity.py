@@ -39,7 +39,7 @@ class ERPAdressenEntity(ERPAbstractEntity):
 
     def map_bridge_to_erp(self, bridge_entity):
         # 1. Find the dataset in the
-        new_address = ERPAdressenEntity()
+        new_address = ERPAdressenEntity(erp=self._erp)
         new_address.append()
         erp_adrnr_new = new_address.get_created_dataset().SetupNr("")
         print("AdrNr new:", erp_adrnr_new)
@@ -55,7 +55,7 @@ class ERPAdressenEntity(ERPAbstractEntity):
         new_address.post()
         try:
             # Fetch the adresse again and return it
-            new_address_in_erp = ERPAdressenEntity()
+            new_address_in_erp = ERPAdressenEntity(erp=self._erp)
             new_address_in_erp.find_one(search_value=erp_adrnr_new)
             return new_address_in_erp
         except Exception as e:
@@ -64,12 +64,11 @@ class ERPAdressenEntity(ERPAbstractEntity):
 
     def update(self, bridge_entity):
         updated_id = self.get_id()
-        self.edit_()
-        self.set_suchbeg("GCU")
-        self.set_status("GCB Kunde - Update")
-        self.post()
+        # One edit/post cycle for all fields, it is cancelled if one field can't be written
+        if not self.set_many({"SuchBeg": "GCU", "Status": "GCB Kunde - Update"}):
+            raise ValueError(f"Couldn't write the fields of Adresse {updated_id} to the ERP.")
 
-        erp_adress_entity_updated = ERPAdressenEntity()
+        erp_adress_entity_updated = ERPAdressenEntity(erp=self._erp)
         erp_adress_entity_updated.find_one(search_value=updated_id, dataset_index='ID')
 
         return erp_adress_entity_updated
@@ -130,14 +129,14 @@ class ERPAdressenEntity(ERPAbstractEntity):
 
     def get_billing_address_entity(self):
         self.logger.info(f"Get the billing address from ERPAnschriftenEntity")
-        return ERPAnschriftenEntity([self.get_adrnr(), self.get_reansnr()])
+        return ERPAnschriftenEntity(erp=self._erp, search_value=[self.get_adrnr(), self.get_reansnr()])
 
     def set_billing_address(self):
         # Todo: Set the billing address
         pass
 
     def get_shipping_address_entity(self):
-        return ERPAnschriftenEntity([self.get_adrnr(), self.get_liansnr()])
+        return ERPAnschriftenEntity(erp=self._erp, search_value=[self.get_adrnr(), self.get_liansnr()])
 
     def set_shipping_address(self):
         # Todo: Set the shipping address
@@ -146,7 +145,8 @@ class ERPAdressenEntity(ERPAbstractEntity):
     def get_billing_ansprechpartner_entity(self):
 
         return ERPAnsprechpartnerEntity(
-            [
+            erp=self._erp,
+            search_value=[
                 self.get_adrnr(),
                 self.get_reansnr(),
                 self.get_billing_address_entity().get_("AspNr")
@@ -155,7 +155,8 @@ class ERPAdressenEntity(ERPAbstractEntity):
 
     def get_shipping_ansprechpartner_entity(self):
         return ERPAnsprechpartnerEntity(
-            [
+            erp=self._erp,
+            search_value=[
                 self.get_adrnr(),
                 self.get_liansnr(),
                 self.get_shipping_address_entity().get_("AspNr")
@@ -164,6 +165,7 @@ class ERPAdressenEntity(ERPAbstractEntity):
 
     def get_anschriften(self, max=500):
         addresses_range = ERPAnschriftenEntity(
+            erp=self._erp,
             search_value=[self.get_adrnr(), 0],
             range_end=[self.get_adrnr(), max]
         )
@@ -174,13 +176,15 @@ class ERPAdressenEntity(ERPAbstractEntity):
             adrnr = self.get_adrnr()
 
         contact = ERPAnsprechpartnerEntity(
+            erp=self._erp,
             search_value=[adrnr, ansnr, 0],
             range_end=[adrnr, ansnr, 999]
         )
-        ERPAnschriftenEntity().set_created_dataset()
+        ERPAnschriftenEntity(erp=self._erp).set_created_dataset()
 
     def get_ansprechpartner(self):
         contacts_range = ERPAnsprechpartnerEntity(
+            erp=self._erp,
             search_value=[self.adrnr, 0, 0],
             range_end=[self.adrnr, 9999, 9999]
         )
@@ -26,51 +26,58 @@ class ERPAnschriftenEntity(ERPAbstractEntity):
         if last_ansnr:
             ansnr = last_ansnr + 1
 
-        new_anschrift = ERPAnschriftenEntity()
+        new_anschrift = ERPAnschriftenEntity(erp=self._erp)
         new_anschrift.append()
-        new_anschrift.set_adrnr(erp_adresse_entity.get_adrnr())
-        new_anschrift.set_ansnr(ansnr)
-        new_anschrift.set_na1(bridge_entity.get_name1())
-        new_anschrift.set_na2(bridge_entity.get_name2())
-        new_anschrift.set_na3(bridge_entity.get_name3())
-        new_anschrift.set_email(bridge_entity.get_email())
-        new_anschrift.set_street(bridge_entity.get_street())
-        new_anschrift.set_postal_code(bridge_entity.get_postal_code())
-        new_anschrift.set_city(bridge_entity.get_city())
-        new_anschrift.set_land(bridge_entity.get_land())
+        values = {
+            "AdrNr": erp_adresse_entity.get_adrnr(),
+            "AnsNr": ansnr,
+            "Na1": bridge_entity.get_name1(),
+            "Na2": bridge_entity.get_name2(),
+            "Na3": bridge_entity.get_name3(),
+            "EMail1": bridge_entity.get_email(),
+            "Str": bridge_entity.get_street(),
+            "PLZ": bridge_entity.get_postal_code(),
+            "Ort": bridge_entity.get_city(),
+            "LandKennz": bridge_entity.get_land()
+        }
         if address_type == 'billing':
-            new_anschrift.set_stdrekz(1)
+            values["StdReKz"] = 1
         elif address_type == 'shipping':
-            new_anschrift.set_stdlikz(1)
+            values["StdLiKz"] = 1
+        # All fields in one go, the dataset is in insert mode, so we post ourselves
+        new_anschrift.set_many(values)
         new_anschrift.post()
 
         # 2. Now get the entity
-        new_anschrift_in_erp = ERPAnschriftenEntity()
+        new_anschrift_in_erp = ERPAnschriftenEntity(erp=self._erp)
         new_anschrift_in_erp.find_one(search_value=[erp_adresse_entity.get_adrnr(), ansnr])
         return new_anschrift_in_erp
 
     def update(self, bridge_entity, erp_adresse_entity, address_type):
         updated_id = self.get_id()
         try:
-            self.edit_()
-            self.set_na1(bridge_entity.get_name1() + " Updated")
-            self.set_na2(bridge_entity.get_name2())
-            self.set_na3(bridge_entity.get_name3())
-            # Set E-Mail of Anschrift only on new customers !
-            # self.set_email(bridge_entity.get_email())
-            self.set_street(bridge_entity.get_street())
-            self.set_postal_code(bridge_entity.get_postal_code())
-            self.set_city(bridge_entity.get_city())
-            self.set_land(bridge_entity.get_land())
+            values = {
+                "Na1": bridge_entity.get_name1() + " Updated",
+                "Na2": bridge_entity.get_name2(),
+                "Na3": bridge_entity.get_name3(),
+                # Set E-Mail of Anschrift only on new customers !
+                # "EMail1": bridge_entity.get_email(),
+                "Str": bridge_entity.get_street(),
+                "PLZ": bridge_entity.get_postal_code(),
+                "Ort": bridge_entity.get_city(),
+                "LandKennz": bridge_entity.get_land()
+            }
             if address_type == 'billing':
                 print("Is Billing, set stdrekz on", updated_id)
-                self.set_stdrekz(1)
+                values["StdReKz"] = 1
             elif address_type == 'shipping':
                 print("Is shipping, set stdlikz on", updated_id)
-                self.set_stdlikz(1)
-            self.post()
+                values["StdLiKz"] = 1
+            # One edit/post cycle for all fields, it is cancelled if one field can't be written
+            if not self.set_many(values):
+                raise ValueError(f"Couldn't write the fields of Anschrift {updated_id} to the ERP.")
 
-            erp_anschrift_entity_updated = ERPAnschriftenEntity()
+            erp_anschrift_entity_updated = ERPAnschriftenEntity(erp=self._erp)
             erp_anschrift_entity_updated.find_one(search_value=updated_id, dataset_index='ID')
             return erp_anschrift_entity_updated
 
@@ -80,6 +87,7 @@ class ERPAnschriftenEntity(ERPAbstractEntity):
 
     def get_ansprechpartner(self, max=20):
         return ERPAnsprechpartnerEntity(
+            erp=self._erp,
             search_value=[
                 self.get_("AdrNr"),
                 self.get_("AnsNr"),
@@ -186,10 +194,8 @@ class ERPAnschriftenEntity(ERPAbstractEntity):
         self.set_("StdLiKz", value)
 
     def reset_stdrekz_and_stdlikz(self):
-        self.edit_()
-        self.set_stdrekz(0)
-        self.set_stdlikz(0)
-        self.post()
+        if not self.set_many({"StdReKz": 0, "StdLiKz": 0}):
+            raise ValueError(f"Couldn't reset StdReKz and StdLiKz of Anschrift {self.get_id()} in the ERP.")
 
     def __repr__(self):
         return f'Anschrift {self.get_id()} {self.get_("AdrNr")}-{self.get_("AnsNr")} {self.get_("Na1")} {self.get_("Na2")} {self.get_("Na3")}'
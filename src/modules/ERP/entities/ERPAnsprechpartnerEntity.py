@@ -25,36 +25,41 @@ class ERPAnsprechpartnerEntity(ERPAbstractEntity):
                 print(f"We have {last_aspnr} Ansprechpartner in Anschrift {erp_anschrift_entity.get_ansnr()} in AdrNr: {erp_adresse_entity.get_adrnr()}")
                 aspnr = last_aspnr + 1
 
-            new_ansprechpartner = ERPAnsprechpartnerEntity()
+            new_ansprechpartner = ERPAnsprechpartnerEntity(erp=self._erp)
             new_ansprechpartner.append()
-            new_ansprechpartner.set_adrnr(erp_adresse_entity.get_adrnr())
-            new_ansprechpartner.set_ansnr(erp_anschrift_entity.get_ansnr())
-            new_ansprechpartner.set_aspnr(aspnr)
-            new_ansprechpartner.set_email(bridge_entity.get_email())
-            new_ansprechpartner.set_anrede(bridge_entity.get_title())
-            new_ansprechpartner.set_first_name(bridge_entity.get_first_name())
-            new_ansprechpartner.set_last_name(bridge_entity.get_last_name())
-            new_ansprechpartner.set_("AnspAufbau", 6)  # 6 Pos in Dropdown - means: Title Vorname Zusatz Vorsatz Nachname)
-            new_ansprechpartner.set_ansprechpartner(f"{bridge_entity.get_title()} {bridge_entity.get_first_name()} {bridge_entity.get_last_name()}")
+            # All fields in one go, the dataset is in insert mode, so we post ourselves
+            new_ansprechpartner.set_many({
+                "AdrNr": int(erp_adresse_entity.get_adrnr()),
+                "AnsNr": int(erp_anschrift_entity.get_ansnr()),
+                "AspNr": aspnr,
+                "EMail1": bridge_entity.get_email(),
+                "Anr": bridge_entity.get_title(),
+                "VNa": bridge_entity.get_first_name(),
+                "NNa": bridge_entity.get_last_name(),
+                "AnspAufbau": 6,  # 6 Pos in Dropdown - means: Title Vorname Zusatz Vorsatz Nachname)
+                "Ansp": f"{bridge_entity.get_title()} {bridge_entity.get_first_name()} {bridge_entity.get_last_name()}"
+            })
             new_ansprechpartner.post()
         except Exception as a:
             print("Creating Ansprechpartner", erp_adresse_entity.get_adrnr(), erp_anschrift_entity.get_ansnr(), a)
 
         # Now get the entity
-        new_ansprechpartner_in_erp = ERPAnsprechpartnerEntity()
+        new_ansprechpartner_in_erp = ERPAnsprechpartnerEntity(erp=self._erp)
         new_ansprechpartner_in_erp.find_one(search_value=[erp_adresse_entity.get_adrnr(), erp_anschrift_entity.get_ansnr(), aspnr])
         return new_ansprechpartner_in_erp
 
     def update(self, bridge_entity, erp_adresse_entity, erp_anschrift_entity, erp_ansprechpartner_entity):
         updated_id = self.get_id()
         try:
-            self.edit_()
-            self.set_title(bridge_entity.get_title())
-            self.set_first_name(bridge_entity.get)
-            self.set_last_name(bridge_entity.get_last_name())
-            self.post()
-
-            erp_ansprechpartner_entity_updated = ERPAnsprechpartnerEntity()
+            # One edit/post cycle for all fields, it is cancelled if one field can't be written
+            if not self.set_many({
+                "Anr": bridge_entity.get_title(),
+                "VNa": bridge_entity.get_first_name(),
+                "NNa": bridge_entity.get_last_name()
+            }):
+                raise ValueError(f"Couldn't write the fields of Ansprechpartner {updated_id} to the ERP.")
+
+            erp_ansprechpartner_entity_updated = ERPAnsprechpartnerEntity(erp=self._erp)
             erp_ansprechpartner_entity_updated.find_one(search_value=updated_id, dataset_index='ID')
             return erp_ansprechpartner_entity_updated
 
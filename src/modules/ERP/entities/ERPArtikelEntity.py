@@ -9,7 +9,7 @@ from ..entities.ERPAbstractEntity import ERPAbstractEntity
 from src.modules.Bridge.entities.BridgeProductEntity import (
     BridgeProductEntity, BridgeProductTranslation)
 from src.modules.Bridge.entities.BridgePriceEntity import BridgePriceEntity
-from ..entities.ERPArtikelKategorienEntity import ERPArtikelKategorienEntity
+from ..entities.ERPCategoryTree import ERPCategoryTree
 from src.modules.ERP.entities.ERPLagerEntity import ERPLagerEntity
 from config import ERPConfig, GCBridgeConfig
 
@@ -36,6 +36,30 @@ class ERPArtikelEntity(ERPAbstractEntity):
             filter_expression="WShopKz='1'"
         )
 
+    def get_bulk_read_fields(self):
+        """
+        Fields read by map_erp_to_bridge, map_erp_translation_to_bridge and map_erp_price_to_bridge.
+
+        :return: List of field names for iter_rows.
+        """
+        return [
+            "ID", "ArtNr", "LagMge", "Einh", "Sel6", "Sel10", "Sel11", "Sel19", "Sel70", "Sel71",
+            "KuBez5", "Bez5", "StSchl", "ErstDat", "LtzAend",
+            "Vk0.Preis", "Vk0.Rab0.Mge", "Vk0.Rab0.Pr", "Vk0.SPr", "Vk0.SVonDat", "Vk0.SBisDat"
+        ] + self.get_category_fields()
+
+    def get_bulk_read_extras(self):
+        """
+        Values of map_erp_to_bridge and set_relations, which need further ERP lookups.
+
+        :return: Row key -> method name, see ERPAbstractEntity.get_bulk_read_extras.
+        """
+        return {
+            "@storage_location": "get_storage_location",
+            "@categories_list": "get_categories_list",
+            "@images_file_list": "get_images_file_list"
+        }
+
     def map_erp_to_bridge(self):
         """
         Maps the current ERP article entity to a BridgeProductEntity.
@@ -83,84 +107,107 @@ class ERPArtikelEntity(ERPAbstractEntity):
         """
         Updates the stock, prices, etc. in ERP based on the provided bridge_entity.
 
+        All special price fields are written in one edit/post cycle, see map_bridge_price_to_erp_values.
+
         :param bridge_entity: A BridgeEntity instance containing updated information.
         :return: A boolean indicating the success of the operation. Returns True if successful, raises an error otherwise.
         """
+        values = self.map_bridge_price_to_erp_values(bridge_entity=bridge_entity)
+
+        # Edits, writes and posts the current article
+        if not self.set_many(values):
+            raise ValueError(f"Couldn't write the special price of article {bridge_entity.get_erp_nr()} to the ERP.")
+
+        # If everything was successful, return True.
+        return True
 
-        # Begin editing the ERP data.
-        self.edit_()
+    def map_bridge_price_to_erp_values(self, bridge_entity, vk=0):
+        """
+        The special price fields of the ERP for the price of a bridge product, e.g. for set_many.
+        If a special price is set, which is active or starts in the future, price and date window are set.
+        They are only reset, if the special price is empty or expired, a planned campaign is kept.
 
-        # Fetch the price entity related to marketplace 1. We're only updating the price for marketplace 1 not all the marketplaces.
+        :param bridge_entity: The bridge product. Only the price for marketplace 1 is written, not all the marketplaces.
+        :param vk: The Vk of the article. Defaults to 0.
+        :return: dict field name -> value
+        """
         bridge_price_entity = bridge_entity.get_price_entity_for_marketplace()
 
-        # Check if a special price is active for the bridge price entity.
-        if bridge_price_entity.is_special_price_active():
-            # If the bridge price entity has a special price active, update the special start date, end date, and price in the ERP.
-            try:
-                self.set_special_start_date(vk=0, date_value=bridge_price_entity.get_special_start_date())
-                self.set_special_end_date(vk=0, date_value=bridge_price_entity.get_special_end_date())
-                self.set_special_price(bridge_price_entity.get_special_price())
-                self.set_special_rabatt_kz(vk=0, value=True)
-                self.set_special_skonto_kz(vk=0, value=True)
-
-            except Exception as e:  # Replace Exception with your custom made one
-                raise e
-
-        else:
-            # If the bridge price entity does not have a special price active, reset the special start date, end date, and price in the ERP.
-            try:
-                self.set_special_start_date(vk=0, date_value="")
-                self.set_special_end_date(vk=0, date_value="")
-                self.set_special_price(value=0)
-                self.set_special_rabatt_kz(vk=0, value=False)
-                self.set_special_skonto_kz(vk=0, value=False)
-
-            except Exception as e:  # Replace Exception with your custom made one
-                raise e
-
-        # Once all changes have been made, post them to the ERP.
-        self.post()
+        if bridge_price_entity.is_special_price_set():
+            return {
+                f"Vk{vk}.SVonDat": bridge_price_entity.get_special_start_date(),
+                f"Vk{vk}.SBisDat": bridge_price_entity.get_special_end_date(),
+                # The ERP expects a comma as decimal separator, see set_special_price
+                f"Vk{vk}.SPr": str(bridge_price_entity.get_special_price()).replace('.', ','),
+                f"Vk{vk}.SRabKz": 1,
+                f"VK{vk}.SSktoKz": 1
+            }
 
-        # If everything was successful, return True.
-        return True
+        return {
+            f"Vk{vk}.SVonDat": "",
+            f"Vk{vk}.SBisDat": "",
+            f"Vk{vk}.SPr": "0",
+            f"Vk{vk}.SRabKz": 0,
+            f"VK{vk}.SSktoKz": 0
+        }
 
-    def map_erp_price_to_bridge(self):
+    def get_price_read_fields(self):
         """
-        Function to map ERP price information to a bridge entity.
+        Fields read by map_erp_price_values, e.g. for the price-only sync.
+
+        :return: List of field names for iter_rows.
+        """
+        return ["ArtNr", "Vk0.Preis", "Vk0.Rab0.Mge", "Vk0.Rab0.Pr", "Vk0.SPr", "Vk0.SVonDat", "Vk0.SBisDat"]
+
+    def map_erp_price_values(self):
+        """
+        Read the price values of the current article.
 
         It checks if both or none rebate_quantity and rebate_price are present.
-        If either one is present, this function raises an exception with an appropriate error message.
 
         Returns:
-            price: A BridgePriceEntity object with assigned values from price retrieval methods.
-        Raises:
-            ValueError: When both or none of rebate_quantity and rebate_price are not present.
+            dict: price, rebate_quantity, rebate_price, special_price, special_start_date and special_end_date,
+                  None if only one of rebate_quantity and rebate_price is present.
         """
-        try:
-            # Retrieve rebate quantity and price
-            rebate_quantity = self.get_rebate_quantity()
-            rebate_price = self.get_rebate_price()
+        # Retrieve rebate quantity and price
+        rebate_quantity = self.get_rebate_quantity()
+        rebate_price = self.get_rebate_price()
+
+        # Both or None rebate quantity and price check
+        if (rebate_quantity is None and rebate_price is not None) or (
+                rebate_quantity is not None and rebate_price is None):
+            error_message = "Error: Both rebate_quantity and rebate_price should be present together. One of them is missing."
+
+            # Log an error into the logger
+            self.logger.error(error_message)
+            print(error_message)
+            return None
 
-            # Both or None rebate quantity and price check
-            if (rebate_quantity is None and rebate_price is not None) or (
-                    rebate_quantity is not None and rebate_price is None):
-                error_message = "Error: Both rebate_quantity and rebate_price should be present together. One of them is missing."
+        return {
+            'price': self.get_price(),
+            'rebate_quantity': rebate_quantity,
+            'rebate_price': rebate_price,
+            'special_price': self.get_special_price(),
+            'special_start_date': self.get_special_start_date(),
+            'special_end_date': self.get_special_end_date()
+        }
 
-                # Log an error into the logger
-                self.logger.error(error_message)
+    def map_erp_price_to_bridge(self):
+        """
+        Function to map ERP price information to a bridge entity.
 
-                # Raise a ValueError with an appropriate message
-                print(error_message)
+        Returns:
+            price: A BridgePriceEntity object with assigned values from price retrieval methods,
+                   None if the rebate values are incomplete (see map_erp_price_values).
+        """
+        try:
+            price_values = self.map_erp_price_values()
+            if price_values is None:
                 return
 
             # Create a price entity for the product
             price = BridgePriceEntity(
-                price=self.get_price(),
-                rebate_quantity=rebate_quantity,
-                rebate_price=rebate_price,
-                special_price=self.get_special_price(),
-                special_start_date=self.get_special_start_date(),
-                special_end_date=self.get_special_end_date(),
+                **price_values,
                 created_at=self.get_erstdat(),
                 edited_at=self.get_aenddat()
             )
@@ -172,10 +219,6 @@ class ERPArtikelEntity(ERPAbstractEntity):
             self.logger.error(f"An error occurred while mapping ERP price to bridge: {str(e)}")
             raise
 
-        except Exception as e:
-            # Log any exceptions that occur during the operation
-            self.logger.error(f"An error occurred while mapping ERP price to bridge: {str(e)}")
-
     def get_nr(self):
         """
         Fetches the article number from the dataset.
@@ -674,6 +717,70 @@ class ERPArtikelEntity(ERPAbstractEntity):
         sli_ums = self.get_nested_("SLiUms", "Jahr", jahr, return_field)
         return sli_ums
 
+    def get_nested_ums_matrix(self, return_fields=None, nested_dataset_name="Ums"):
+        """
+        Retrieve the revenue of all years in one pass through the nested dataset,
+        instead of one get_nested_ums call per year and field.
+
+        :param return_fields: The fields to retrieve, e.g. ["UmsJan", "UmsFeb"]. Defaults to all fields.
+        :param nested_dataset_name: "Ums", "StGUms" or "SLiUms".
+        :return: dict year -> {field: value}
+        """
+        return self.get_nested_matrix(nested_dataset_name=nested_dataset_name,
+                                      index_field="Jahr",
+                                      fields=return_fields)
+
+    def get_category_tree(self):
+        """
+        The category tree of the connection, built once and shared by all articles. See ERPCategoryTree.
+        """
+        return ERPCategoryTree.get_tree(erp=self._erp)
+
+    def get_available_categories(self):
+        """
+        Number of the available ArtKat fields, from the category tree instead of once per article.
+
+        :return: int or False, see ERPArtikelKategorienEntity.get_available_categories.
+        """
+        if getattr(self._erp, 'is_replay', False):
+            # Replayed rows (partition reader, snapshot) carry their ArtKat fields, there is no category dataset
+            return self.get_replayed_category_count()
+        return self.get_category_tree().get_available_categories()
+
+    def get_replayed_category_count(self):
+        """
+        :return: Number of the consecutive ArtKat fields of the replayed dataset, False without dataset.
+        """
+        dataset = self.get_created_dataset()
+        if dataset is None:
+            return False
+        field_names = {field.Name for field in dataset.Fields}
+        available_categories = 0
+        while f"ArtKat{available_categories + 1}" in field_names:
+            available_categories += 1
+        return available_categories
+
+    def get_category_fields(self):
+        """
+        :return: List of the ArtKat field names, e.g. ["ArtKat1", ..., "ArtKat10"].
+        """
+        available_categories = self.get_available_categories()
+        if not isinstance(available_categories, int):
+            return []
+        return [f"ArtKat{i}" for i in range(1, available_categories + 1)]
+
+    def get_category_paths(self):
+        """
+        Retrieve the categories of the article with their full paths, without further COM calls
+        if the ArtKat fields are prefetched.
+
+        :return: dict category number -> list of category numbers from the root, e.g. {110: [11, 1, 110]}
+        """
+        categories = self.get_categories_list()
+        if not categories:
+            return {}
+        return self.get_category_tree().get_paths(categories)
+
     def get_categories_list(self) -> list:
         """
         Retrieve all the category numbers available in the ERP.
@@ -687,10 +794,13 @@ class ERPArtikelEntity(ERPAbstractEntity):
         Raises:
             Exception: If there's an issue retrieving the category numbers.
         """
-        try:
-            # Initialize the ERPArtikelKategorienEntity to fetch available categories
+        prefetched = self.get_prefetched("@categories_list")
+        if prefetched is not self.NOT_PREFETCHED:
+            return prefetched
 
-            available_categories = ERPArtikelKategorienEntity().get_available_categories()
+        try:
+            # The number of categories comes from the category tree
+            available_categories = self.get_available_categories()
 
             # If available_categories is False or not an integer, return False
             if not isinstance(available_categories, int):
@@ -701,7 +811,7 @@ class ERPArtikelEntity(ERPAbstractEntity):
                 return False
 
             # Retrieve each category number from 'ArtKat1' up to 'ArtKat{available_categories}'
-            categories = [self.get_(f"ArtKat{i}") for i in range(1, available_categories + 1)]
+            categories = [self.get_(field_name) for field_name in self.get_category_fields()]
 
             # Remove empty or None category numbers from the list
             categories = [cat for cat in categories if cat]
@@ -716,8 +826,15 @@ class ERPArtikelEntity(ERPAbstractEntity):
             return False
 
     def get_storage_location(self):
+        prefetched = self.get_prefetched("@storage_location")
+        if prefetched is not self.NOT_PREFETCHED:
+            return prefetched
+
         if self.get_nr():
-            location = ERPLagerEntity(erp=self._erp, search_value=[self.get_nr(), 1]).get_position()
+            erp_lager = ERPLagerEntity(erp=self._erp, search_value=[self.get_nr(), 1])
+            location = erp_lager.get_position()
+            # Give the Lager dataset back to the pool, this runs once per article
+            erp_lager.release_created_dataset()
             if location:
                 self.logger.info("Storage location found: %s", location)
                 return location
@@ -1,4 +1,5 @@
 import json
+import logging
 from config import ERPConfig
 
 from ..entities.ERPAbstractEntity import ERPAbstractEntity
@@ -149,32 +150,36 @@ class ERPArtikelKategorienEntity(ERPAbstractEntity):
         :return: A list of integers representing the category number path,
                  or an empty list if the path is None or cannot be processed.
         """
-        try:
-            # Retrieve the raw number path
-            path_raw = self.get_("NrPath")  # e.g., "11/1/110"
-
-            if path_raw:
-                # Split the raw path string into a list of strings,
-                # then convert each string to an integer
-                path_list = [int(nr) for nr in path_raw.split('/')]
+        path_list = self.parse_nr_path(self.get_("NrPath"))  # e.g., "11/1/110"
+        if path_list:
+            # Log the successfully processed number path
+            self.logger.info(f"Successfully processed number path: {path_list}")
+        return path_list
 
-                # Log the successfully processed number path
-                self.logger.info(f"Successfully processed number path: {path_list}")
-
-                return path_list
+    @staticmethod
+    def parse_nr_path(path_raw):
+        """
+        Convert a NrPath like "11/1/110" into [11, 1, 110].
 
-            else:
-                # Log a warning if path_raw is None or an empty string
-                self.logger.warning("The number path is None or empty.")
+        :return: A list of integers or an empty list if the path is None or cannot be processed.
+        """
+        logger = logging.getLogger(ERPArtikelKategorienEntity.__name__)
+        if not path_raw:
+            # Log a warning if path_raw is None or an empty string
+            logger.warning("The number path is None or empty.")
+            return []
 
+        try:
+            # Split the raw path string into a list of strings,
+            # then convert each string to an integer
+            return [int(nr) for nr in path_raw.split('/')]
         except ValueError as e:
             # Log an error if a part of the path is not convertible to an integer
-            self.logger.error(f"Error converting number path to integers: {e}")
-
+            logger.error(f"Error converting number path to integers: {e}")
         except Exception as e:
             # Catch any other exceptions that may occur
-            self.logger.error(f"An unexpected error occurred: {e}")
-        # Return an empty list in case of an error or if path_raw is None or empty
+            logger.error(f"An unexpected error occurred: {e}")
+        # Return an empty list in case of an error
         return []
 
     def __repr__(self):
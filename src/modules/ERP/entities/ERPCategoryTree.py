@@ -0,0 +1,111 @@
+"""
+In-memory tree of the ERP article categories (ArtikelKategorien). It is read once per connection
+in one pass and answers the categories of the articles and their paths without further COM calls.
+
+Examples:
+    category_tree = ERPCategoryTree.get_tree(erp=erp)
+    print(category_tree.get_path(110))          # [11, 1, 110]
+    print(category_tree.get_path_names(110))    # ['Werkzeug', 'Zangen', 'Seitenschneider']
+
+    erp_art = ERPArtikelEntity(erp=erp, search_value="204116")
+    print(erp_art.get_category_paths())         # {110: [11, 1, 110]}
+"""
+import logging
+
+from .ERPArtikelKategorienEntity import ERPArtikelKategorienEntity
+
+
+class ERPCategoryTree:
+    _tree = None
+    _tree_erp = None
+
+    def __init__(self, nodes, available_categories):
+        """
+        :param nodes: dict nr -> {'nr', 'parent', 'path', 'name'}
+        :param available_categories: Number of the ArtKat fields of an article.
+        """
+        self.nodes = nodes
+        self.available_categories = available_categories
+
+    @classmethod
+    def get_tree(cls, erp):
+        """
+        The tree of the connection, built on first use. Replayed connections (see ERPRowReplayConnection)
+        have no category dataset, they get the tree of the real connection if it is built, else an empty one.
+        """
+        if getattr(erp, 'is_replay', False):
+            return cls._tree if cls._tree is not None else cls(nodes={}, available_categories=False)
+        if cls._tree is None or cls._tree_erp is not erp:
+            cls._tree = cls.build(erp=erp)
+            cls._tree_erp = erp
+        return cls._tree
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Drop the tree, e.g. at the start of a sync. It is built again on the next use.
+        """
+        cls._tree = None
+        cls._tree_erp = None
+
+    @classmethod
+    def build(cls, erp):
+        logger = logging.getLogger(cls.__name__)
+        nodes = {}
+        available_categories = False
+        try:
+            erp_kategorien = ERPArtikelKategorienEntity(erp=erp)
+            try:
+                available_categories = erp_kategorien.get_available_categories()
+                for row in erp_kategorien.iter_rows(fields=["Nr", "ParentNr", "NrPath", "Bez"]):
+                    nodes[row["Nr"]] = {
+                        'nr': row["Nr"],
+                        'parent': row.get("ParentNr") or None,
+                        'path': ERPArtikelKategorienEntity.parse_nr_path(row.get("NrPath")),
+                        'name': row.get("Bez")
+                    }
+            finally:
+                erp_kategorien.release_created_dataset()
+        except Exception as e:
+            logger.error(f"An error occurred while building the category tree: {str(e)}")
+
+        tree = cls(nodes=nodes, available_categories=available_categories)
+        # Categories without NrPath get their path from the parents
+        for node in nodes.values():
+            if not node['path']:
+                node['path'] = tree._build_path(node['nr'])
+        logger.info(f"Built category tree with {len(nodes)} categories.")
+        return tree
+
+    def _build_path(self, nr):
+        path = []
+        while nr is not None and nr in self.nodes and nr not in path:
+            path.insert(0, nr)
+            nr = self.nodes[nr]['parent']
+        return path
+
+    def get_available_categories(self):
+        return self.available_categories
+
+    def get_node(self, nr):
+        return self.nodes.get(nr)
+
+    def get_parent(self, nr):
+        node = self.nodes.get(nr)
+        return node['parent'] if node else None
+
+    def get_path(self, nr):
+        """
+        :return: List of category numbers from the root to nr, empty if nr is unknown.
+        """
+        node = self.nodes.get(nr)
+        return list(node['path']) if node else []
+
+    def get_path_names(self, nr):
+        return [self.nodes[path_nr]['name'] for path_nr in self.get_path(nr) if path_nr in self.nodes]
+
+    def get_paths(self, nrs):
+        """
+        :return: dict nr -> path for the given category numbers.
+        """
+        return {nr: self.get_path(nr) for nr in nrs}
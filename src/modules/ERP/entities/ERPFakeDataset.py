@@ -0,0 +1,474 @@
+"""
+In-memory stand-in for the büro+ microtech COM objects. It mimics the small part of the
+DataSet API the entities use (Fields, FieldType, AsString & Co., First/Next/Eof, FindKey, NestedDataSets,
+SetRange/ApplyRange, Edit/Post ...), so entities can be created, mapped and benchmarked
+on Linux without a running ERP.
+
+Every COM property access and method call is counted in `call_count`. With `latency`
+(seconds) every call additionally waits like a cross-process COM call would.
+
+Examples:
+    Benchmark the bulk reader against the per-field reader:
+    rows = [{"ArtNr": f"{nr:06d}", "LagMge": nr % 50, "KuBez5": f"Artikel {nr}"} for nr in range(30000)]
+    erp = ERPFakeConnection(datasets={
+        "Artikel": ERPFakeDataset(
+            name="Artikel",
+            field_types={"ArtNr": "String", "LagMge": "Float", "KuBez5": "WideString"},
+            rows=rows,
+            indices={"Nr": ["ArtNr"]})
+    })
+    erp_art = ERPArtikelEntity(erp=erp, search_value="000000", range_end="999999")
+    for row in erp_art.iter_rows(fields=["ArtNr", "LagMge", "KuBez5"]):
+        pass
+    print(erp.call_count)
+"""
+import time
+from datetime import datetime
+from typing import List, Dict, Any
+
+
+class ERPFakeCallCounter:
+    """
+    Counts the simulated COM calls of all fake objects of one connection.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.calls = 0
+        self.latency = latency
+
+    def hit(self):
+        self.calls += 1
+        if self.latency:
+            # time.sleep is too coarse for microsecond latencies
+            end = time.perf_counter() + self.latency
+            while time.perf_counter() < end:
+                pass
+
+
+class ERPFakeField:
+    """
+    A single field of an ERPFakeDataset. Values are always read from the current row of the dataset.
+    """
+
+    def __init__(self, dataset, name: str, field_type: str, info: str = ""):
+        self._dataset = dataset
+        self.Name = name
+        self.Info = info or name
+        self._field_type = field_type
+
+    @property
+    def FieldType(self):
+        self._dataset._counter.hit()
+        return self._field_type
+
+    def _read(self):
+        self._dataset._counter.hit()
+        return self._dataset._current_value(self.Name)
+
+    def _write(self, value):
+        self._dataset._counter.hit()
+        self._dataset._write_value(self.Name, value)
+
+    @property
+    def AsString(self):
+        value = self._read()
+        return "" if value is None else str(value)
+
+    @AsString.setter
+    def AsString(self, value):
+        self._write(value)
+
+    @property
+    def AsFloat(self):
+        value = self._read()
+        return float(value) if value not in (None, "") else 0.0
+
+    @AsFloat.setter
+    def AsFloat(self, value):
+        self._write(value)
+
+    @property
+    def AsInteger(self):
+        value = self._read()
+        return int(value) if value not in (None, "") else 0
+
+    @AsInteger.setter
+    def AsInteger(self, value):
+        self._write(value)
+
+    @property
+    def AsDatetime(self):
+        return self._read()
+
+    @AsDatetime.setter
+    def AsDatetime(self, value):
+        self._write(value)
+
+    @property
+    def Text(self):
+        value = self._read()
+        return "" if value is None else str(value)
+
+    @Text.setter
+    def Text(self, value):
+        self._write(value)
+
+
+class ERPFakeFields:
+    """
+    The Fields collection. Supports Fields("Name"), Fields.Item("Name") and iteration.
+    """
+
+    def __init__(self, dataset, field_types: Dict[str, str]):
+        self._dataset = dataset
+        self._fields = {name: ERPFakeField(dataset, name, field_type) for name, field_type in field_types.items()}
+
+    def __call__(self, name: str) -> ERPFakeField:
+        return self.Item(name)
+
+    def Item(self, name: str) -> ERPFakeField:
+        self._dataset._counter.hit()
+        if name not in self._fields:
+            raise KeyError(f"Field '{name}' not found in {self._dataset.Name}")
+        return self._fields[name]
+
+    @property
+    def Count(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        return iter(self._fields.values())
+
+
+class ERPFakeIndex:
+    def __init__(self, dataset, name: str, field_names: List[str]):
+        self._dataset = dataset
+        self.Name = name
+        self.IndexFields = [dataset.Fields._fields[field_name] for field_name in field_names
+                            if field_name in dataset.Fields._fields]
+
+    def Select(self):
+        self._dataset._counter.hit()
+
+
+class ERPFakeIndices:
+    """
+    The Indices collection. Supports Indices("Name"), Indices.Item("Name") and iteration.
+    """
+
+    def __init__(self, dataset, indices: Dict[str, List[str]]):
+        self._dataset = dataset
+        self._indices = {name: ERPFakeIndex(dataset, name, field_names) for name, field_names in indices.items()}
+
+    def __call__(self, name: str) -> ERPFakeIndex:
+        return self.Item(name)
+
+    def Item(self, name: str) -> ERPFakeIndex:
+        self._dataset._counter.hit()
+        return self._indices[name]
+
+    def __iter__(self):
+        return iter(self._indices.values())
+
+
+class ERPFakeDataset:
+    """
+    Fake of a created COM dataset. Holds a list of rows (dicts) and a cursor on them.
+
+    Parameters:
+        name (str): Name of the dataset, e.g. "Artikel".
+        field_types (dict): Field name -> microtech FieldType (String, WideString, Float, Integer, ...).
+        rows (list): List of dicts, one per record.
+        indices (dict, optional): Index name -> list of field names. Used by FindKey and SetRange.
+        counter (ERPFakeCallCounter, optional): Shared call counter. Set by ERPFakeConnection.
+        nested (dict, optional): Nested dataset name -> {'field_types': ..., 'indices': ...}.
+            The nested rows are stored as list in the row under the name of the nested dataset,
+            e.g. {"ArtNr": "204116", "Ums": [{"Jahr": 2023, "UmsGes": 120.0}]}
+    """
+
+    def __init__(self,
+                 name: str,
+                 field_types: Dict[str, str],
+                 rows: List[Dict[str, Any]],
+                 indices: Dict[str, List[str]] = None,
+                 counter: ERPFakeCallCounter = None,
+                 nested: Dict[str, Dict[str, Any]] = None):
+        self.Name = name
+        self._field_types = field_types
+        self._all_rows = rows
+        self._rows = rows
+        self._indices = indices or {}
+        self._counter = counter or ERPFakeCallCounter()
+        self._nested = nested or {}
+        self._nested_datasets = {}
+        self.Fields = ERPFakeFields(self, field_types)
+        self.Indices = ERPFakeIndices(self, self._indices)
+
+        self._position = 0
+        self._ranged = False
+        self._range = None
+        self._edit_buffer = None
+        self.State = 1  # dsBrowse
+        self.Filter = ""
+        self.Filtered = False
+
+    def clone(self, counter: ERPFakeCallCounter = None):
+        """
+        Returns a new dataset on the same rows, like DataSetInfos.Item(name).CreateDataSet() does.
+        """
+        return ERPFakeDataset(name=self.Name,
+                              nested=self._nested,
+                              field_types=self._field_types,
+                              rows=self._all_rows,
+                              indices=self._indices,
+                              counter=counter or self._counter)
+
+    """ Cursor """
+    def _current_value(self, field_name):
+        if self._edit_buffer is not None:
+            return self._edit_buffer.get(field_name)
+        if 0 <= self._position < len(self._rows):
+            return self._rows[self._position].get(field_name)
+        return None
+
+    def NestedDataSets(self, name: str):
+        """
+        The nested dataset always shows the nested rows of the current row.
+        """
+        self._counter.hit()
+        nested_dataset = self._nested_datasets.get(name)
+        if nested_dataset is None:
+            if name not in self._nested:
+                raise KeyError(f"Nested dataset '{name}' not found in {self.Name}")
+            nested_dataset = ERPFakeNestedDataset(master=self,
+                                                  name=name,
+                                                  field_types=self._nested[name]['field_types'],
+                                                  indices=self._nested[name].get('indices'),
+                                                  counter=self._counter)
+            self._nested_datasets[name] = nested_dataset
+        return nested_dataset
+
+    def get_current_row(self):
+        """
+        The whole current row, including values which are no fields (e.g. prefetched extras of a replay).
+        Not part of the COM API.
+        """
+        if 0 <= self._position < len(self._rows):
+            return self._rows[self._position]
+        return None
+
+    def _write_value(self, field_name, value):
+        if self._edit_buffer is None:
+            raise RuntimeError(f"Dataset {self.Name} is not in edit or insert mode")
+        self._edit_buffer[field_name] = value
+
+    def First(self):
+        self._counter.hit()
+        self._position = 0
+
+    def Next(self):
+        self._counter.hit()
+        self._position += 1
+
+    @property
+    def Eof(self):
+        self._counter.hit()
+        return self._position >= len(self._rows)
+
+    @property
+    def RecordCount(self):
+        self._counter.hit()
+        return len(self._rows)
+
+    """ Keys and Ranges """
+    @staticmethod
+    def _normalize(value):
+        if isinstance(value, datetime):
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+    def _key(self, index_name, row):
+        return tuple(self._normalize(row.get(field)) for field in self._indices.get(index_name, [index_name]))
+
+    def _search_key(self, value):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        return tuple(self._normalize(v) for v in values)
+
+    def FindKey(self, index_name, value) -> bool:
+        self._counter.hit()
+        search_key = self._search_key(value)
+        for position, row in enumerate(self._rows):
+            if self._key(index_name, row)[:len(search_key)] == search_key:
+                self._position = position
+                return True
+        return False
+
+    def SetRange(self, index_name, range_start, range_end):
+        self._counter.hit()
+        self._range = (index_name, self._search_key(range_start), self._search_key(range_end))
+
+    def ApplyRange(self):
+        self._counter.hit()
+        if not self._range:
+            return
+        index_name, range_start, range_end = self._range
+        self._rows = [row for row in self._all_rows
+                      if range_start <= self._key(index_name, row)[:len(range_start)]
+                      and self._key(index_name, row)[:len(range_end)] <= range_end]
+        self._ranged = True
+        self._position = 0
+
+    def CancelRange(self):
+        self._counter.hit()
+        self._rows = self._all_rows
+        self._ranged = False
+        self._range = None
+        self._position = 0
+
+    def IsRanged(self):
+        self._counter.hit()
+        return self._ranged
+
+    """ Edit """
+    def Edit(self):
+        self._counter.hit()
+        self._edit_buffer = dict(self._rows[self._position])
+        self.State = 2  # dsEdit
+
+    def Append(self):
+        self._counter.hit()
+        self._edit_buffer = {}
+        self.State = 3  # dsInsert
+
+    def Insert(self):
+        self.Append()
+
+    def Post(self):
+        self._counter.hit()
+        if self.State == 2:
+            self._rows[self._position].update(self._edit_buffer)
+        elif self.State == 3:
+            self._all_rows.append(self._edit_buffer)
+            if self._rows is not self._all_rows:
+                self._rows.append(self._edit_buffer)
+            self._position = len(self._rows) - 1
+        self._edit_buffer = None
+        self.State = 1
+
+    def Cancel(self):
+        self._counter.hit()
+        self._edit_buffer = None
+        self.State = 1
+
+    def Delete(self):
+        self._counter.hit()
+        row = self._rows.pop(self._position)
+        if self._rows is not self._all_rows:
+            self._all_rows.remove(row)
+
+    def TryStartTransaction(self):
+        self._counter.hit()
+        return True
+
+    def StartTransaction(self):
+        self._counter.hit()
+
+    def Commit(self):
+        self._counter.hit()
+
+    def Rollback(self):
+        self._counter.hit()
+        self.Cancel()
+
+
+class ERPFakeNestedDataset(ERPFakeDataset):
+    """
+    Nested dataset of an ERPFakeDataset, e.g. "Ums" of an article. Its rows are the nested rows
+    of the current row of the master dataset.
+    """
+
+    def __init__(self, master: ERPFakeDataset, name: str, field_types: Dict[str, str],
+                 indices: Dict[str, List[str]] = None, counter: ERPFakeCallCounter = None):
+        self._master = master
+        super().__init__(name=name, field_types=field_types, rows=[], indices=indices, counter=counter)
+
+    @property
+    def _rows(self):
+        master_row = self._master.get_current_row()
+        return master_row.get(self.Name, []) if master_row else []
+
+    @_rows.setter
+    def _rows(self, rows):
+        # The rows always come from the master
+        pass
+
+    @property
+    def _all_rows(self):
+        return self._rows
+
+    @_all_rows.setter
+    def _all_rows(self, rows):
+        pass
+
+
+class ERPFakeDataSetInfo:
+    def __init__(self, dataset: ERPFakeDataset, counter: ERPFakeCallCounter):
+        self._dataset = dataset
+        self._counter = counter
+        self.Name = dataset.Name
+        self.Bez = dataset.Name
+
+    def CreateDataSet(self) -> ERPFakeDataset:
+        self._counter.hit()
+        return self._dataset.clone(counter=self._counter)
+
+
+class ERPFakeDataSetInfos:
+    def __init__(self, datasets: Dict[str, ERPFakeDataset], counter: ERPFakeCallCounter):
+        self._infos = {name: ERPFakeDataSetInfo(dataset, counter) for name, dataset in datasets.items()}
+        self._counter = counter
+
+    def Item(self, name: str) -> ERPFakeDataSetInfo:
+        self._counter.hit()
+        return self._infos[name]
+
+    def __iter__(self):
+        return iter(self._infos.values())
+
+    def __bool__(self):
+        return True
+
+
+class ERPFakeConnection:
+    """
+    Fake of the BpNT.Application object returned by ERPConnectionController.get_erp().
+    Pass it as `erp` to any ERP entity.
+
+    Parameters:
+        datasets (dict): Dataset name -> ERPFakeDataset.
+        latency (float, optional): Simulated seconds per COM call. Defaults to 0.
+        is_replay (bool, optional): True if the datasets replay rows of another connection, e.g. a snapshot.
+            Entities then answer lookups of other datasets (e.g. the category tree) from their rows.
+    """
+
+    def __init__(self, datasets: Dict[str, ERPFakeDataset], latency: float = 0.0, is_replay: bool = False):
+        self._counter = ERPFakeCallCounter(latency=latency)
+        self.is_replay = is_replay
+        self.DataSetInfos = ERPFakeDataSetInfos(datasets=datasets, counter=self._counter)
+
+    @property
+    def call_count(self) -> int:
+        return self._counter.calls
+
+    def reset_call_count(self):
+        self._counter.calls = 0
+
+    def GetMandState(self):
+        self._counter.hit()
+        return 1
+
+    def DeInit(self):
+        pass
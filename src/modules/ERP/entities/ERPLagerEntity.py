@@ -27,6 +27,14 @@ class ERPLagerEntity(ERPAbstractEntity):
             range_end=range_end
         )
 
+    def get_bulk_read_fields(self):
+        """
+        Fields read by the stock sync, see ERPLagerController.sync_stock_to_bridge.
+
+        :return: List of field names for iter_rows.
+        """
+        return ["ArtNr", "LagNr", "Mge", "Pos"]
+
     def map_erp_to_bridge(self):
         pass
 
@@ -49,6 +57,18 @@ class ERPLagerEntity(ERPAbstractEntity):
             self.logger.error(f"Error on converting '{id_value}' into an integer for ID.")
             return None
 
+    def get_artikel_nr(self):
+        """
+        Fetches the article number (ArtNr) of the stock entry.
+        :return: Article number as a string or None if not found.
+        """
+        art_nr = self.get_("ArtNr")
+        if not art_nr:
+            self.logger.warning("ArtNr is empty.")
+            return None
+
+        return str(art_nr)
+
     def get_description(self):
         """
         Fetches the description (Bezeichnung) from the dataset.
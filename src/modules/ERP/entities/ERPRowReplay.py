@@ -0,0 +1,274 @@
+"""
+Read-only replay of rows read from büro+ in another process, e.g. by an ERPPartitionReader.
+It answers the part of the DataSet API the entities need to map a row (Fields, Indices, FindKey,
+First/Next/Eof), so map_erp_to_bridge and set_relations run unchanged on the replayed rows.
+
+One connection is created per sync and the rows of every chunk are loaded into it. The connection
+stays the same object, so the field descriptors (cached per connection) and the entity are built once.
+
+Examples:
+    replay_erp = ERPRowReplayConnection(layout=ERPArtikelEntity(erp=erp).get_row_layout())
+    erp_art = ERPArtikelEntity(erp=replay_erp)
+    for rows in chunks:
+        replay_erp.load_rows(rows)
+        with erp_art.visit_key(rows[0]["ArtNr"], row=rows[0]) as found:
+            ...
+"""
+from datetime import datetime
+from typing import List, Dict, Any
+
+
+class ERPRowReplayField:
+    """
+    A field of an ERPRowReplayDataset. Values are read from the current row of the dataset.
+    """
+
+    def __init__(self, dataset, name: str, field_type: str):
+        self._dataset = dataset
+        self.Name = name
+        self.Info = name
+        self.FieldType = field_type
+
+    def _read(self):
+        return self._dataset.get_current_value(self.Name)
+
+    @property
+    def AsString(self):
+        value = self._read()
+        return "" if value is None else str(value)
+
+    @property
+    def AsFloat(self):
+        value = self._read()
+        return float(value) if value not in (None, "") else 0.0
+
+    @property
+    def AsInteger(self):
+        value = self._read()
+        return int(value) if value not in (None, "") else 0
+
+    @property
+    def AsDatetime(self):
+        return self._read()
+
+    @property
+    def Text(self):
+        value = self._read()
+        return "" if value is None else str(value)
+
+
+class ERPRowReplayFields:
+    def __init__(self, dataset, field_types: Dict[str, str]):
+        self._dataset = dataset
+        self._fields = {name: ERPRowReplayField(dataset, name, field_type)
+                        for name, field_type in field_types.items()}
+
+    def __call__(self, name: str) -> ERPRowReplayField:
+        return self.Item(name)
+
+    def Item(self, name: str) -> ERPRowReplayField:
+        if name not in self._fields:
+            raise KeyError(f"Field '{name}' is not replayed in {self._dataset.Name}")
+        return self._fields[name]
+
+    @property
+    def Count(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        return iter(self._fields.values())
+
+
+class ERPRowReplayIndex:
+    def __init__(self, dataset, name: str, field_names: List[str]):
+        self.Name = name
+        self.IndexFields = [dataset.Fields.Item(field_name) for field_name in field_names
+                            if field_name in dataset.Fields._fields]
+
+    def Select(self):
+        pass
+
+
+class ERPRowReplayIndices:
+    def __init__(self, dataset, indices: Dict[str, List[str]]):
+        self._indices = {name: ERPRowReplayIndex(dataset, name, field_names) for name, field_names in indices.items()}
+
+    def __call__(self, name: str) -> ERPRowReplayIndex:
+        return self.Item(name)
+
+    def Item(self, name: str) -> ERPRowReplayIndex:
+        return self._indices[name]
+
+    def __iter__(self):
+        return iter(self._indices.values())
+
+
+class ERPRowReplayDataset:
+    """
+    The rows of the current chunk and a cursor on them. FindKey looks the key up in a dict,
+    which is built once per chunk.
+
+    Parameters:
+        name (str): Name of the dataset, e.g. "Artikel".
+        field_types (dict): Field name -> microtech FieldType of the replayed fields.
+        indices (dict): Index name -> list of field names.
+    """
+
+    def __init__(self, name: str, field_types: Dict[str, str], indices: Dict[str, List[str]]):
+        self.Name = name
+        self._indices = indices
+        self.Fields = ERPRowReplayFields(self, field_types)
+        self.Indices = ERPRowReplayIndices(self, indices)
+        self.State = 1  # dsBrowse
+        self.Filter = ""
+        self.Filtered = False
+        self._rows = []
+        self._keys = {}
+        self._position = 0
+
+    def load_rows(self, rows: List[Dict[str, Any]]):
+        """
+        Replace the replayed rows, e.g. by the next chunk.
+        """
+        self._rows = rows
+        self._keys = {}
+        self._position = 0
+
+    @staticmethod
+    def _normalize(value):
+        if isinstance(value, datetime):
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+    def _get_keys(self, index_name):
+        keys = self._keys.get(index_name)
+        if keys is None:
+            field_names = self._indices.get(index_name, [index_name])
+            keys = {}
+            for position, row in enumerate(self._rows):
+                keys.setdefault(tuple(self._normalize(row.get(field_name)) for field_name in field_names), position)
+            self._keys[index_name] = keys
+        return keys
+
+    """ Cursor """
+    def get_current_row(self):
+        """
+        The whole current row, including the extras of the reader. Not part of the COM API.
+        """
+        if 0 <= self._position < len(self._rows):
+            return self._rows[self._position]
+        return None
+
+    def get_current_value(self, field_name):
+        row = self.get_current_row()
+        return row.get(field_name) if row is not None else None
+
+    def First(self):
+        self._position = 0
+
+    def Next(self):
+        self._position += 1
+
+    @property
+    def Eof(self):
+        return self._position >= len(self._rows)
+
+    @property
+    def RecordCount(self):
+        return len(self._rows)
+
+    def FindKey(self, index_name, value) -> bool:
+        values = value if isinstance(value, (list, tuple)) else [value]
+        position = self._get_keys(index_name).get(tuple(self._normalize(v) for v in values))
+        if position is None:
+            return False
+        self._position = position
+        return True
+
+    """ Ranges, the replay only holds the rows of the range """
+    def SetRange(self, index_name, range_start, range_end):
+        pass
+
+    def ApplyRange(self):
+        self._position = 0
+
+    def CancelRange(self):
+        self._position = 0
+
+    def IsRanged(self):
+        return False
+
+    def NestedDataSets(self, name: str):
+        raise KeyError(f"Nested dataset '{name}' is not replayed, add its values to get_bulk_read_extras")
+
+    """ Edit, the replay is read only """
+    def Edit(self):
+        raise RuntimeError(f"Replayed dataset {self.Name} is read only")
+
+    def Append(self):
+        self.Edit()
+
+    def Insert(self):
+        self.Edit()
+
+    def Delete(self):
+        self.Edit()
+
+    def Cancel(self):
+        pass
+
+
+class ERPRowReplayDataSetInfo:
+    def __init__(self, dataset: ERPRowReplayDataset):
+        self._dataset = dataset
+        self.Name = dataset.Name
+        self.Bez = dataset.Name
+
+    def CreateDataSet(self) -> ERPRowReplayDataset:
+        # All entities share the dataset, so they see the rows loaded into the connection
+        return self._dataset
+
+
+class ERPRowReplayDataSetInfos:
+    def __init__(self, dataset: ERPRowReplayDataset):
+        self._info = ERPRowReplayDataSetInfo(dataset)
+
+    def Item(self, name: str) -> ERPRowReplayDataSetInfo:
+        if name != self._info.Name:
+            raise KeyError(f"Dataset '{name}' is not replayed, only {self._info.Name}")
+        return self._info
+
+    def __iter__(self):
+        return iter([self._info])
+
+    def __bool__(self):
+        return True
+
+
+class ERPRowReplayConnection:
+    """
+    Stands in for the BpNT.Application object while rows are replayed. Pass it as `erp` to the entity class.
+
+    Parameters:
+        layout (dict): Row layout of the reader, see ERPAbstractEntity.get_row_layout.
+    """
+    # Entities check it to answer from their rows instead of other datasets, e.g. the category tree
+    is_replay = True
+
+    def __init__(self, layout: Dict[str, Any]):
+        self.dataset = ERPRowReplayDataset(name=layout['dataset_name'],
+                                           field_types=layout['field_types'],
+                                           indices=layout['indices'])
+        self.DataSetInfos = ERPRowReplayDataSetInfos(self.dataset)
+
+    def load_rows(self, rows: List[Dict[str, Any]]):
+        self.dataset.load_rows(rows)
+
+    def GetMandState(self):
+        return 1
+
+    def DeInit(self):
+        pass
@@ -0,0 +1,275 @@
+"""
+Snapshots of a (ranged) ERP dataset in a columnar file, so the bridge mapping can be run,
+tested and benchmarked on the full data without büro+ microtech.
+
+Two formats are supported, chosen by the file extension. Both libraries are optional:
+- .parquet: needs pyarrow, the rows are written chunk by chunk while the dataset is read.
+- .npz: needs numpy, one typed array per field. The npz format can't be appended to, so it does
+  not stream: every chunk is kept in memory as typed arrays and the file is written when the
+  snapshot is closed. Use .parquet for ranges which don't fit into memory.
+  Empty int and string values are stored in a null mask per column, so None stays None.
+
+The field types, the index and the dataset name are stored with the data. Extras
+(see ERPAbstractEntity.get_bulk_read_extras) are stored as JSON columns.
+
+Examples:
+    Export on the Windows machine:
+    erp_art = ERPArtikelEntity(erp=erp, search_value="090000", range_end="999999")
+    erp_art.export_snapshot("artikel.parquet", with_extras=True)
+
+    Replay anywhere, the entity reads the snapshot through get_ and range_next:
+    erp_art = ERPSnapshotReader("artikel.parquet").create_entity(ERPArtikelEntity)
+    erp_art.range_first()
+    while not erp_art.range_eof():
+        bridge_product = erp_art.map_erp_to_bridge()
+        erp_art.range_next()
+"""
+import datetime
+import json
+import os
+from typing import List, Dict, Any
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .ERPFakeDataset import ERPFakeConnection, ERPFakeDataset
+
+# Key of the layout in the Parquet schema metadata and in the npz file
+SNAPSHOT_META_KEY = "gc_bridge_snapshot"
+
+# Column kinds of the microtech FieldTypes, everything else is stored as string
+FIELD_TYPE_KINDS = {
+    'Float': 'float',
+    'Integer': 'int',
+    'Boolean': 'int',
+    'Byte': 'int',
+    'AutoInc': 'int',
+    'Date': 'datetime',
+    'DateTime': 'datetime',
+}
+
+
+def get_snapshot_format(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".npz":
+        return "npz"
+    if extension == ".parquet":
+        return "parquet"
+    raise ValueError(f"Unknown snapshot format: {file_path}. Use .parquet or .npz")
+
+
+def to_plain_value(value, kind):
+    if kind == 'datetime':
+        if isinstance(value, datetime.datetime):
+            # pywintypes datetimes are converted to plain datetimes
+            return datetime.datetime(value.year, value.month, value.day,
+                                     value.hour, value.minute, value.second, value.microsecond)
+        return None
+    if kind == 'float':
+        return float(value) if value not in (None, "") else None
+    if kind == 'int':
+        return int(value) if value not in (None, "") else None
+    return None if value is None else str(value)
+
+
+class ERPSnapshotWriter:
+    """
+    Writes rows of iter_rows into a snapshot file.
+
+    Parameters:
+        file_path (str): Target file, .parquet or .npz.
+        layout (dict): Row layout, see ERPAbstractEntity.get_row_layout.
+        extras (list, optional): Row keys of the extras, stored as JSON.
+    """
+
+    def __init__(self, file_path: str, layout: Dict[str, Any], extras: List[str] = None):
+        self.file_path = file_path
+        self.format = get_snapshot_format(file_path)
+        self.layout = layout
+        self.extras = list(extras or [])
+        self.kinds = {field_name: FIELD_TYPE_KINDS.get(field_type, 'string')
+                      for field_name, field_type in layout['field_types'].items()}
+        self.rows_written = 0
+
+        if self.format == "parquet" and pyarrow is None:
+            raise ImportError("pyarrow is needed for .parquet snapshots")
+        if self.format == "npz" and numpy is None:
+            raise ImportError("numpy is needed for .npz snapshots")
+
+        self._parquet_writer = None
+        self._schema = None
+        # npz: column name -> list of (array, null mask) per chunk, see to_array
+        self._columns = {column: [] for column in list(self.kinds) + self.extras}
+
+    def get_meta(self) -> Dict[str, Any]:
+        return dict(self.layout, extras=self.extras)
+
+    def write_rows(self, rows: List[Dict[str, Any]]):
+        """
+        Append a chunk of rows.
+        """
+        columns = {field_name: [to_plain_value(row.get(field_name), kind) for row in rows]
+                   for field_name, kind in self.kinds.items()}
+        for extra in self.extras:
+            columns[extra] = [json.dumps(row.get(extra), default=str) for row in rows]
+
+        if self.format == "parquet":
+            if self._parquet_writer is None:
+                self._schema = self._build_arrow_schema()
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(self.file_path, self._schema)
+            self._parquet_writer.write_batch(pyarrow.RecordBatch.from_pydict(columns, schema=self._schema))
+        else:
+            # Typed arrays instead of python values, the whole snapshot is held until close
+            for column, values in columns.items():
+                self._columns[column].append(self.to_array(values, self.kinds.get(column, 'string')))
+
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self.format == "parquet":
+            if self._parquet_writer is None:
+                # No rows, still write the schema and layout
+                self._schema = self._build_arrow_schema()
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(self.file_path, self._schema)
+            self._parquet_writer.close()
+            self._parquet_writer = None
+            return
+
+        arrays = {}
+        masks = {}
+        for position, (column, chunks) in enumerate(self._columns.items()):
+            if not chunks:
+                chunks = [self.to_array([], self.kinds.get(column, 'string'))]
+            arrays[f"c{position}"] = numpy.concatenate([array for array, _ in chunks])
+            if any(mask is not None for _, mask in chunks):
+                masks[f"m{position}"] = numpy.concatenate([
+                    mask if mask is not None else numpy.zeros(len(array), dtype=bool) for array, mask in chunks])
+        self._columns = {column: [] for column in self._columns}
+        # Column names are keys of the file, the layout maps them back
+        numpy.savez_compressed(self.file_path, **arrays, **masks,
+                               **{SNAPSHOT_META_KEY: numpy.array(json.dumps(dict(self.get_meta(),
+                                                                                 columns=list(self._columns))))})
+
+    @staticmethod
+    def to_array(values, kind):
+        """
+        Convert the values of a column chunk into a typed array for npz.
+
+        :return: Tuple (array, null mask). The mask marks the None values of int and string columns,
+            it is None if there are none. Floats use NaN and datetimes NaT instead.
+        """
+        if kind == 'float':
+            return numpy.array([numpy.nan if value is None else value for value in values], dtype="float64"), None
+        if kind == 'datetime':
+            return numpy.array(values, dtype="datetime64[us]"), None
+
+        mask = numpy.array([value is None for value in values], dtype=bool)
+        if kind == 'int':
+            array = numpy.array([0 if value is None else value for value in values], dtype="int64")
+        else:
+            array = numpy.array(["" if value is None else value for value in values], dtype="str")
+        return array, mask if mask.any() else None
+
+    def _build_arrow_schema(self):
+        arrow_types = {
+            'float': pyarrow.float64(),
+            'int': pyarrow.int64(),
+            'datetime': pyarrow.timestamp("us"),
+            'string': pyarrow.string(),
+        }
+        fields = [pyarrow.field(field_name, arrow_types[kind]) for field_name, kind in self.kinds.items()]
+        fields += [pyarrow.field(extra, pyarrow.string()) for extra in self.extras]
+        return pyarrow.schema(fields, metadata={SNAPSHOT_META_KEY: json.dumps(self.get_meta())})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ERPSnapshotReader:
+    """
+    Loads a snapshot and replays it as an in-memory dataset.
+
+    Parameters:
+        file_path (str): Snapshot file, .parquet or .npz.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.format = get_snapshot_format(file_path)
+        self.meta = None
+        self.rows = None
+
+    def load(self):
+        """
+        Read the whole snapshot into self.rows, a list of dicts like iter_rows yields them.
+        """
+        if self.rows is not None:
+            return self.rows
+
+        if self.format == "parquet":
+            if pyarrow is None:
+                raise ImportError("pyarrow is needed for .parquet snapshots")
+            table = pyarrow.parquet.read_table(self.file_path)
+            self.meta = json.loads(table.schema.metadata[SNAPSHOT_META_KEY.encode()])
+            rows = table.to_pylist()
+        else:
+            if numpy is None:
+                raise ImportError("numpy is needed for .npz snapshots")
+            with numpy.load(self.file_path, allow_pickle=False) as npz:
+                self.meta = json.loads(str(npz[SNAPSHOT_META_KEY]))
+                columns = {column: self._array_to_list(npz[f"c{position}"],
+                                                       npz[f"m{position}"] if f"m{position}" in npz.files else None)
+                           for position, column in enumerate(self.meta['columns'])}
+            rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+        for row in rows:
+            for extra in self.meta['extras']:
+                row[extra] = json.loads(row[extra]) if row.get(extra) is not None else None
+
+        self.rows = rows
+        return self.rows
+
+    @staticmethod
+    def _array_to_list(array, mask=None):
+        if array.dtype.kind == 'M':
+            # NaT becomes None
+            return array.astype("datetime64[us]").tolist()
+        if array.dtype.kind == 'f':
+            return [None if value != value else value for value in array.tolist()]
+        values = array.tolist()
+        if mask is not None:
+            # Snapshots written before the null masks have none, their empty values stay 0 or ""
+            values = [None if is_null else value for value, is_null in zip(values, mask.tolist())]
+        return values
+
+    def get_connection(self, latency: float = 0.0) -> ERPFakeConnection:
+        """
+        Returns:
+            ERPFakeConnection: Pass it as `erp` to the entity class of the snapshot.
+        """
+        self.load()
+        dataset_name = self.meta['dataset_name']
+        return ERPFakeConnection(datasets={
+            dataset_name: ERPFakeDataset(name=dataset_name,
+                                         field_types=self.meta['field_types'],
+                                         rows=self.rows,
+                                         indices=self.meta['indices'])
+        }, latency=latency, is_replay=True)
+
+    def create_entity(self, entity_class, search_value=None, range_end=None, latency: float = 0.0):
+        """
+        Create an entity on the snapshot, e.g. create_entity(ERPArtikelEntity, "090000", "099999").
+        Extras of the snapshot are answered by get_prefetched.
+        """
+        return entity_class(erp=self.get_connection(latency=latency), search_value=search_value, range_end=range_end)
@@ -26,6 +26,8 @@ class ERPVorgangEntity(ERPAbstractEntity):
         self.order = None
         self.bridge_order = None  # Holds the order from the bridge
         self.erp_beleg_nr = None
+        # Name of the index on AuftrNr, False if there is none. Looked up on first use.
+        self._auftr_nr_index = None
 
     def get_erp_app_object_vorgang(self):
         """
@@ -52,30 +54,88 @@ class ERPVorgangEntity(ERPAbstractEntity):
             self.logger.error(f"An error occurred while fetching the 'soAppObject': {str(e)}")
             return None
 
-    def create_new_order(self, bridge_entity):
-        self.order = self.get_erp_app_object_vorgang()
+    @staticmethod
+    def get_auftr_nr(bridge_entity):
+        """
+        AuftrNr of the Vorgang of a bridge order. It identifies the Vorgang of the order in the ERP.
+        """
+        return f"SW6_{bridge_entity.get_order_number()}"
+
+    def find_beleg_nr_by_auftr_nr(self, auftr_nr):
+        """
+        Look up an existing Vorgang by its AuftrNr, so an order is not created twice.
+        Uses an index on AuftrNr if there is one, otherwise a filter on the dataset.
+
+        :param auftr_nr: AuftrNr, see get_auftr_nr.
+        :return: BelegNr of the Vorgang or None if there is none.
+        """
+        if self._auftr_nr_index is None:
+            self._auftr_nr_index = self.get_index_starting_with("AuftrNr") or False
+            if not self._auftr_nr_index:
+                self.logger.warning("No index on AuftrNr found, existing Vorgänge are looked up by a filter.")
+
+        dataset = self.get_created_dataset()
+        if self._auftr_nr_index:
+            if not dataset.FindKey(self._auftr_nr_index, auftr_nr):
+                return None
+            return dataset.Fields("BelegNr").AsString
+
+        try:
+            self.set_filter(f"AuftrNr = '{auftr_nr}'")
+            dataset.First()
+            if dataset.Eof:
+                return None
+            return dataset.Fields("BelegNr").AsString
+        finally:
+            dataset.Filtered = False
+
+    def create_new_order(self, bridge_entity, order=None, units=None):
+        """
+        Create the Vorgang of a bridge order with its positions.
+
+        :param bridge_entity: BridgeOrderEntity, the customer must be synced to the ERP already.
+        :param order: The soVorgang object to append the Vorgang to. Reuse it for many orders,
+            defaults to a new one.
+        :param units: Optional dict ArtNr -> raw unit, see ERPArtikelController.read_units.
+            Articles which are not in it are read one by one.
+        :return: BelegNr of the new Vorgang or False.
+        """
+        self.order = order or self.get_erp_app_object_vorgang()
+        if not self.order:
+            return False
         try:
-            if self.order:
-                self.order.Append(113, bridge_entity.customer.get_erp_nr())
+            self.order.Append(113, bridge_entity.customer.get_erp_nr())
         except AttributeError:
             self.logger.error(f"'{self.order}' object has no attribute 'Append'.")
+            self.order = None
             return False
 
+        created_dataset = self._created_dataset
         self._created_dataset = self.order.DataSet
+        try:
+            order_nr = self.get_auftr_nr(bridge_entity)
+            # The order dataset is in insert mode after Append, self.order.Post() saves it
+            if not self.set_many({
+                "AuftrNr": order_nr,
+                "Bez": f"GC Webshop-Bestellung Nr. EC{order_nr} vom {bridge_entity.get_purchase_date()}"
+            }):
+                raise ValueError(f"Could not write the head of the Vorgang for order {order_nr}.")
+
+            for detail in bridge_entity.order_details:
+                unit = units.get(str(detail.get_erp_nr())) if units else None
+                self.add_order_positions(order_detail=detail, unit=unit)
 
-        order_nr = f"SW6_{bridge_entity.get_order_number()}"
-        self.set_("AuftrNr", order_nr)
-        self.set_("Bez", f"GC Webshop-Bestellung Nr. EC{order_nr} vom {bridge_entity.get_purchase_date()}")
-
-        for detail in bridge_entity.order_details:
-            self.add_order_positions(order_detail=detail)
-
-        vorgang_nr = self.order.DataSet.Fields("BelegNr").AsString
-        print("Vorgang:", vorgang_nr)
-
-        self.order.Post()
+            self.order.Post()
+            vorgang_nr = self.order.DataSet.Fields("BelegNr").AsString
+            self.logger.info(f"Vorgang {vorgang_nr} created for order {order_nr}.")
+        except Exception:
+            self.order.Cancel()
+            raise
+        finally:
+            self._created_dataset = created_dataset
+            self.order = None
 
-        return True
+        return vorgang_nr
 
     def map_erp_to_bridge(self):
         pass
@@ -96,8 +156,7 @@ class ERPVorgangEntity(ERPAbstractEntity):
             self._created_dataset = self.order.DataSet
 
             # Set additional information in 'AuftrNr' field
-            self.set_('AuftrNr', "SW6_neu")
-            self.set_('SuchBeg',"CLisoeup")
+            self.set_many({'AuftrNr': "SW6_neu", 'SuchBeg': "CLisoeup"})
 
             # Save the order
             self.order.Post()
@@ -111,18 +170,22 @@ class ERPVorgangEntity(ERPAbstractEntity):
             # Clear the `order` attribute
             self.order = None
 
-    def add_order_positions(self, order_detail):
+    def add_order_positions(self, order_detail, unit=None):
         """
         Add order positions with details from bridge_entity_order_details.
         Args:
             bridge_entity_order_details (list): Details for each order position to add.
+            unit (str, optional): Raw unit of the article. If not given, it is read from the article.
         """
 
         # Assume that pos_detail has 'quantity', 'unit', 'id', and 'price' fields
-        erp_product = ERPArtikelEntity(search_value=order_detail.get_erp_nr())
+        if unit is None:
+            erp_product = ERPArtikelEntity(erp=self._erp, search_value=order_detail.get_erp_nr())
+            unit = erp_product.get_unit(raw=True)
+            erp_product.release_created_dataset()
         self.order.Positionen.Add(
             order_detail.get_quantity(),
-            erp_product.get_unit(raw=True),
+            unit,
             order_detail.get_erp_nr()
         )
         self.order.Positionen.DataSet.Edit()
@@ -0,0 +1,138 @@
+"""
+asyncio client for the Shopware 6 admin api. Independent requests, e.g. the media, product-media
+and visibility requests of a product, are sent concurrently, at most `concurrency` at a time.
+
+The requests are sent by the shared SW6ConnectionController in a thread pool, so they use its token,
+its keep-alive connection pool and its latency counters. Keep SW6Config.HTTP_POOL_SIZE at least as
+large as the concurrency, otherwise connections are dropped instead of being reused.
+
+Examples:
+    Async:
+    sw6_async = SW6AsyncClient(concurrency=8)
+    results = await sw6_async.gather(*[sw6_async.delete("product-media", api_id) for api_id in ids])
+
+    Sync facade, e.g. in a controller:
+    sw6_async = SW6AsyncClient()
+    results = sw6_async.run(*[sw6_async.delete("product-media", api_id) for api_id in ids])
+    errors = [result for result in results if isinstance(result, Exception)]
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SW6Config
+from .SW6ConnectionController import SW6ConnectionController
+
+
+class SW6AsyncClient:
+    def __init__(self, concurrency=None, sw6_client=None):
+        """
+        :param concurrency: Requests at a time. Defaults to SW6Config.ASYNC_CONCURRENCY or 8.
+        :param sw6_client: The admin client which sends the requests. Defaults to the shared SW6ConnectionController.
+        """
+        self.sw6_client = sw6_client or SW6ConnectionController()
+        self.concurrency = concurrency or getattr(SW6Config, "ASYNC_CONCURRENCY", 8)
+        self._executor = None
+        # A semaphore belongs to the event loop it is used in, see _get_semaphore
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="sw6-async")
+        return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    """ Requests """
+    async def call(self, func, *args, **kwargs):
+        """
+        Run a blocking function, e.g. a method of an SW6 entity, within the concurrency limit.
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    async def request(self, method, request_url, payload=None, update_header_fields=None,
+                      additional_query_params=None):
+        """
+        See SW6ConnectionController.request.
+        """
+        return await self.call(self.sw6_client.request, method, request_url, payload=payload,
+                               update_header_fields=update_header_fields,
+                               additional_query_params=additional_query_params)
+
+    async def search(self, endpoint_name, criteria=None):
+        return await self.request("post", f"/search/{endpoint_name}", payload=criteria)
+
+    async def search_ids(self, endpoint_name, criteria=None):
+        return await self.request("post", f"/search-ids/{endpoint_name}", payload=criteria)
+
+    async def get(self, endpoint_name, api_id):
+        return await self.request("get", f"/{endpoint_name}/{api_id}")
+
+    async def post(self, endpoint_name, payload, detailed_response=False):
+        return await self.request("post", f"/{endpoint_name}", payload=payload,
+                                  additional_query_params={"_response": "detail"} if detailed_response else None)
+
+    async def patch(self, endpoint_name, payload):
+        return await self.request("patch", f"/{endpoint_name}/{payload['id']}", payload=payload,
+                                  additional_query_params={"_response": "detail"})
+
+    async def delete(self, endpoint_name, api_id):
+        return await self.request("delete", f"/{endpoint_name}/{api_id}")
+
+    async def sync(self, endpoint_name, payloads, action="upsert", update_header_fields=None):
+        """
+        One _action/sync call, see SW6AbstractEntity.bulk_uploads.
+        """
+        payload = {
+            f"{action}-{endpoint_name}": {
+                "entity": endpoint_name,
+                "action": action,
+                "payload": payloads if isinstance(payloads, list) else [payloads]
+            }
+        }
+        return await self.request("post", "/_action/sync", payload=payload, update_header_fields=update_header_fields)
+
+    async def gather(self, *awaitables):
+        """
+        Wait for all requests. Failed requests do not cancel the others, their exception is returned
+        at their position in the results.
+        """
+        return await asyncio.gather(*awaitables, return_exceptions=True)
+
+    """ Sync facade """
+    def run(self, *awaitables):
+        """
+        Run the requests from synchronous code and wait for all of them.
+
+        :return: List of the results in the order of the requests, exceptions for the failed ones.
+        """
+        if not awaitables:
+            return []
+        return asyncio.run(self.gather(*awaitables))
+
+    def run_calls(self, func, args_list):
+        """
+        Run a blocking function once per args, e.g. run_calls(sw6_entity.delete_visibility, [(id1,), (id2,)]).
+
+        :return: List of the results in the order of args_list, exceptions for the failed calls.
+        """
+        return self.run(*[self.call(func, *args) for args in args_list])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,162 @@
+"""
+Collects writes of many entities and sends them to SW6 in a few _action/sync calls.
+
+The payloads are collected per entity and action (upsert or delete) and sent chunk_size records per
+call. If a call fails, the chunk is split in halves and each half is sent again, until the bad
+records are isolated, so one broken record does not fail the whole chunk. The result is reported
+per record.
+
+Examples:
+    with SW6BulkWriter(chunk_size=200, indexing_behavior="use-queue-indexing") as sw6_writer:
+        for payload in payloads:
+            sw6_writer.upsert("product", payload)
+        sw6_writer.delete("product-price", price_id)
+    print(sw6_writer.get_report())
+"""
+import logging
+
+import requests
+
+from config import SW6Config, GCBridgeConfig
+from .SW6ConnectionController import SW6ConnectionController
+
+
+class SW6BulkWriter:
+    UPSERT = "upsert"
+    DELETE = "delete"
+
+    def __init__(self, sw6_client=None, chunk_size=None, indexing_behavior=None):
+        """
+        :param sw6_client: The admin client. Defaults to the shared SW6ConnectionController.
+        :param chunk_size: Records per sync call. Defaults to GCBridgeConfig.SW6_SYNC_BATCH_SIZE or 100.
+        :param indexing_behavior: Value of the indexing-behavior header, e.g. "use-queue-indexing" or
+            "disable-indexing". Defaults to SW6Config.SYNC_INDEXING_BEHAVIOR, None lets the shop index directly.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.sw6_client = sw6_client or SW6ConnectionController()
+        self.chunk_size = chunk_size or getattr(GCBridgeConfig, "SW6_SYNC_BATCH_SIZE", 100)
+        if indexing_behavior is None:
+            indexing_behavior = getattr(SW6Config, "SYNC_INDEXING_BEHAVIOR", None)
+        self.indexing_behavior = indexing_behavior
+        # (endpoint_name, action) -> list of (key, payload), in the order they were first used
+        self._buffers = {}
+        # (endpoint_name, key) -> True or the error message
+        self.results = {}
+        self.requests = 0
+
+    """ Collect """
+    def upsert(self, endpoint_name, payload, key=None):
+        """
+        :param endpoint_name: The SW6 entity, e.g. "product".
+        :param payload: The payload of one record.
+        :param key: The key of the record in the results. Defaults to payload['id'].
+        """
+        self.add(endpoint_name, self.UPSERT, payload, key)
+
+    def delete(self, endpoint_name, api_id):
+        self.add(endpoint_name, self.DELETE, {"id": api_id}, api_id)
+
+    def add(self, endpoint_name, action, payload, key=None):
+        buffer = self._buffers.setdefault((endpoint_name, action), [])
+        buffer.append((key if key is not None else payload.get('id'), payload))
+        if len(buffer) >= self.chunk_size:
+            self.flush(endpoint_name=endpoint_name, action=action)
+
+    """ Send """
+    def flush(self, endpoint_name=None, action=None):
+        """
+        Send the collected records. Without arguments all buffers are sent, in the order they were
+        first used, e.g. the media before the product-media relations.
+
+        :return: The number of failed records of this flush.
+        """
+        failed = 0
+        for buffer_key in list(self._buffers):
+            if (endpoint_name and buffer_key[0] != endpoint_name) or (action and buffer_key[1] != action):
+                continue
+            records = self._buffers.pop(buffer_key)
+            for start in range(0, len(records), self.chunk_size):
+                failed += self._send(buffer_key[0], buffer_key[1], records[start:start + self.chunk_size])
+        return failed
+
+    def _send(self, endpoint_name, action, records):
+        """
+        Send one chunk. If the shop rejects it, the chunk is split and both halves are sent again.
+
+        :return: The number of failed records.
+        """
+        error, rejected = self._sync(endpoint_name, action, [payload for _, payload in records])
+        if error is None:
+            for key, _ in records:
+                self.results[(endpoint_name, key)] = True
+            return 0
+
+        if len(records) == 1 or not rejected:
+            # A single bad record, or the shop is not reachable. Splitting would not help.
+            self.logger.error(f"Could not {action} {len(records)} {endpoint_name} in SW6: {error}")
+            for key, _ in records:
+                self.results[(endpoint_name, key)] = error
+            return len(records)
+
+        middle = len(records) // 2
+        return (self._send(endpoint_name, action, records[:middle]) +
+                self._send(endpoint_name, action, records[middle:]))
+
+    def _sync(self, endpoint_name, action, payloads):
+        """
+        :return: Tuple (error, rejected). error is None on success, otherwise the error message.
+            rejected is True, if the shop rejected the records, e.g. by a validation error.
+        """
+        payload = {
+            f"{action}-{endpoint_name}": {
+                "entity": endpoint_name,
+                "action": action,
+                "payload": payloads
+            }
+        }
+        headers = {"indexing-behavior": self.indexing_behavior} if self.indexing_behavior else None
+        self.requests += 1
+        try:
+            response = self.sw6_client.request_post(request_url="/_action/sync", payload=payload,
+                                                    update_header_fields=headers)
+        except requests.exceptions.HTTPError as e:
+            return self.get_error_message(e.response), 400 <= e.response.status_code < 500
+        except Exception as e:
+            return str(e), False
+
+        # Older shops answer with status 200 and success false
+        if isinstance(response, dict) and response.get('success') is False:
+            return str(response.get('data') or response), True
+        return None, False
+
+    @staticmethod
+    def get_error_message(response):
+        try:
+            errors = response.json().get('errors', [])
+            return "; ".join(f"{error.get('detail') or error.get('title')} ({error.get('source', {}).get('pointer', '')})"
+                             for error in errors) or response.text
+        except ValueError:
+            return response.text
+
+    """ Report """
+    def get_failed(self):
+        """
+        :return: dict (endpoint_name, key) -> error message of the failed records.
+        """
+        return {record: result for record, result in self.results.items() if result is not True}
+
+    def get_report(self):
+        failed = self.get_failed()
+        return {
+            'written': len(self.results) - len(failed),
+            'failed': len(failed),
+            'requests': self.requests,
+            'errors': failed,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Records collected before an error are sent anyway, they are complete
+        self.flush()
@@ -0,0 +1,232 @@
+"""
+One Shopware 6 admin client for the whole process. All SW6 entities share it, so the OAuth token
+is fetched once and the HTTP connections are kept alive between requests and syncs.
+
+The token is refreshed shortly before it expires (see SW6Config.TOKEN_REFRESH_MARGIN), so a long
+sync never runs into a 401. If the shop rejects the token anyway, it is fetched again and the
+request is repeated once.
+
+The request methods have the same signature as Shopware6AdminAPIClientBase. Errors are raised as
+requests.exceptions.HTTPError, the response is available as err.response.
+
+Examples:
+    sw6_client = SW6ConnectionController()
+    result = sw6_client.request_post("/search/product", payload=Criteria())
+    print(sw6_client.get_metrics())
+"""
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+from config import SW6Config, ConfShopware6ApiBase
+
+# Shopware ids in request urls, they are replaced by {id} in the latency counters
+SW6_ID_PATTERN = re.compile(r"/[0-9a-fA-F]{32}(?=/|$)")
+
+
+class SW6ConnectionController:
+    def __init__(self):
+        super().__init__()
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SW6ConnectionController, cls).__new__(cls)
+            cls._instance._config = ConfShopware6ApiBase
+            cls._instance._session = None
+            cls._instance._token = None
+            cls._instance._token_expires_at = None
+            cls._instance._refresh_margin = getattr(SW6Config, "TOKEN_REFRESH_MARGIN", 60)
+            cls._instance._timeout = getattr(SW6Config, "REQUEST_TIMEOUT", 60)
+            cls._instance._pool_size = getattr(SW6Config, "HTTP_POOL_SIZE", 10)
+            cls._instance._lock = threading.RLock()
+            cls._instance._metrics = {
+                "sessions": 0,
+                "token_fetches": 0,
+                "token_refreshes": 0,
+                "token_rejections": 0,
+                "token_seconds": 0.0,
+            }
+            # "METHOD /endpoint" -> {'count', 'errors', 'seconds', 'max_seconds'}
+            cls._instance._endpoint_metrics = {}
+        return cls._instance
+
+    """ Session """
+    def get_session(self):
+        """
+        The HTTP session with a keep-alive connection pool. Failed idempotent requests
+        (GET, PUT, DELETE) are retried on 502, 503 and 504.
+        """
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                retry = Retry(
+                    total=3,
+                    backoff_factor=0.3,
+                    status_forcelist=[502, 503, 504],
+                )
+                adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size,
+                                      max_retries=retry)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+                self._session = session
+                self._metrics["sessions"] += 1
+            return self._session
+
+    def close(self):
+        """
+        Close the connections and drop the token.
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._token = None
+            self._token_expires_at = None
+        return True
+
+    def get_api_url(self):
+        # The name of the url attribute changed between the versions of lib_shopware6_api_base
+        api_url = getattr(self._config, "shopware_admin_api_url", None) or getattr(self._config, "shopware_api_url")
+        return api_url.rstrip("/")
+
+    """ Token """
+    def get_token(self):
+        """
+        The cached access token. It is fetched or refreshed, if it expires within the refresh margin.
+        """
+        with self._lock:
+            if self._token is None or time.time() >= self._token_expires_at - self._refresh_margin:
+                self._fetch_token()
+            return self._token['access_token']
+
+    def invalidate_token(self):
+        with self._lock:
+            self._token = None
+            self._token_expires_at = None
+
+    def _fetch_token(self):
+        grant_type = getattr(self._config, "grant_type", "user_credentials")
+        # The grant type is a string or an enum, depending on the version of lib_shopware6_api_base
+        grant_type = str(getattr(grant_type, "value", grant_type))
+
+        refresh_token = self._token.get('refresh_token') if self._token else None
+        if refresh_token:
+            data = {"grant_type": "refresh_token", "client_id": "administration", "refresh_token": refresh_token}
+        elif grant_type == "resource_owner":
+            data = {"grant_type": "client_credentials",
+                    "client_id": self._config.client_id,
+                    "client_secret": self._config.client_secret}
+        else:
+            data = {"grant_type": "password",
+                    "client_id": "administration",
+                    "scopes": "write",
+                    "username": self._config.username,
+                    "password": self._config.password}
+
+        start = time.perf_counter()
+        response = self.get_session().post(f"{self.get_api_url()}/oauth/token", json=data, timeout=self._timeout)
+        self._metrics["token_seconds"] += time.perf_counter() - start
+        if refresh_token and response.status_code in (400, 401):
+            # The refresh token is expired, too. Log in again.
+            self._token = None
+            return self._fetch_token()
+        response.raise_for_status()
+
+        self._token = response.json()
+        self._token_expires_at = time.time() + int(self._token.get('expires_in', 600))
+        self._metrics["token_refreshes" if refresh_token else "token_fetches"] += 1
+        return self._token
+
+    """ Requests """
+    def request_get(self, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        return self.request("get", request_url, payload, update_header_fields, additional_query_params)
+
+    def request_post(self, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        return self.request("post", request_url, payload, update_header_fields, additional_query_params)
+
+    def request_patch(self, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        return self.request("patch", request_url, payload, update_header_fields, additional_query_params)
+
+    def request_put(self, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        return self.request("put", request_url, payload, update_header_fields, additional_query_params)
+
+    def request_delete(self, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        return self.request("delete", request_url, payload, update_header_fields, additional_query_params)
+
+    def request(self, method, request_url, payload=None, update_header_fields=None, additional_query_params=None):
+        """
+        Send a request to the admin api.
+
+        :param method: "get", "post", "patch", "put" or "delete"
+        :param request_url: The endpoint, e.g. "/search/product"
+        :param payload: dict, list or Criteria
+        :param update_header_fields: Additional headers, e.g. {"indexing-behavior": "use-queue-indexing"}
+        :param additional_query_params: Query parameters, e.g. {"_response": "detail"}
+        :return: The decoded json response, an empty dict if the response has no content.
+        :raises requests.exceptions.HTTPError: If the shop answers with an error status.
+        """
+        if hasattr(payload, "get_dict"):
+            payload = payload.get_dict()
+        elif payload is None and method in ("post", "patch", "put"):
+            payload = {}
+        url = f"{self.get_api_url()}/{request_url.lstrip('/')}"
+        headers = dict(update_header_fields or {})
+
+        start = time.perf_counter()
+        response = None
+        try:
+            for attempt in range(2):
+                headers["Authorization"] = f"Bearer {self.get_token()}"
+                response = self.get_session().request(method.upper(), url, json=payload, headers=headers,
+                                                      params=additional_query_params, timeout=self._timeout)
+                if response.status_code != 401 or attempt:
+                    break
+                # The shop does not accept the token anymore, e.g. after a restart. Log in again.
+                self._metrics["token_rejections"] += 1
+                self.invalidate_token()
+            response.raise_for_status()
+        finally:
+            self._count_request(method, request_url, time.perf_counter() - start,
+                                failed=response is None or response.status_code >= 400)
+
+        if not response.content:
+            return {}
+        return response.json()
+
+    """ Metrics """
+    @staticmethod
+    def get_endpoint_key(method, request_url):
+        return f"{method.upper()} {SW6_ID_PATTERN.sub('/{id}', '/' + request_url.lstrip('/'))}"
+
+    def _count_request(self, method, request_url, seconds, failed=False):
+        key = self.get_endpoint_key(method, request_url)
+        with self._lock:
+            metrics = self._endpoint_metrics.setdefault(key, {'count': 0, 'errors': 0, 'seconds': 0.0,
+                                                              'max_seconds': 0.0})
+            metrics['count'] += 1
+            metrics['errors'] += 1 if failed else 0
+            metrics['seconds'] += seconds
+            metrics['max_seconds'] = max(metrics['max_seconds'], seconds)
+
+    def get_metrics(self):
+        """
+        :return: dict with the token and session counters and per endpoint ("METHOD /endpoint") the number
+                 of requests, errors and the total and max latency in seconds.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["endpoints"] = {key: dict(values, avg_seconds=values['seconds'] / values['count'])
+                                    for key, values in self._endpoint_metrics.items()}
+            metrics["token_expires_in"] = (self._token_expires_at - time.time()) if self._token else None
+        return metrics
+
+    def reset_metrics(self):
+        with self._lock:
+            self._endpoint_metrics = {}
@@ -1,11 +1,44 @@
+import uuid
 from pprint import pprint
 
+from lib_shopware6_api_base import Criteria, EqualsAnyFilter
+
 import config
 from ..controller.SW6AbstractController import SW6AbstractController
+from ..controller.SW6AsyncClient import SW6AsyncClient
 from ..entities.SW6MediaEntity import SW6MediaEntity
 from src.modules.Bridge.controller.BridgeMediaController import BridgeMediaController
 
 
+class SW6MediaValues:
+    """
+    The values of a BridgeMediaEntity, read in the calling thread. The SQLAlchemy instances must not be
+    passed to the threads of SW6AsyncClient, expired instances would refresh themselves on the session
+    of the calling thread. It has the getters of BridgeMediaEntity, which are used by the uploads.
+    """
+
+    def __init__(self, bridge_media_entity):
+        self.sw6_id = bridge_media_entity.get_sw6_id()
+        self.file_name = bridge_media_entity.get_file_name()
+        self.file_type = bridge_media_entity.get_file_type()
+        self.media_url = bridge_media_entity.get_media_url()
+
+    def get_sw6_id(self):
+        return self.sw6_id
+
+    def get_file_name(self):
+        return self.file_name
+
+    def get_file_type(self):
+        return self.file_type
+
+    def get_media_url(self):
+        return self.media_url
+
+    def __repr__(self):
+        return f"<SW6MediaValues(sw6_id={self.sw6_id}, file_name={self.file_name}, file_type={self.file_type})>"
+
+
 class SW6MediaController(SW6AbstractController):
 
     def __init__(self):
@@ -40,41 +73,57 @@ class SW6MediaController(SW6AbstractController):
         try:
             # Begin media upload process if `medias` attribute is populated in bridge_entity
             if bridge_entity.media_assocs:
-                for media_assoc in bridge_entity.media_assocs:
-                    media = media_assoc.media
-                    try:
-                        # If media already exists in SW6, skip it
-                        if self.is_in_sw6(bridge_entity=media):
+                # Plain values, the threads must not touch the SQLAlchemy instances
+                medias = [SW6MediaValues(media_assoc.media) for media_assoc in bridge_entity.media_assocs]
+                # The media are independent, check and upload them concurrently
+                with SW6AsyncClient() as sw6_async:
+                    in_sw6 = sw6_async.run_calls(self.is_in_sw6, [(media,) for media in medias])
+                    missing = []
+                    for media, found in zip(medias, in_sw6):
+                        if isinstance(found, Exception):
+                            self.logger.error(f'Error encountered while checking media item {media}: {str(found)}')
+                        elif found:
                             print("Media already in SW6, continue")
-                            continue
                         else:
-                            sw6_json_data = {
-                                "id": media.get_sw6_id(),  # Fetch SW6 id for the media
-                                "mediaFolderId": config.SW6Config.MEDIA_FOLDERS["product"]
-                            }
-                            result = self.get_entity().bulk_uploads(sw6_json_data=sw6_json_data)
-                            # Successful upload will call upload_media
-                            if result['success']:
-                                self.upload_media(bridge_media_entity=media)
-                            else:
-                                pprint(result)
-                    except Exception as e:
+                            missing.append(media)
+
+                    results = sw6_async.run_calls(self._create_media, [(media,) for media in missing])
+                for media, result in zip(missing, results):
+                    if isinstance(result, Exception):
                         # Log any errors encountered during individual media upload process
                         self.logger.error(
-                            f'Error encountered while handling media upload process for media item {media}: {str(e)}')
-                        continue
+                            f'Error encountered while handling media upload process for media item {media}: {str(result)}')
 
         except Exception as e:
             # Log any errors encountered during the overall media upload process
             self.logger.error(f'Error encountered during media upload process: {str(e)}')
             raise
 
+    def _create_media(self, media):
+        """
+        Create the media in SW6 and upload its file.
+
+        :param media: SW6MediaValues or BridgeMediaEntity, only SW6MediaValues in the threads of SW6AsyncClient.
+        """
+        sw6_json_data = {
+            "id": media.get_sw6_id(),  # Fetch SW6 id for the media
+            "mediaFolderId": config.SW6Config.MEDIA_FOLDERS["product"]
+        }
+        result = self.get_entity().bulk_uploads(sw6_json_data=sw6_json_data)
+        # Successful upload will call upload_media
+        if result and result['success']:
+            self.upload_media(bridge_media_entity=media)
+        else:
+            pprint(result)
+        return result
+
     def upload_media(self, bridge_media_entity):
         """
         This function is used to upload media entity to a specific endpoint
 
         Parameters:
-        bridge_media_entity: An instance of the media entity that will be used for the upload
+        bridge_media_entity: An instance of the media entity that will be used for the upload,
+            SW6MediaValues if it is called in the threads of SW6AsyncClient
 
         Returns:
         No return items for this function
@@ -110,15 +159,18 @@ class SW6MediaController(SW6AbstractController):
     def set_product_media_relation(self, bridge_entity):
         self.remove_product_media_relation(bridge_entity=bridge_entity)
         if bridge_entity.media_assocs:
-            for index, media_assoc in enumerate(bridge_entity.media_assocs):
-                payload = {
-                    "productId": bridge_entity.get_sw6_id(),
-                    "position": index,
-                    "mediaId": media_assoc.media.get_sw6_id()
-                }
-
-                response = self.get_entity().sw6_client.request_post(f"/product-media/", payload=payload,
-                                                                     additional_query_params={"_response": "detail"})
+            with SW6AsyncClient() as sw6_async:
+                results = sw6_async.run(*[
+                    sw6_async.post("product-media", payload={
+                        "productId": bridge_entity.get_sw6_id(),
+                        "position": index,
+                        "mediaId": media_assoc.media.get_sw6_id()
+                    }, detailed_response=True)
+                    for index, media_assoc in enumerate(bridge_entity.media_assocs)
+                ])
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.error(f"Could not relate media to {bridge_entity}: {str(result)}")
 
         else:
             print(f"No media for {bridge_entity}. Could not set relation")
@@ -129,10 +181,82 @@ class SW6MediaController(SW6AbstractController):
                                                                      search_value=bridge_entity.get_sw6_id(),
                                                                      endpoint_name="product-media")
         if product_media_id_list["total"] >= 1:
-            for id in product_media_id_list["data"]:
-                result = self.get_entity().sw6_client.request_delete(f"/product-media/{id}")
-                if 'errors' in result:
+            with SW6AsyncClient() as sw6_async:
+                results = sw6_async.run(*[sw6_async.delete("product-media", id) for id in product_media_id_list["data"]])
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.error(str(result))
+                elif 'errors' in result:
                     self.logger.error(result['errors'])
         return True
 
+    """ Bulk """
+    def upsert_media_many(self, medias, sw6_writer):
+        """
+        Create the media of many products, which are not in SW6 yet, in bulk _action/sync calls and
+        upload their files. The media are checked with one search instead of one request per media.
+
+        :param medias: List of BridgeMediaEntity.
+        :param sw6_writer: SW6BulkWriter, the new media are written and flushed with it.
+        :return: Set of the SW6 ids of the media which could not be created.
+        """
+        # Plain values, the uploads run in the threads of SW6AsyncClient
+        medias = [SW6MediaValues(media) for media in medias]
+        medias = list({media.get_sw6_id(): media for media in medias if media.get_sw6_id()}.values())
+        if not medias:
+            return set()
+
+        criteria = Criteria()
+        criteria.filter.append(EqualsAnyFilter(field="id", value=[media.get_sw6_id() for media in medias]))
+        existing = set(self.get_entity().iter_search(criteria, endpoint_name="media", ids_only=True))
+        missing = [media for media in medias if media.get_sw6_id() not in existing]
+        for media in missing:
+            sw6_writer.upsert("media", {"id": media.get_sw6_id(),
+                                        "mediaFolderId": config.SW6Config.MEDIA_FOLDERS["product"]})
+        sw6_writer.flush(endpoint_name="media")
 
+        created = [media for media in missing if sw6_writer.results.get(("media", media.get_sw6_id())) is True]
+        # The files can only be uploaded one by one, this is only done for the new media
+        with SW6AsyncClient() as sw6_async:
+            results = sw6_async.run_calls(self.upload_media, [(media,) for media in created])
+        for media, result in zip(created, results):
+            if isinstance(result, Exception):
+                self.logger.error(f'Error uploading the file of media {media}: {str(result)}')
+        return {media.get_sw6_id() for media in missing if media not in created}
+
+    def set_product_media_relation_many(self, bridge_entities, sw6_writer):
+        """
+        Relate the media of many products in bulk. The existing relations are read with one search,
+        relations to media the product still has are kept, the others are deleted.
+
+        :param bridge_entities: List of BridgeProductEntity, which are already in SW6.
+        :param sw6_writer: SW6BulkWriter, the relations are written and flushed with it.
+        :return: dict product SW6 id -> dict media SW6 id -> product-media id.
+        """
+        if not bridge_entities:
+            return {}
+        criteria = Criteria()
+        criteria.filter.append(EqualsAnyFilter(field="productId",
+                                               value=[bridge_entity.get_sw6_id() for bridge_entity in bridge_entities]))
+        existing = {}
+        for product_media in self.get_entity().iter_search(criteria, endpoint_name="product-media",
+                                                           includes=["id", "productId", "mediaId"]):
+            existing.setdefault(product_media['productId'], {})[product_media['mediaId']] = product_media['id']
+
+        relations = {}
+        for bridge_entity in bridge_entities:
+            product_id = bridge_entity.get_sw6_id()
+            current = existing.get(product_id, {})
+            relations[product_id] = {}
+            for index, media_assoc in enumerate(bridge_entity.media_assocs):
+                media_id = media_assoc.media.get_sw6_id()
+                product_media_id = current.pop(media_id, None) or uuid.uuid4().hex
+                sw6_writer.upsert("product_media", {"id": product_media_id,
+                                                    "productId": product_id,
+                                                    "mediaId": media_id,
+                                                    "position": index})
+                relations[product_id][media_id] = product_media_id
+            for product_media_id in current.values():
+                sw6_writer.delete("product_media", product_media_id)
+        sw6_writer.flush(endpoint_name="product_media")
+        return relations
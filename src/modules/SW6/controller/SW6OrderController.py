@@ -113,8 +113,9 @@ class SW6OrderController(SW6AbstractController):
 
     def _set_customer_relation(self, bridge_entity, sw6_json_data):
         # 1. Upsert
-        sw6_json_customer_details = SW6CustomerController().get_entity().get_api_(id=sw6_json_data['orderCustomer']['customerId'])
-        SW6CustomerController().sync_one_to_bridge(sw6_json_data=sw6_json_customer_details['data'])
+        sw6_customer_controller = SW6CustomerController()
+        sw6_json_customer_details = sw6_customer_controller.get_entity().get_api_(id=sw6_json_data['orderCustomer']['customerId'])
+        sw6_customer_controller.sync_one_to_bridge(sw6_json_data=sw6_json_customer_details['data'])
 
         # 2. Set Relation
         bridge_customer = BridgeCustomerEntity.query.filter_by(erp_nr=sw6_json_customer_details['data']['customerNumber']).one_or_none()
@@ -1,9 +1,16 @@
 from pprint import pprint
 
+from lib_shopware6_api_base import Criteria, EqualsAnyFilter
+
+from config import GCBridgeConfig
+
 from ..controller.SW6AbstractController import SW6AbstractController
 from ..entities.SW6ProductEntity import SW6ProductEntity
 from ..controller.SW6MediaController import SW6MediaController
+from ..controller.SW6AsyncClient import SW6AsyncClient
+from ..controller.SW6BulkWriter import SW6BulkWriter
 from src.modules.Bridge.controller.BridgeProductController import BridgeProductController
+from src.modules.Bridge.entities.BridgeProductEntity import BridgeProductEntity
 
 
 class SW6ProductController(SW6AbstractController):
@@ -31,11 +38,12 @@ class SW6ProductController(SW6AbstractController):
 
     def downsert(self, bridge_entity, set_relations=True):
         sw6_payload_json = self.get_entity().map_bridge_to_sw6(bridge_entity)
-        SW6MediaController().upsert_product_media(bridge_entity=bridge_entity)
+        sw6_media_controller = SW6MediaController()
+        sw6_media_controller.upsert_product_media(bridge_entity=bridge_entity)
 
         result = self.get_entity().bulk_uploads(sw6_json_data=sw6_payload_json)
         # When both, product and media, are uploaded - relate them
-        SW6MediaController().set_product_media_relation(bridge_entity=bridge_entity)
+        sw6_media_controller.set_product_media_relation(bridge_entity=bridge_entity)
         self.set_cover_media(bridge_entity=bridge_entity)
 
         return result
@@ -54,10 +62,185 @@ class SW6ProductController(SW6AbstractController):
         sw6_entity = SW6ProductController().get_entity()
 
         assocs = bridge_entity.marketplace_prices_assoc
-        for assoc in assocs:
-            sw6_entity.delete_visibility(visibility_id=assoc.get_sw6_visibility_id())
+        with SW6AsyncClient() as sw6_async:
+            results = sw6_async.run_calls(sw6_entity.delete_visibility,
+                                          [(assoc.get_sw6_visibility_id(),) for assoc in assocs])
+        for result in results:
+            if isinstance(result, Exception):
+                self.logger.error(f"Could not delete a visibility of {bridge_entity}: {str(result)}")
 
         SW6ProductController().sync_one_from_bridge(bridge_entity=bridge_entity)
 
+    def sync_stock_from_bridge(self, products, batch_size=100):
+        """
+        Push only the stock of the given products to SW6, batch_size products per _action/sync call.
+
+        :param products: List of dicts with 'sw6_id' and 'stock', e.g. from BridgeProductController.get_changed_stock.
+        :param batch_size: Products per sync call.
+        :return: Tuple (pushed, failed), the number of pushed products and the set of the SW6 ids which failed.
+        """
+        with SW6BulkWriter(chunk_size=batch_size) as sw6_writer:
+            for product in products:
+                if product.get('sw6_id'):
+                    sw6_writer.upsert(self.get_entity().endpoint_name, {
+                        "id": product['sw6_id'], "stock": product['stock'], "maxPurchase": product['stock']})
+        report = sw6_writer.get_report()
+        self.logger.info(f"Stock of {report['written']} products pushed to SW6 in {report['requests']} sync calls, "
+                         f"{report['failed']} failed.")
+        return report['written'], {sw6_id for _, sw6_id in sw6_writer.get_failed()}
+
+    def sync_prices_from_bridge(self, product_ids, batch_size=100):
+        """
+        Push only the prices of the given products to SW6, batch_size products per _action/sync call.
+        Advanced prices which are no longer valid are deleted in bulk as well.
+
+        :param product_ids: Bridge product IDs, e.g. of a special price campaign.
+        :param batch_size: Products per sync call.
+        :return: Tuple (pushed, errors), the number of pushed products and of failed products.
+        """
+        sw6_entity = self.get_entity()
+        sw6_currency_id = sw6_entity.get_api_currency_id_by_short_name('EUR')
+        errors = 0
+        with SW6BulkWriter(chunk_size=batch_size) as sw6_writer:
+            for start in range(0, len(product_ids), batch_size):
+                products = BridgeProductEntity.query.filter(
+                    BridgeProductEntity.id.in_(product_ids[start:start + batch_size])).all()
+                for product in products:
+                    if not product.get_sw6_id():
+                        continue
+                    try:
+                        payload, obsolete_price_ids = sw6_entity.map_bridge_price_to_sw6(product, sw6_currency_id)
+                    except Exception as e:
+                        self.logger.error(f"Error mapping the prices of product {product.id}: {str(e)}")
+                        errors += 1
+                        continue
+                    for price_id in obsolete_price_ids:
+                        sw6_writer.delete("product_price", price_id)
+                    sw6_writer.upsert(sw6_entity.endpoint_name, payload)
+
+        failed = sum(1 for endpoint_name, _ in sw6_writer.get_failed() if endpoint_name == sw6_entity.endpoint_name)
+        pushed = sum(1 for (endpoint_name, _), result in sw6_writer.results.items()
+                     if endpoint_name == sw6_entity.endpoint_name and result is True)
+        self.logger.info(f"Prices of {pushed} products pushed to SW6, {errors + failed} errors.")
+        return pushed, errors + failed
+
+    def downsert_many(self, bridge_entities, sw6_writer=None):
+        """
+        Push many products to SW6 in bulk _action/sync calls instead of requests per product:
+
+        1. The missing media are created with one search and bulk writes, only their files are uploaded one by one.
+        2. The products are written.
+        3. Only for the written products: the advanced prices which are not in the payload anymore are deleted,
+           the media relations are updated and the covers are set. A product of a rejected chunk keeps its prices.
+
+        :param bridge_entities: List of BridgeProductEntity.
+        :param sw6_writer: Optional SW6BulkWriter, e.g. to collect the products of several batches.
+        :return: dict bridge product ID -> True or the error message.
+        """
+        sw6_writer = sw6_writer or SW6BulkWriter()
+        sw6_entity = self.get_entity()
+        sw6_media_controller = SW6MediaController()
+        results = {}
+
+        failed_media = sw6_media_controller.upsert_media_many(
+            [media_assoc.media for bridge_entity in bridge_entities for media_assoc in bridge_entity.media_assocs],
+            sw6_writer=sw6_writer)
+        if failed_media:
+            self.logger.error(f"{len(failed_media)} media could not be created in SW6.")
+
+        # Prices of the payload, the other advanced prices of the product are deleted after it is written
+        price_ids = {}
+        for bridge_entity in bridge_entities:
+            try:
+                sw6_payload_json = sw6_entity.map_bridge_to_sw6(bridge_entity, delete_prices=False)
+                if not sw6_payload_json:
+                    # map_bridge_to_sw6 logs the error and returns an empty payload
+                    raise ValueError("The product could not be mapped.")
+                price_ids[bridge_entity.get_sw6_id()] = {price['id'] for price in sw6_payload_json['prices']}
+                sw6_writer.upsert(sw6_entity.endpoint_name, sw6_payload_json)
+            except Exception as e:
+                self.logger.error(f"Error preparing product {bridge_entity.get_erp_nr()} for SW6: {str(e)}")
+                results[bridge_entity.id] = str(e)
+        sw6_writer.flush(endpoint_name=sw6_entity.endpoint_name)
+
+        written = []
+        for bridge_entity in bridge_entities:
+            if bridge_entity.id in results:
+                continue
+            result = sw6_writer.results.get((sw6_entity.endpoint_name, bridge_entity.get_sw6_id()), True)
+            results[bridge_entity.id] = result
+            if result is True:
+                written.append(bridge_entity)
+        if not written:
+            return results
+
+        # Keys of the writes of each product, to report the product as failed if one of them fails
+        product_writes = {bridge_entity.get_sw6_id(): [] for bridge_entity in written}
+        try:
+            criteria = Criteria()
+            criteria.filter.append(EqualsAnyFilter(field="productId", value=list(product_writes)))
+            for price in sw6_entity.iter_search(criteria, endpoint_name="product-price",
+                                                includes=["id", "productId"]):
+                if price['id'] not in price_ids.get(price['productId'], set()):
+                    sw6_writer.delete("product_price", price['id'])
+                    product_writes[price['productId']].append(("product_price", price['id']))
+            sw6_writer.flush(endpoint_name="product_price")
+
+            # When both, product and media, are written - relate them
+            relations = sw6_media_controller.set_product_media_relation_many(written, sw6_writer=sw6_writer)
+            for bridge_entity in written:
+                product_id = bridge_entity.get_sw6_id()
+                product_writes[product_id] += [("product_media", product_media_id)
+                                               for product_media_id in relations[product_id].values()]
+                bridge_media_cover_entity = bridge_entity.get_cover_image()
+                product_media_id = relations[product_id].get(
+                    bridge_media_cover_entity.get_sw6_id() if bridge_media_cover_entity else None)
+                if product_media_id and sw6_writer.results.get(("product_media", product_media_id)) is True:
+                    sw6_writer.upsert(sw6_entity.endpoint_name, {"id": product_id, "coverId": product_media_id},
+                                      key=f"{product_id}:cover")
+                    product_writes[product_id].append((sw6_entity.endpoint_name, f"{product_id}:cover"))
+            sw6_writer.flush(endpoint_name=sw6_entity.endpoint_name)
+        except Exception as e:
+            self.logger.error(f"Error writing the prices and media of {len(written)} products to SW6: {str(e)}")
+            for bridge_entity in written:
+                results[bridge_entity.id] = str(e)
+            return results
+
+        for bridge_entity in written:
+            errors = [sw6_writer.results.get(write) for write in product_writes[bridge_entity.get_sw6_id()]
+                      if sw6_writer.results.get(write, True) is not True]
+            if errors:
+                self.logger.error(f"Prices or media of product {bridge_entity.get_erp_nr()} failed: {errors[0]}")
+                results[bridge_entity.id] = errors[0]
+        return results
+
+    def sync_all_from_bridge(self, set_relations=True, offset=0, batch_size=None):
+        """
+        Push all active products to SW6 with downsert_many, batch_size products at a time.
+
+        :param set_relations: Unused, the media are always related.
+        :param offset: Number of products to skip.
+        :param batch_size: Products per batch and per sync call. Defaults to GCBridgeConfig.SW6_SYNC_BATCH_SIZE or 100.
+        :return: dict report with 'pushed' and 'errors' (bridge product ID -> error message).
+        """
+        if batch_size is None:
+            batch_size = getattr(GCBridgeConfig, "SW6_SYNC_BATCH_SIZE", 100)
+        product_ids = [product_id for product_id, in self._bridge_controller.get_entity().query.filter_by(
+            is_active=True).order_by(BridgeProductEntity.id).with_entities(BridgeProductEntity.id)][offset:]
+
+        report = {'pushed': 0, 'errors': {}}
+        sw6_writer = SW6BulkWriter(chunk_size=batch_size)
+        for start in range(0, len(product_ids), batch_size):
+            products = BridgeProductEntity.query.filter(
+                BridgeProductEntity.id.in_(product_ids[start:start + batch_size])).all()
+            results = self.downsert_many(products, sw6_writer=sw6_writer)
+            report['pushed'] += sum(1 for result in results.values() if result is True)
+            report['errors'].update({product_id: result for product_id, result in results.items() if result is not True})
+            print(f"{min(start + batch_size, len(product_ids))}/{len(product_ids)} products pushed to SW6.")
+
+        self.logger.info(f"{report['pushed']} products pushed to SW6 in {sw6_writer.requests} sync calls, "
+                         f"{len(report['errors'])} errors.")
+        return report
+
     def sync_sw6_ids(self):
         pass
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
 
 import requests
@@ -8,17 +9,21 @@ from abc import abstractmethod
 import json
 
 from ..SW6CoreController import SW6CoreController
-from lib_shopware6_api_base import Shopware6AdminAPIClientBase, Criteria, EqualsFilter
-
-from config import ConfShopware6ApiBase
+from ..controller.SW6ConnectionController import SW6ConnectionController
+from ..controller.SW6BulkWriter import SW6BulkWriter
+from lib_shopware6_api_base import Criteria, EqualsFilter
 
 
 class SW6AbstractEntity(SW6CoreController):
 
-    def __init__(self, endpoint_name):
+    def __init__(self, endpoint_name, sw6_client=None):
+        """
+        :param endpoint_name: The SW6 entity, e.g. "product".
+        :param sw6_client: The admin client. Defaults to the shared SW6ConnectionController, so all
+            entities use one token and one connection pool.
+        """
         super().__init__()
-        # SW6Config is my config with the same Attributes
-        self.sw6_client = Shopware6AdminAPIClientBase(config=ConfShopware6ApiBase)
+        self.sw6_client = sw6_client or SW6ConnectionController()
         self._endpoint_name = endpoint_name
         self._criteria = Criteria()
         self.config_sw6 = config.SW6Config
@@ -34,8 +39,70 @@ class SW6AbstractEntity(SW6CoreController):
                 raise
 
     def get_api_list(self):
-        result = self.sw6_client.request_get(f"/{self._endpoint_name}")
-        return result
+        """
+        All entities of the endpoint, read page by page with iter_search.
+
+        :return: dict with 'total' and 'data', like a search response.
+        """
+        data = list(self.iter_search())
+        return {"total": len(data), "data": data}
+
+    def iter_search(self, criteria=None, page_size=None, endpoint_name=None, includes=None, ids_only=False,
+                    prefetch=True):
+        """
+        Search the endpoint page by page and yield the entities one by one, so large stores can be
+        scanned with bounded memory. While the entities of a page are yielded, the next page is fetched
+        in the background.
+
+        Don't delete the found entities while iterating, the following pages would shift. Collect the
+        ids first, see delete_all.
+
+        :param criteria: Criteria or dict with filters, associations and sorting. limit and page are set here.
+            Without a sorting the entities are sorted by id, so the pages are stable.
+        :param page_size: Entities per request. Defaults to SW6Config.SEARCH_PAGE_SIZE or 500.
+        :param endpoint_name: The entity to search, defaults to the endpoint of the entity class.
+        :param includes: Optional list of fields to return, e.g. ["id", "productNumber"], or a dict
+            apiAlias -> fields for associations.
+        :param ids_only: Search with search-ids and yield only the ids.
+        :param prefetch: Fetch the next page in the background. Defaults to True.
+        :return: Generator of entity dicts or ids.
+
+        Example:
+            for product in SW6ProductEntity().iter_search(includes=["id", "productNumber", "stock"]):
+                print(product["productNumber"], product["stock"])
+        """
+        endpoint_name = endpoint_name or self._endpoint_name
+        page_size = page_size or getattr(SW6Config, "SEARCH_PAGE_SIZE", 500)
+
+        payload = criteria.get_dict() if hasattr(criteria, "get_dict") else dict(criteria or {})
+        payload["limit"] = page_size
+        # The total is not needed, the last page is the first one with less than page_size entities
+        payload["total-count-mode"] = 0
+        if not payload.get("sort") and not payload.get("term") and not payload.get("query"):
+            payload["sort"] = [{"field": "id", "order": "ASC"}]
+        if includes:
+            payload["includes"] = includes if isinstance(includes, dict) else {endpoint_name.replace("-", "_"): includes}
+        request_url = f"/search-ids/{endpoint_name}" if ids_only else f"/search/{endpoint_name}"
+
+        def fetch_page(page):
+            return self.sw6_client.request_post(request_url, payload=dict(payload, page=page)).get("data", [])
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sw6-search") if prefetch else None
+        try:
+            page = 1
+            data = fetch_page(page)
+            while data:
+                is_last_page = len(data) < page_size
+                next_page = executor.submit(fetch_page, page + 1) if executor and not is_last_page else None
+                for entity in data:
+                    yield entity
+                if is_last_page:
+                    break
+                page += 1
+                data = next_page.result() if next_page else fetch_page(page)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
 
     def search_api_by_(self, index_field=None, search_value=None, endpoint_name=None):
         payload = Criteria()
@@ -138,7 +205,7 @@ class SW6AbstractEntity(SW6CoreController):
         )
         return response
 
-    def bulk_uploads(self, sw6_json_data, endpoint_name=None):
+    def bulk_uploads(self, sw6_json_data, endpoint_name=None, action="upsert"):
         """
         Performs bulk uploads to the SWC server.
 
@@ -149,7 +216,10 @@ class SW6AbstractEntity(SW6CoreController):
             logged along with its respective `syncId`.
 
         Args:
-            sw6_json_data: JSON formatted dictionary data containing application's state
+            sw6_json_data: JSON formatted dictionary data containing application's state,
+                           or a list of them to upsert many entities in one request
+            endpoint_name: The entity, defaults to the endpoint of the entity class
+            action: "upsert" or "delete", for delete the payloads only contain the ids
 
         Returns:
             The server's response after processing each respective entity operation
@@ -164,12 +234,13 @@ class SW6AbstractEntity(SW6CoreController):
         payload = {
             "write-a-bulk": {
                 "entity": endpoint_name,
-                "action": "upsert",
-                "payload": [sw6_json_data]
+                "action": action,
+                "payload": sw6_json_data if isinstance(sw6_json_data, list) else [sw6_json_data]
             }
         }
 
         # Try block intended to catch any exception that might arise while executing POST request.
+        response = None
         try:
             response = self.sw6_client.request_post(
                 request_url=f"/_action/sync", payload=payload
@@ -198,9 +269,17 @@ class SW6AbstractEntity(SW6CoreController):
         return data["id"]
 
     def delete_all(self):
-        list = self.get_api_list()
-        for id in list["data"]:
-            self.sw6_client.request_delete(f"/{self._endpoint_name}/{id['id']}")
+        """
+        Delete all entities of the endpoint in bulk sync calls.
+
+        :return: dict report of SW6BulkWriter.
+        """
+        # Collect the ids first, deleting while paging would skip entities
+        ids = list(self.iter_search(ids_only=True))
+        with SW6BulkWriter(sw6_client=self.sw6_client) as sw6_writer:
+            for api_id in ids:
+                sw6_writer.delete(self._endpoint_name, api_id)
+        return sw6_writer.get_report()
 
     def get_endpoints_list(self):
         endpoint = self.sw6_client.request_get(request_url="")
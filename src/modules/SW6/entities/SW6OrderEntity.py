@@ -116,11 +116,13 @@ class SW6OrderEntity(SW6AbstractEntity):
         States:
         open
         in_progress
-        :return: int ids json
+        :return: dict with 'total' and 'data', the ids of all orders in the state, read page by page
         """
-        results = self.search_api_ids_by_(index_field="stateMachineState.technicalName", search_value=state)
+        payload = Criteria()
+        payload.filter.append(EqualsFilter(field="stateMachineState.technicalName", value=state))
+        order_ids = list(self.iter_search(criteria=payload, ids_only=True))
 
-        return results
+        return {"total": len(order_ids), "data": order_ids}
 
     # States
 
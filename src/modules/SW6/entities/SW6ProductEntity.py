@@ -23,13 +23,15 @@ class SW6ProductEntity(SW6AbstractEntity):
         """ No need to map the Product sw6 to hte bridge"""
         pass
 
-    def map_bridge_to_sw6(self, bridge_entity):
+    def map_bridge_to_sw6(self, bridge_entity, delete_prices=True):
         """
         Maps a bridge entity to SW6 with the relevant attributes such as price, name, description and more.
         This includes deleting the prices, getting currency ID, tax ID and preparing the payload accordingly.
 
         Parameters:
         bridge_entity (class): A Bridge Entity that would be used to form the payload.
+        delete_prices (bool): Delete the advanced prices of the product in SW6. The bulk push
+            (SW6ProductController.downsert_many) deletes the obsolete prices after the product is written instead.
 
         Returns:
         payload (dict): Returns a dictionary which contains the payload structured according to SW6 requirements
@@ -76,7 +78,8 @@ class SW6ProductEntity(SW6AbstractEntity):
 
             try:
                 # Remove previous prices
-                self.delete_all_prices(product_id=bridge_entity.get_sw6_id())
+                if delete_prices:
+                    self.delete_all_prices(product_id=bridge_entity.get_sw6_id())
             except Exception as e:
                 self.logger.error("An error occurred while deleting all prices: %s", str(e))
                 raise
@@ -86,6 +89,35 @@ class SW6ProductEntity(SW6AbstractEntity):
 
         return payload
 
+    def map_bridge_price_to_sw6(self, bridge_entity, sw6_currency_id):
+        """
+        Maps only the prices of a bridge entity, e.g. for the batched price push.
+        Unlike map_bridge_to_sw6 it doesn't delete the prices in SW6, it returns the IDs of the
+        advanced prices which are no longer valid instead, e.g. the rebate price while a special price is active.
+
+        Parameters:
+        bridge_entity (class): The bridge product.
+        sw6_currency_id (str): The ID of the currency, see get_api_currency_id_by_short_name.
+
+        Returns:
+        tuple: (payload (dict) with id, price and prices, obsolete_price_ids (list))
+        """
+        sw6_tax_id = self.get_tax_id_by_value(bridge_entity.tax.get_key())
+        prices = self._payload_add_prices(bridge_entity, sw6_tax_id, sw6_currency_id)
+        payload = {
+            "id": bridge_entity.get_sw6_id(),
+            "price": self._payload_add_price(bridge_entity, sw6_tax_id, sw6_currency_id),
+            "prices": prices
+        }
+
+        price_ids = {price['id'] for price in prices}
+        obsolete_price_ids = []
+        for association in bridge_entity.marketplace_prices_assoc:
+            for sw6_price_id in [association.sw6_price_id, association.sw6_rebate_price_id]:
+                if sw6_price_id and sw6_price_id not in price_ids and sw6_price_id not in obsolete_price_ids:
+                    obsolete_price_ids.append(sw6_price_id)
+        return payload, obsolete_price_ids
+
     def _payload_add_price(self, bridge_entity, sw6_tax_id, sw6_currency_id):
         sales_chanel_de_id = config.SW6Config.SALES_CHANNELS['DE']['id']
         association = BridgeProductMarketplacePriceAssoc.query.filter_by(